@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-11-10
+# copyright            : (C) 2016 by Space Syntax Ltd
+# author               : Ioanna Kolovou
+# email                : i.kolovou@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Headless batch runner for the road network cleaner, network segmenter and catchment analyser
+
+Runs the jobs of a JSON manifest without the QGIS desktop, e.g.:
+
+    python -m esstoolkit.batch_runner jobs.json --summary jobs_summary.json
+
+{"defaults": {"output_type": "shapefile"},
+ "jobs": [{"name": "camden", "tool": "cleaner", "input": "/data/camden.shp", "settings": {"snap": 5},
+           "output": {"cleaned": "/out/camden_cl.shp", "errors": "/out/camden_errors.shp",
+                      "unlinks": "/out/camden_unlinks.shp", "report": "/out/camden_report.json"}},
+          {"name": "camden_seg", "tool": "segmenter", "input": "/out/camden_cl.shp", "unlinks": null,
+           "settings": {"stub_ratio": 0.4}, "output": {"segmented": "/out/camden_seg.shp"}},
+          {"name": "camden_catchment", "tool": "catchment", "input": "/out/camden_seg.shp",
+           "origins": "/data/stations.shp", "settings": {"distances": [400, 800]},
+           "output": {"network": "/out/catchment.shp", "polygon": "/out/catchment_polygons.shp"}}]}
+
+Output paths are shapefiles, or [connstring, schema, table] with "output_type": "postgis".
+Every job runs in its own process, so that its peak memory is measured on its own and a crash only fails that job.
+With "validate": true in its settings, the cleaner only scans the input and writes the errors output.
+The cleaner also saves its per stage profiling report, to the "report" output if given.
+The summary lists the status, error, run time, peak memory and output feature counts of every job.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
+
+from qgis.core import QgsApplication, QgsProject, QgsVectorLayer
+
+from .utilities.utility_functions import peakMemoryMB
+
+cleaner_defaults = {'break': True, 'merge': 'intersections', 'snap': 10, 'orphans': True, 'errors': True,
+                    'unlinks': True, 'collinear_angle': 0, 'simplification_threshold': 10, 'fix_unlinks': None,
+                    'compact': False, 'incremental': False, 'checkpoints': False,
+                    'precision': None, 'validate': False}
+
+segmenter_defaults = {'stub_ratio': 0.4, 'buffer': 0, 'errors': True}
+
+catchment_defaults = {'cost': 'length', 'name': None, 'distances': [400, 800, 1200], 'network tolerance': 1,
+                      'polygon tolerance': 20, 'parallel': False}
+
+qgs = None
+
+
+def start_qgis(prefix_path=None):
+    global qgs
+    # job processes are started with their own application
+    if QgsApplication.instance() is None:
+        QgsApplication.setPrefixPath(prefix_path or os.environ.get('QGIS_PREFIX_PATH', '/usr'), True)
+        qgs = QgsApplication([], False)
+        qgs.initQgis()
+    return
+
+
+def load_layer(path, name):
+    layer = QgsVectorLayer(path, name, 'ogr')
+    if not layer.isValid():
+        raise ValueError('Layer %s could not be loaded' % path)
+    # the tools find their input layers by name
+    QgsProject.instance().addMapLayer(layer, False)
+    return layer
+
+
+def output_path(job, key):
+    path = job['output'].get(key)
+    if isinstance(path, list):
+        return tuple(path)
+    return path
+
+
+# written only if the job has an output for the key, returns the number of features written
+def write_output(job, key, to_layer, *args, **kwargs):
+    path = output_path(job, key)
+    if path is None:
+        return None
+    layer = to_layer(*args, layer_type=job['output_type'], path=path, **kwargs)
+    return layer.featureCount() if layer else None
+
+
+def run_cleaner(job):
+    from .rcl_cleaner.road_network_cleaner_dialog import RoadNetworkCleanerDialog
+    from .rcl_cleaner.road_network_cleaner_tool import NetworkCleanerTool
+    from .rcl_cleaner.sGraph import utilityFunctions as utf
+    from .rcl_cleaner import stage_checkpoints
+
+    layer = load_layer(job['input'], job['name'])
+    settings = dict(cleaner_defaults, **job.get('settings', {}))
+    settings['input'] = layer.name()
+    settings['progress_ranges'] = RoadNetworkCleanerDialog.get_progress_ranges(
+        settings['break'], settings['merge'], settings['snap'], settings['unlinks'], settings['fix_unlinks'])
+
+    results, errors = [], []
+    worker = NetworkCleanerTool.Worker(settings, None)
+    worker.finished.connect(results.append)
+    worker.error.connect(lambda e, exception_string: errors.append(exception_string))
+    worker.run()
+    if len(errors) > 0:
+        raise RuntimeError(errors[0])
+    cleaned_features, errors_features, unlinks_features = results[0]
+
+    crs, encoding = layer.crs(), layer.dataProvider().encoding()
+    worker.report.start_stage()
+    counts = {}
+    if (settings['errors'] or settings['validate']) and len(errors_features) > 0:
+        counts['errors'] = write_output(job, 'errors', utf.to_layer, errors_features, crs, encoding, 'Point')
+    if settings['validate']:
+        # a scan only writes the errors, and their counts by type
+        counts['error_types'] = dict(Counter(f.attributes()[0] for f in errors_features))
+        worker.report.end_stage('write', counts.get('errors'))
+    else:
+        if settings['unlinks'] and len(unlinks_features) > 0:
+            counts['unlinks'] = write_output(job, 'unlinks', utf.to_layer, unlinks_features, crs, encoding, 'Point')
+        counts['cleaned'] = write_output(job, 'cleaned', utf.to_layer, cleaned_features, crs, encoding,
+                                         'Linestring')
+        worker.report.end_stage('write', counts['cleaned'])
+    worker.report.save(job['output'].get('report'))
+    if worker.checkpoint_path is not None:
+        stage_checkpoints.remove_checkpoint(worker.checkpoint_path)
+    return counts
+
+
+def run_segmenter(job):
+    from .network_segmenter.segment_tools import segmentor
+    from .network_segmenter import utilityFunctions as uf
+
+    layer = load_layer(job['input'], job['name'])
+    unlinks = load_layer(job['unlinks'], job['name'] + '_unlinks') if job.get('unlinks') else None
+    settings = dict(segmenter_defaults, **job.get('settings', {}))
+
+    segmented_features, errors_features = segmentor(layer, unlinks, settings['stub_ratio'], settings['buffer'],
+                                                    settings['errors']).segment()
+    if len(segmented_features) == 0:
+        raise RuntimeError('No segments created')
+
+    crs, encoding = layer.crs(), layer.dataProvider().encoding()
+    counts = {'segmented': write_output(job, 'segmented', uf.to_layer, segmented_features, crs, encoding,
+                                        'Linestring')}
+    if settings['errors'] and len(errors_features) > 0:
+        counts['errors'] = write_output(job, 'errors', uf.to_layer, errors_features, crs, encoding, 'Point')
+    return counts
+
+
+def run_catchment(job):
+    from .catchment_analyser.catchment_analysis import CatchmentAnalysis
+    from .catchment_analyser import utility_functions as uf
+
+    network = load_layer(job['input'], job['name'])
+    origins = load_layer(job['origins'], job['name'] + '_origins')
+    settings = dict(catchment_defaults, **job.get('settings', {}))
+    settings['network'] = network
+    settings['origins'] = origins
+    settings['crs'] = network.crs()
+    settings['epsg'] = network.crs().authid()[5:]  # removing EPSG:
+    settings['output polygon check'] = job['output'].get('polygon') is not None
+
+    results, errors = [], []
+    analysis = CatchmentAnalysis(None, settings)
+    analysis.finished.connect(results.append)
+    analysis.error.connect(lambda e, exception_string: errors.append(exception_string))
+    analysis.analysis()
+    if len(errors) > 0:
+        raise RuntimeError(errors[0])
+    output = results[0]
+
+    crs, encoding = network.crs(), network.dataProvider().encoding()
+    network_features = output['output network features']
+    counts = {'network': 0}
+    if len(network_features) > 0:
+        counts['network'] = write_output(job, 'network', uf.to_layer, network_features[0].fields(), crs, encoding,
+                                         'Linestring', features=network_features)
+    polygon_features = output['output polygon features']
+    if polygon_features:
+        counts['polygon'] = write_output(job, 'polygon', uf.to_layer, polygon_features[0].fields(), crs, encoding,
+                                         'Polygon', features=polygon_features)
+    return counts
+
+
+tools = {'cleaner': run_cleaner, 'segmenter': run_segmenter, 'catchment': run_catchment}
+
+
+def run_job(job):
+    start_qgis()
+    summary = {'name': job['name'], 'tool': job['tool'], 'status': 'done', 'error': None}
+    start = time.time()
+    try:
+        summary['outputs'] = tools[job['tool']](job)
+    except Exception:
+        summary['status'] = 'failed'
+        summary['error'] = traceback.format_exc()
+    summary['seconds'] = round(time.time() - start, 3)
+    summary['peak_memory_mb'] = peakMemoryMB()
+    QgsProject.instance().removeAllMapLayers()
+    return summary
+
+
+def run_isolated(job):
+    from .utilities import process_helpers
+    with process_helpers.process_pool(1) as pool:
+        try:
+            return pool.submit(run_job, job).result()
+        except BrokenProcessPool:
+            return {'name': job['name'], 'tool': job['tool'], 'status': 'failed', 'error': 'the job process crashed',
+                    'seconds': None, 'peak_memory_mb': None}
+
+
+def read_manifest(path):
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    defaults = manifest.get('defaults', {})
+    jobs = []
+    for idx, job in enumerate(manifest['jobs']):
+        job = dict(defaults, **job)
+        job.setdefault('name', 'job_%s' % idx)
+        job.setdefault('output_type', 'shapefile')
+        if job['tool'] not in tools:
+            raise ValueError('Unknown tool %s in job %s' % (job['tool'], job['name']))
+        if job['output_type'] not in ('shapefile', 'postgis'):
+            raise ValueError('Output type of job %s should be shapefile or postgis' % job['name'])
+        jobs.append(job)
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run Space Syntax Toolkit jobs without the QGIS desktop')
+    parser.add_argument('manifest', help='JSON manifest of the jobs')
+    parser.add_argument('--summary', help='JSON file of the job summaries (default: <manifest>_summary.json)')
+    parser.add_argument('--prefix', help='QGIS prefix path (default: $QGIS_PREFIX_PATH or /usr)')
+    parser.add_argument('--in-process', action='store_true', help='run all jobs in this process')
+    args = parser.parse_args(argv)
+
+    jobs = read_manifest(args.manifest)
+    start_qgis(args.prefix)
+    summary_path = args.summary or os.path.splitext(args.manifest)[0] + '_summary.json'
+    summaries = []
+    for job in jobs:
+        summary = run_job(job) if args.in_process else run_isolated(job)
+        summaries.append(summary)
+        print('%s %s %s %ss %s MB' % (summary['name'], summary['tool'], summary['status'], summary['seconds'],
+                                      summary['peak_memory_mb']))
+        # written after every job, a killed batch keeps the summaries of the finished jobs
+        with open(summary_path, 'w') as summary_file:
+            json.dump(summaries, summary_file, indent=2)
+    if qgs is not None:
+        qgs.exitQgis()
+    return 0 if all(summary['status'] == 'done' for summary in summaries) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
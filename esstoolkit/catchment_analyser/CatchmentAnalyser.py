@@ -193,6 +193,7 @@ class CatchmentTool(QObject):
             settings['temp polygon'] = self.tempPolygon(settings['epsg'])
             settings['output network'] = self.dlg.getNetworkOutput()
             settings['output polygon check'] = self.dlg.polygonCheck.isChecked()
+            settings['parallel'] = self.dlg.getParallel()
             settings['layer_type'] = self.dlg.get_output_type()
             settings['output path'] = self.dlg.getOutput()
 
@@ -232,18 +233,15 @@ class CatchmentTool(QObject):
                   'Linestring', self.settings['layer_type'], self.settings['output path'][0])
             output_network = uf.to_layer(new_fields, self.settings['network'].crs(),
                                          self.settings['network'].dataProvider().encoding(), 'Linestring',
-                                         self.settings['layer_type'], self.settings['output path'][0])
-
-            output_network.dataProvider().addFeatures(output_network_features)
+                                         self.settings['layer_type'], self.settings['output path'][0],
+                                         output_network_features)
             output_polygon_features = output['output polygon features']
             if output_polygon_features and len(output_polygon_features) > 0:
                 new_fields = output_polygon_features[0].fields()
                 output_polygon = uf.to_layer(new_fields, self.settings['network'].crs(),
                                              self.settings['network'].dataProvider().encoding(),
                                              'Polygon', self.settings['layer_type'],
-                                             self.settings['output path'][1])
-
-                output_polygon.dataProvider().addFeatures(output_polygon_features)
+                                             self.settings['output path'][1], output_polygon_features)
             else:
                 output_polygon = None
             distances = output['distances']
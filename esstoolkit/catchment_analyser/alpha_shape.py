@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-05-19
+# copyright            : (C) 2016 by Space Syntax Limited
+# author               : Laurens Versluis
+# email                : l.versluis@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Concave hulls of catchment points as alpha shapes of their Delaunay triangulation
+
+The hull is the outline of the triangles with no edge longer than a maximum length, a ratio of the median edge
+length. The length grows until the triangles form one piece that has every point on it, so that, as with the
+k-nearest neighbours hull it replaces, all points are within the hull. Holes are not kept.
+
+The hulls of nested distance bands share the triangles of the largest band: the hull of a band is the outline of
+the part of them within its distance, the cost of the points being interpolated in every triangle.
+"""
+
+import numpy as np
+
+
+def first_points(xs, ys):
+    """
+    Returns the indices of the first point at every location, in order
+    """
+    points = np.column_stack((np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)))
+    return np.sort(np.unique(points, axis=0, return_index=True)[1])
+
+
+def triangle_vertices(xs, ys, triangle_xs, triangle_ys):
+    """
+    Returns the indices of the unique points (xs, ys) at the corners of triangles given by coordinates, as an array
+    of 3 columns
+    """
+    points = np.asarray(xs) + 1j * np.asarray(ys)
+    # complex numbers sort by x, then y
+    order = np.argsort(points)
+    corners = np.asarray(triangle_xs).ravel() + 1j * np.asarray(triangle_ys).ravel()
+    return order[np.searchsorted(points[order], corners)].reshape(-1, 3)
+
+
+def counterclockwise(xs, ys, triangles):
+    triangles = np.array(triangles, dtype=np.int64).reshape(-1, 3)
+    cross = (xs[triangles[:, 1]] - xs[triangles[:, 0]]) * (ys[triangles[:, 2]] - ys[triangles[:, 0]]) - (
+            ys[triangles[:, 1]] - ys[triangles[:, 0]]) * (xs[triangles[:, 2]] - xs[triangles[:, 0]])
+    triangles[cross < 0] = triangles[cross < 0][:, ::-1]
+    # flat triangles have no area in the hull
+    return triangles[cross != 0]
+
+
+def triangle_components(triangle_count, pairs):
+    """
+    Returns the component label of every triangle, with pairs of triangles that share an edge
+    """
+    labels = np.arange(triangle_count)
+    while len(pairs) > 0:
+        lowest = np.minimum(labels[pairs[:, 0]], labels[pairs[:, 1]])
+        highest = np.maximum(labels[pairs[:, 0]], labels[pairs[:, 1]])
+        # the labels are roots, the higher root of a pair is hooked to the lower one
+        np.minimum.at(labels, highest, lowest)
+        # pointer jumping back to roots
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        pairs = pairs[labels[pairs[:, 0]] != labels[pairs[:, 1]]]
+    return labels
+
+
+def exterior_ring(xs, ys, starts, ends):
+    """
+    Returns the counterclockwise ring of largest area of the directed boundary edges (starts, ends) of triangles,
+    as a closed list of vertices. Where the boundary touches itself the ring goes on around the same area.
+    """
+    outgoing = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        outgoing.setdefault(start, []).append(end)
+    used = set()
+    best_ring, best_area = [], 0.0
+    for first_start, first_end in zip(starts.tolist(), ends.tolist()):
+        if (first_start, first_end) in used:
+            continue
+        ring = [first_start]
+        previous, current = first_start, first_end
+        used.add((first_start, first_end))
+        while current != first_start:
+            ring.append(current)
+            candidates = [end for end in outgoing[current] if (current, end) not in used]
+            if len(candidates) == 0:
+                break
+            if len(candidates) > 1:
+                # the first edge clockwise from the way back bounds the same area
+                back = np.arctan2(ys[previous] - ys[current], xs[previous] - xs[current])
+                candidates.sort(key=lambda end: (back - np.arctan2(ys[end] - ys[current], xs[end] - xs[current])) % (
+                        2 * np.pi))
+            previous, current = current, candidates[0]
+            used.add((previous, current))
+        ring_xs, ring_ys = xs[ring], ys[ring]
+        area = 0.5 * np.sum(ring_xs * np.roll(ring_ys, -1) - np.roll(ring_xs, -1) * ring_ys)
+        if area > best_area:
+            best_ring, best_area = ring, area
+    return best_ring + best_ring[:1]
+
+
+def boundary_edges(starts, ends):
+    """
+    Returns the directed edges (starts, ends) that are not matched by an edge the other way
+    """
+    keep = starts != ends
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return starts, ends
+    vertex_count = max(starts.max(), ends.max()) + 1
+    keys, counts = np.unique(starts * vertex_count + ends, return_counts=True)
+    positions = np.minimum(np.searchsorted(keys, (keys % vertex_count) * vertex_count + keys // vertex_count),
+                           len(keys) - 1)
+    reverse_counts = np.where(keys[positions] == (keys % vertex_count) * vertex_count + keys // vertex_count,
+                              counts[positions], 0)
+    keys = np.repeat(keys, np.maximum(counts - reverse_counts, 0))
+    return keys // vertex_count, keys % vertex_count
+
+
+def alpha_triangles(xs, ys, triangles, length_ratio, growth=1.5):
+    """
+    Returns the counterclockwise triangles (of points xs, ys) with no edge longer than length_ratio times the
+    median edge length, growing it until they form one piece with every point of the triangles, and whether they do
+    """
+    triangles = counterclockwise(xs, ys, triangles)
+    if len(triangles) == 0:
+        return triangles, False
+    vertex_count = len(xs)
+    # directed edges of the triangles, edge e is in triangle e // 3
+    starts = triangles.ravel()
+    ends = np.roll(triangles, -1, axis=1).ravel()
+    edge_lengths = np.hypot(xs[ends] - xs[starts], ys[ends] - ys[starts])
+    lengths = edge_lengths.reshape(-1, 3).max(axis=1)
+    # the triangle on the other side of every edge, -1 on the outline of the triangulation
+    keys = starts * vertex_count + ends
+    order = np.argsort(keys)
+    positions = np.minimum(np.searchsorted(keys[order], ends * vertex_count + starts), len(keys) - 1)
+    neighbours = np.where(keys[order][positions] == ends * vertex_count + starts, order[positions] // 3, -1)
+    edge_triangles = np.arange(len(starts)) // 3
+    used_vertices = len(np.unique(triangles))
+    max_length = max(length_ratio * np.median(edge_lengths), 1e-12)
+    while True:
+        kept = lengths <= max_length
+        if np.count_nonzero(np.bincount(triangles[kept].ravel(), minlength=vertex_count)) == used_vertices:
+            shared = kept[edge_triangles] & (neighbours >= 0) & kept[np.maximum(neighbours, 0)]
+            labels = triangle_components(len(triangles), np.column_stack((edge_triangles[shared],
+                                                                          neighbours[shared])))
+            if np.all(labels[kept] == labels[kept][0]):
+                return triangles[kept], True
+        if np.all(kept):
+            # the triangles are not in one piece
+            return triangles, False
+        max_length = max(max_length * growth, lengths[~kept].min())
+
+
+def band_ring(xs, ys, costs, triangles, distance):
+    """
+    Returns the coordinates (xs, ys) of the closed exterior ring of the part of the counterclockwise triangles with a
+    cost up to distance, the costs of the points being interpolated linearly in every triangle. Empty if no
+    triangle is within distance.
+    """
+    corner_costs = costs[triangles]
+    inside = corner_costs <= distance
+    triangles = triangles[np.any(inside, axis=1)]
+    inside = inside[np.any(inside, axis=1)]
+    if len(triangles) == 0:
+        return np.zeros(0), np.zeros(0)
+    # directed edges of the triangles, and whether their ends are within distance
+    starts = triangles.ravel()
+    ends = np.roll(triangles, -1, axis=1).ravel()
+    start_in = inside.ravel()
+    end_in = np.roll(inside, -1, axis=1).ravel()
+    # the point at distance on the edges that leave or enter it, one vertex for the edge in both triangles
+    leaving = start_in & ~end_in
+    entering = ~start_in & end_in
+    cut_ins = np.where(leaving, starts, ends)[leaving | entering]
+    cut_outs = np.where(leaving, ends, starts)[leaving | entering]
+    cut_keys, cut_ids = np.unique(cut_ins * len(xs) + cut_outs, return_inverse=True)
+    cut_ins, cut_outs = cut_keys // len(xs), cut_keys % len(xs)
+    ratios = (distance - costs[cut_ins]) / (costs[cut_outs] - costs[cut_ins])
+    ring_xs = np.concatenate((xs, xs[cut_ins] + ratios * (xs[cut_outs] - xs[cut_ins])))
+    ring_ys = np.concatenate((ys, ys[cut_ins] + ratios * (ys[cut_outs] - ys[cut_ins])))
+    # a cut at a vertex of cost distance is the vertex itself
+    cut_vertices = np.where(ratios == 0, cut_ins, len(xs) + np.arange(len(cut_keys)))
+    cuts = np.full(len(starts), -1)
+    cuts[leaving | entering] = cut_vertices[cut_ids]
+    # pieces of the triangles, counterclockwise: the edges within distance, the parts of the edges that leave or
+    # enter it and the cut from the edge that leaves it to the edge that enters it (one of each in a triangle)
+    leaving_cuts = cuts.reshape(-1, 3)[leaving.reshape(-1, 3)]
+    entering_cuts = cuts.reshape(-1, 3)[entering.reshape(-1, 3)]
+    edge_starts = np.concatenate((starts[start_in & end_in], starts[leaving], cuts[entering], leaving_cuts))
+    edge_ends = np.concatenate((ends[start_in & end_in], cuts[leaving], ends[entering], entering_cuts))
+    starts, ends = boundary_edges(edge_starts, edge_ends)
+    if len(starts) == 0:
+        return np.zeros(0), np.zeros(0)
+    ring = exterior_ring(ring_xs, ring_ys, starts, ends)
+    return ring_xs[ring], ring_ys[ring]
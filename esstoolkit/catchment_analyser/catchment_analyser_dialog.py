@@ -207,6 +207,9 @@ class CatchmentAnalyserDialog(QDialog, FORM_CLASS):
     def getPolygonTolerance(self):
         return self.polygonTolSpin.value()
 
+    def getParallel(self):
+        return self.parallelCheck.isChecked()
+
     def setNetworkOutput(self):
         file_name, _ = QFileDialog.getSaveFileName(self, "Save output file ", "catchment_network", '*.shp')
         if file_name:
@@ -244,6 +247,7 @@ class CatchmentAnalyserDialog(QDialog, FORM_CLASS):
         self.networkSaveButton.setDisabled(onoff)
 
         self.polygonCheck.setDisabled(onoff)
+        self.parallelCheck.setDisabled(onoff)
         self.analysisButton.setDisabled(onoff)
 
         return
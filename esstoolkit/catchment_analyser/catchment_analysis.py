@@ -18,12 +18,17 @@
 
 from __future__ import absolute_import
 
+import math
 from builtins import range
 from builtins import str
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
+import numpy as np
 from qgis.PyQt.QtCore import (QObject, pyqtSignal, QVariant)
-from qgis.analysis import (QgsVectorLayerDirector, QgsNetworkDistanceStrategy, QgsGraphBuilder, QgsGraphAnalyzer)
-from qgis.core import (QgsSpatialIndex, QgsGeometry, QgsFeature, QgsFields, QgsField, NULL, QgsWkbTypes)
+from qgis.analysis import (QgsVectorLayerDirector, QgsNetworkDistanceStrategy, QgsGraphBuilder)
+from qgis.core import (QgsFeatureRequest, QgsGeometry, QgsFeature, QgsFields, QgsField, NULL, QgsPointXY)
+
+from ..utilities import process_helpers
 
 try:
     from . import analysis_tools as ct
@@ -33,6 +38,14 @@ try:
     from . import utility_functions as uf
 except ImportError:
     pass
+try:
+    from . import graph_search as gs
+except ImportError:
+    pass
+try:
+    from . import graph_cache
+except ImportError:
+    pass
 
 is_debug = False
 try:
@@ -54,7 +67,7 @@ class CatchmentAnalysis(QObject):
 
     def __init__(self, iface, settings):
         QObject.__init__(self)
-        self.concave_hull = ct.ConcaveHull()
+        self.concave_hull = ct.AlphaShapeHull()
         self.iface = iface
         self.settings = settings
         self.killed = False
@@ -166,168 +179,143 @@ class CatchmentAnalysis(QObject):
         network_fields = network.fields()
         network_cost_index = network_fields.indexFromName(cost_field)
 
-        # Setting up graph build director
-        director = QgsVectorLayerDirector(network, -1, '', '', '', QgsVectorLayerDirector.DirectionBoth)
-
-        # Determining cost calculation
-        if cost_field != 'length':
-            strategy = ct.CustomCost(network_cost_index, 0.01)
-        else:
-            strategy = QgsNetworkDistanceStrategy()
-
-        # Creating graph builder
-        director.addStrategy(strategy)
-        builder = QgsGraphBuilder(crs, otf, tolerance, epsg)
-
         # Reading origins and making list of coordinates
-        graph_origin_points = []
-
-        # Loop through the origin points and add graph vertex indices
-        for index, origin in enumerate(origins):
-            graph_origin_points.append(origins[index]['geom'].asPoint())
-
-        # Get origin graph vertex index
-        tied_origin_vertices = director.makeGraph(builder, graph_origin_points)
-
-        # Build the graph
-        graph = builder.graph()
+        graph_origin_points = [origin['geom'].asPoint() for origin in origins]
+
+        # The graph of the network with the origins tied to it is built once and cached until the layer, the
+        # origins or the settings change
+        cache_path = graph_cache.cache_path(network, cost_field, tolerance, crs,
+                                            [(point.x(), point.y()) for point in graph_origin_points])
+        cached = graph_cache.load_network(cache_path) if cache_path is not None else None
+        if cached is None:
+            # Setting up graph build director
+            director = QgsVectorLayerDirector(network, -1, '', '', '', QgsVectorLayerDirector.DirectionBoth)
+
+            # Determining cost calculation
+            if cost_field != 'length':
+                strategy = ct.CustomCost(network_cost_index, 0.01)
+            else:
+                strategy = QgsNetworkDistanceStrategy()
+
+            # Creating graph builder, the second strategy gives the source feature of every arc
+            director.addStrategy(strategy)
+            director.addStrategy(ct.FeatureIdStrategy())
+            builder = QgsGraphBuilder(crs, otf, tolerance, epsg)
+
+            # Get the tied origin points and their graph vertex index
+            tied_origin_points = director.makeGraph(builder, graph_origin_points)
+
+            # Build the graph
+            qgs_graph = builder.graph()
+            tied_origin_vertices = [qgs_graph.findVertex(point) for point in tied_origin_points]
+            graph = self.network_arrays(qgs_graph)
+            if cache_path is not None:
+                graph_cache.save_network(cache_path, graph, tied_origin_vertices)
+        else:
+            graph, tied_origin_vertices = cached
 
         # Create dictionary of origin names and tied origins
         tied_origins = {}
 
         # Combine origin names and tied point vertices
         for index, tied_origin in enumerate(tied_origin_vertices):
-            tied_origins[index] = {'name': origins[index]['name'], 'vertex': tied_origin}
-
-        self.spIndex = QgsSpatialIndex()
-        self.indices = {}
-        self.attributes_dict = {}
-        self.centroids = {}
-        i = 0
-        for f in network.getFeatures():
-            if f.geometry().type() == QgsWkbTypes.LineGeometry:
-                if not f.geometry().isMultipart():
-                    self.attributes_dict[f.id()] = f.attributes()
-                    polyline = f.geometry().asPolyline()
-                    for idx, p in enumerate(polyline[1:]):
-                        ml = QgsGeometry.fromPolylineXY([polyline[idx], p])
-                        new_f = QgsFeature()
-                        new_f.setGeometry(ml.centroid())
-                        new_f.setAttributes([f.id()])
-                        new_f.setId(i)
-                        self.spIndex.addFeature(new_f)
-                        self.centroids[i] = f.id()
-                        i += 1
-                else:
-                    self.attributes_dict[f.id()] = f.attributes()
-                    for pl in f.geometry().asMultiPolyline():
-                        for idx, p in enumerate(pl[1:]):
-                            ml = QgsGeometry.fromPolylineXY([pl[idx], p])
-                            new_f = QgsFeature()
-                            new_f.setGeometry(ml.centroid())
-                            new_f.setAttributes([f.id()])
-                            new_f.setId(i)
-                            self.spIndex.addFeature(new_f)
-                            self.centroids[i] = f.id()
-                            i += 1
+            tied_origins[index] = {'name': origins[index]['name'], 'vertex': int(tied_origin)}
+
+        # Attributes of the source features of the arcs
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
+        self.attributes_dict = dict((f.id(), f.attributes()) for f in network.getFeatures(request))
 
         self.network_fields = network_fields
         return graph, tied_origins
 
-    def graph_analysis(self, graph, tied_origins, distances):
-        # Settings
-        catchment_threshold = max(distances)
-
-        # Variables
-        catchment_network = {}
-        catchment_points = {}
-
-        # Loop through graph and get geometry and write to catchment network
+    def network_arrays(self, graph):
+        # Array copy of the graph, with one of the two possible arcs of every line, its cost and its source feature
+        xs, ys = [], []
+        for index in range(graph.vertexCount()):
+            point = graph.vertex(index).point()
+            xs.append(point.x())
+            ys.append(point.y())
+        starts, ends, costs, sources = [], [], [], []
         for index in range(graph.edgeCount()):
-            inVertexId = graph.edge(index).fromVertex()
-            outVertexId = graph.edge(index).toVertex()
-            inVertexGeom = graph.vertex(inVertexId).point()
-            outVertexGeom = graph.vertex(outVertexId).point()
-            # only include one of the two possible arcs
-            if inVertexId < outVertexId:
-                arcGeom = QgsGeometry.fromPolylineXY([inVertexGeom, outVertexGeom])
-                catchment_network[index] = {'geom': arcGeom, 'start': inVertexId, 'end': outVertexId, 'cost': {}}
-
-        # Loop through tied origins and write origin names
-        for tied_point, origin in enumerate(tied_origins):
-            origin_name = tied_origins[tied_point]['name']
-            catchment_points[tied_point] = {'name': origin_name}
-            catchment_points[tied_point].update({distance: [] for distance in distances})
-
-        # Loop through tied origins and write costs and polygon points
-        i = 1
-        for tied_point, origin in enumerate(tied_origins):
-            self.progress.emit(20 + int(20 * i / len(tied_origins)))
-            origin_name = tied_origins[tied_point]['name']
-            originVertexId = graph.findVertex(tied_origins[tied_point]['vertex'])
+            edge = graph.edge(index)
+            if edge.fromVertex() < edge.toVertex():
+                starts.append(edge.fromVertex())
+                ends.append(edge.toVertex())
+                costs.append(edge.cost(0))
+                sources.append(edge.cost(1))
+        return gs.Network(xs, ys, starts, ends, costs, sources)
 
-            # Run dijkstra and get tree and cost
-            (tree, cost) = QgsGraphAnalyzer.dijkstra(graph, originVertexId, 0)
-
-            # Loop through graph arcs
-            for index in catchment_network.keys():
+    def graph_analysis(self, graph, tied_origins, distances):
+        # Catchment arcs are the lines of the network
+        graph_arrays = graph.graph_arrays()
+        catchment_search = gs.CatchmentSearch(graph_arrays, graph.starts, graph.ends)
+        # origins are not tied to an empty network
+        origins = [(tied_point, tied_origins[tied_point]['vertex']) for tied_point in range(len(tied_origins)) if
+                   tied_origins[tied_point]['vertex'] >= 0]
+
+        # Run dijkstra up to the largest distance from every origin and get the costs and polygon points
+        # The permissive option gives cost to the arc based on the closest point, 0 if the arc is the origin
+        results = {}
+        if self.settings.get('parallel') and len(origins) > 1:
+            self.parallel_analysis(catchment_search, origins, distances, results)
+        else:
+            for tied_point, originVertexId in origins:
                 if self.killed: break
-                # Define the arc properties
-                inVertexId = catchment_network[index]['start']
-                outVertexId = catchment_network[index]['end']
-                inVertexCost = cost[inVertexId]
-                outVertexCost = cost[outVertexId]
-                # this is the permissive option gives cost to the arc based on the closest point,
-                # it just needs to be reach by one node
-                arcCost = min(inVertexCost, outVertexCost)
-                # this is the restrictive option, gives cost to the arc based on the furtherst point,
-                # it needs to be entirely within distance
-                # arcCost = max(inVertexCost, outVertexCost)
-
-                # If arc is the origin set cost to 0
-                if outVertexId == originVertexId or inVertexId == originVertexId:
-                    catchment_network[index]['cost'][origin_name] = 0
-
-                # If arc is connected and within the maximum radius set cost
-                elif arcCost <= catchment_threshold and tree[inVertexId] != -1:
-                    if origin_name in catchment_network[index]['cost']:
-                        if catchment_network[index]['cost'][origin_name] > int(arcCost):
-                            catchment_network[index]['cost'][origin_name] = int(arcCost)
-                    else:
-                        catchment_network[index]['cost'][origin_name] = int(arcCost)
-
-                    # Add catchment points for each given radius
-                    inVertexGeom = graph.vertex(inVertexId).point()
-                    outVertexGeom = graph.vertex(outVertexId).point()
-                    seg_length = catchment_network[index][
-                        'geom'].length()  # math.sqrt(inVertexGeom.sqrDist(outVertexGeom))
-                    for distance in distances:
-                        if self.killed: break
-                        # this option includes both nodes as long as arc is within distance
-                        # the polygon is the same as the network output
-                        # if arcCost <= distance:
-                        #    catchment_points[tied_point][distance].extend([inVertexGeom, outVertexGeom])
-                        # this option only includes nodes within distance
-                        # it does linear interpolation for extra points
-                        if inVertexCost <= distance:
-                            catchment_points[tied_point][distance].append(inVertexGeom)
-                            # add an extra point with linear referencing
-                            if outVertexCost > distance:
-                                target_dist = distance - inVertexCost
-                                midVertexGeom = catchment_network[index]['geom'].interpolate(target_dist).asPoint()
-                                catchment_points[tied_point][distance].append(midVertexGeom)
-                        if outVertexCost <= distance:
-                            catchment_points[tied_point][distance].append(outVertexGeom)
-                            # add an extra point with linear referencing
-                            if inVertexCost > distance:
-                                target_dist = distance - outVertexCost
-                                midVertexGeom = catchment_network[index]['geom'].interpolate(
-                                    seg_length - target_dist).asPoint()
-                                catchment_points[tied_point][distance].append(midVertexGeom)
+                results[tied_point] = catchment_search.origin_catchment(originVertexId, distances)
+                self.progress.emit(20 + int(20 * len(results) / len(origins)))
 
-            i += 1
+        # Costs of the arcs for every origin they are reached from (sparse arcs x origins matrix)
+        # and polygon points (xs, ys, costs) sorted by cost, in origin order
+        cost_arcs, cost_origins, arc_costs = [], [], []
+        catchment_points = {}
+        for tied_point in sorted(results):
+            origin_arcs, origin_costs, points = results.pop(tied_point)
+            cost_arcs.append(origin_arcs)
+            cost_origins.append(np.full(len(origin_arcs), tied_point, dtype=np.int64))
+            arc_costs.append(origin_costs)
+            catchment_points[tied_point] = {'name': tied_origins[tied_point]['name'], 'points': points}
+
+        # Origin costs in rows by arc
+        cost_offsets, cost_origins, arc_costs = gs.compressed_rows(
+            catchment_search.arc_count(), np.concatenate(cost_arcs + [np.zeros(0, dtype=np.int64)]),
+            np.concatenate(cost_origins + [np.zeros(0, dtype=np.int64)]),
+            np.concatenate(arc_costs + [np.zeros(0, dtype=np.float32)]))
+        catchment_network = {'xs': graph_arrays.xs, 'ys': graph_arrays.ys, 'starts': catchment_search.starts,
+                             'ends': catchment_search.ends, 'sources': graph.sources, 'cost offsets': cost_offsets,
+                             'cost origins': cost_origins, 'costs': arc_costs,
+                             'origin names': [str(tied_origins[tied_point]['name']) for tied_point in
+                                              range(len(tied_origins))]}
         return catchment_network, catchment_points
 
+    def parallel_analysis(self, catchment_search, origins, distances, results):
+        # Every process gets a copy of the graph when it starts, then chunks of origins
+        processes = process_helpers.process_count()
+        # a few chunks per process so that uneven catchments balance out, small enough to stop soon when killed
+        chunk_size = min(int(math.ceil(len(origins) / float(processes * 4))), 100)
+        chunks = [origins[idx:idx + chunk_size] for idx in range(0, len(origins), chunk_size)]
+        context = process_helpers.spawn_context()
+        # set when killed, the workers stop at the next origin of their chunk
+        stop = context.Event()
+        pool = ProcessPoolExecutor(processes, mp_context=context, initializer=gs.init_search,
+                                   initargs=(catchment_search, stop))
+        pending = set(pool.submit(gs.search_origins, chunk, distances) for chunk in chunks)
+        try:
+            while len(pending) > 0:
+                if self.killed:
+                    break
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in future.result():
+                        results[result[0]] = result[1:]
+                self.progress.emit(20 + int(20 * len(results) / len(origins)))
+        finally:
+            # when killed the running chunks stop and the others do not start
+            stop.set()
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+        return results
+
     def get_fields(self, origins, use_name):
         # fields: self.network_fields
         # Setup all unique origin columns and minimum origin distance column
@@ -346,52 +334,52 @@ class CatchmentAnalysis(QObject):
 
     def network_writer(self, catchment_network, new_fields, use_name):
 
+        xs, ys = catchment_network['xs'], catchment_network['ys']
+        starts, ends = catchment_network['starts'].tolist(), catchment_network['ends'].tolist()
+        sources = catchment_network['sources'].tolist()
+        cost_offsets = catchment_network['cost offsets'].tolist()
+        cost_origins = catchment_network['cost origins'].tolist()
+        costs = catchment_network['costs'].astype(np.int64).tolist()
+        origin_names = catchment_network['origin names']
+
         # Loop through arcs in catchment network and write geometry and costs
-        i = 0
         features = []
+        for index in range(len(starts)):
 
-        for k, v in catchment_network.items():
-
-            self.progress.emit(70 + int(30 * i / len(catchment_network)))
+            self.progress.emit(70 + int(30 * index / len(starts)))
 
             if self.killed is True:
                 break
 
-            # Get arc properties
-            arc_geom = v['geom']
-            arc_cost_dict = {str(key): value for key, value in list(v['cost'].items())}
-
-            i += 1
             # Ignore arc if not connected or outside of catchment
-            if len(arc_cost_dict) > 0:
-                # Create feature and write id and geom
-                f = QgsFeature()
-                # get original feature attributes
-                centroid_match = self.spIndex.nearestNeighbor(arc_geom.centroid().asPoint(), 1).pop()
-                original_feature_id = self.centroids[centroid_match]
-                f_attrs = self.attributes_dict[original_feature_id]
-                arc_cost_list = []
-                non_null_arc_cost_list = []
-                for name in self.names:
-                    try:
-                        dist = arc_cost_dict[str(name)]
-                        arc_cost_list.append(dist)
-                        non_null_arc_cost_list.append(dist)
-                    except KeyError:
-                        arc_cost_list.append(NULL)
-
-                f.setFields(new_fields)
-                if use_name:
-                    f.setAttributes(f_attrs + arc_cost_list + [min(non_null_arc_cost_list)])
-                else:
-                    f.setAttributes(f_attrs + [min(non_null_arc_cost_list)])
-
-                f.setGeometry(arc_geom)
+            if cost_offsets[index] == cost_offsets[index + 1]:
+                continue
+
+            # Get arc properties, the lowest cost of every origin name
+            arc_cost_dict = {}
+            for origin, dist in zip(cost_origins[cost_offsets[index]:cost_offsets[index + 1]],
+                                    costs[cost_offsets[index]:cost_offsets[index + 1]]):
+                name = origin_names[origin]
+                arc_cost_dict[name] = min(arc_cost_dict.get(name, dist), dist)
+            arc_geom = QgsGeometry.fromPolylineXY([QgsPointXY(xs[starts[index]], ys[starts[index]]),
+                                                   QgsPointXY(xs[ends[index]], ys[ends[index]])])
+
+            # Create feature and write id and geom
+            f = QgsFeature()
+            # get original feature attributes
+            f_attrs = self.attributes_dict[sources[index]]
+            arc_cost_list = [arc_cost_dict.get(str(name), NULL) for name in self.names]
+
+            f.setFields(new_fields)
+            if use_name:
+                f.setAttributes(f_attrs + arc_cost_list + [min(arc_cost_dict.values())])
+            else:
+                f.setAttributes(f_attrs + [min(arc_cost_dict.values())])
 
-                # Write feature to output network layer
-                features.append(f)
+            f.setGeometry(arc_geom)
 
-            i += 1
+            # Write feature to output network layer
+            features.append(f)
 
         return features
 
@@ -409,12 +397,12 @@ class CatchmentAnalysis(QObject):
             if name not in unique_origins_list:
                 polygon_dict[name] = {distance: [] for distance in distances}
                 unique_origins_list.append(name)
-            # Creating hull for each distance and if applicable in a list
-            for distance in distances:
+            # Creating hull for each distance from the triangulation of the largest one and if applicable in a list
+            point_xs, point_ys, point_costs = catchment_points[tied_point]['points']
+            hulls = self.concave_hull.band_hulls(point_xs, point_ys, point_costs, distances, polygon_tolerance)
+            for distance, hull in zip(distances, hulls):
                 if self.killed: break
-                points = catchment_points[tied_point][distance]
-                if len(points) > 2:  # Only three points can create a polygon
-                    hull = self.concave_hull.concave_hull(points, polygon_tolerance)
+                if np.searchsorted(point_costs, distance, 'right') > 2:  # Only three points can create a polygon
                     polygon_dict[name][distance].append(hull)
             i += 1
         # Generate the polygons
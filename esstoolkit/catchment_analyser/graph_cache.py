@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-05-19
+# copyright            : (C) 2016 by Space Syntax Limited
+# author               : Laurens Versluis
+# email                : l.versluis@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Cache of the built catchment network graphs
+
+The graph of a network layer with the origins tied to it by makeGraph (graph_search.Network with the source
+feature of every line) and the vertices of the origins are saved as a compressed numpy file. Its name is a key of
+the layer source, the cost field, the topology tolerance and the cache format, followed by a key of the
+modification times and sizes of the files of the layer (with the attribute and index files of a shapefile and the
+write-ahead log of a GeoPackage) and of the origin points. Saving a graph removes the older graphs of the same layer
+and settings, and the oldest graphs over max_graphs. Layers without a file (memory or database layers) are not
+cached, as their edits cannot be told from their source.
+"""
+
+from __future__ import absolute_import
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+from qgis.core import QgsApplication
+
+try:
+    from . import graph_search as gs
+except ImportError:
+    pass
+
+# arrays of a graph_search.Network
+columns = ('xs', 'ys', 'starts', 'ends', 'costs', 'sources')
+# changed with the content of the cache files, so that older files are not read
+cache_version = 3
+max_graphs = 20
+
+
+def source_file(layer):
+    path = layer.source().split('|')[0]
+    if layer.providerType() == 'ogr' and os.path.isfile(path):
+        return path
+    return None
+
+
+def source_files(path):
+    """
+    Returns the existing files of a layer file, edits to the attributes of a shapefile only change its dbf
+    """
+    stem = os.path.splitext(path)[0]
+    paths = [path] + [stem + extension for extension in ('.dbf', '.shx', '.prj', '.cpg')] + [path + '-wal']
+    return [file_path for file_path in paths if os.path.isfile(file_path)]
+
+
+def cache_dir():
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'esstoolkit', 'catchment_analyser', 'graphs')
+
+
+def cache_path(layer, cost_field, tolerance, crs, origin_points):
+    path = source_file(layer)
+    if path is None:
+        return None
+    settings_key = hashlib.md5(repr([cache_version, layer.source(), cost_field, tolerance, crs.authid()]).encode(
+        'utf-8')).hexdigest()
+    files_key = hashlib.md5(repr([(os.path.getmtime(file_path), os.path.getsize(file_path)) for file_path in
+                                  source_files(path)] + list(origin_points)).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir(), '%s_%s.npz' % (settings_key, files_key))
+
+
+def prune_cache(path):
+    """
+    Removes the graphs of older versions of the layer of path, and the oldest graphs over max_graphs
+    """
+    settings_key = os.path.basename(path).split('_')[0]
+    graphs = sorted(glob.glob(os.path.join(os.path.dirname(path), '*.npz')), key=os.path.getmtime, reverse=True)
+    for index, graph_path in enumerate(graphs):
+        if graph_path != path and (os.path.basename(graph_path).split('_')[0] == settings_key or index >= max_graphs):
+            try:
+                os.remove(graph_path)
+            except OSError:
+                pass
+
+
+def load_network(path):
+    """
+    Returns the network and the vertices of the origins, None if they are not cached
+    """
+    try:
+        with np.load(path) as arrays:
+            return gs.Network(*[arrays[column] for column in columns]), arrays['origin_vertices']
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+
+def save_network(path, network, origin_vertices):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    arrays = dict((column, getattr(network, column)) for column in columns)
+    arrays['origin_vertices'] = np.asarray(origin_vertices, dtype=np.int64)
+    # written aside first, a crash while saving keeps no broken cache
+    with open(path + '.tmp', 'wb') as cache_file:
+        np.savez_compressed(cache_file, **arrays)
+    os.replace(path + '.tmp', path)
+    prune_cache(path)
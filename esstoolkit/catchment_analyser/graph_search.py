@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-05-19
+# copyright            : (C) 2016 by Space Syntax Limited
+# author               : Laurens Versluis
+# email                : l.versluis@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Shortest path search on an array copy of the catchment graph
+
+Arcs are kept in compressed rows by start vertex (offsets, targets, costs), so that the arcs of vertex v are
+targets[offsets[v]:offsets[v + 1]]. The search stops at the largest catchment distance and only settles
+the vertices within it.
+
+Origins can be searched in worker processes (init_search, search_origins), that get a copy of the graph when
+they start.
+"""
+
+import heapq
+
+import numpy as np
+
+
+def compressed_rows(vertex_count, starts, *columns):
+    """
+    Returns the offsets of the rows of every start vertex and the columns sorted by start vertex
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    order = np.argsort(starts, kind='stable')
+    offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(starts, minlength=vertex_count))
+    return (offsets,) + tuple(np.asarray(column)[order] for column in columns)
+
+
+def gather_rows(offsets, values, rows):
+    """
+    Returns the values of the given rows of compressed rows, concatenated
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    row_starts = offsets[rows]
+    counts = offsets[rows + 1] - row_starts
+    # position of every value in its row, added to the start of its row
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(row_starts, counts)
+    return np.asarray(values)[positions]
+
+
+def arc_costs(starts, ends, vertex_costs, arcs, origin, cutoff):
+    """
+    Returns the arcs within cutoff and their costs, the cost of their closest end (0 for the arcs of the origin)
+    """
+    arc_starts, arc_ends = starts[arcs], ends[arcs]
+    costs = np.minimum(vertex_costs[arc_starts], vertex_costs[arc_ends])
+    at_origin = (arc_starts == origin) | (arc_ends == origin)
+    reached = at_origin | (costs <= cutoff)
+    costs = np.where(at_origin, 0, np.floor(np.where(reached, costs, 0)))
+    return arcs[reached], costs[reached].astype(np.float32)
+
+
+def reached_points(xs, ys, starts, ends, vertex_costs, arcs, distances):
+    """
+    Returns the coordinates and costs of the ends of the arcs within the largest distance, and of the points at
+    every distance on the arcs that leave it (interpolated on the length of the arcs), sorted by cost. The points
+    of a distance band are the first ones up to its cost.
+    """
+    arc_starts, arc_ends = starts[arcs], ends[arcs]
+    vertices = np.unique(np.concatenate((arc_starts, arc_ends)))
+    vertices = vertices[vertex_costs[vertices] <= max(distances)]
+    point_xs, point_ys, point_costs = [xs[vertices]], [ys[vertices]], [vertex_costs[vertices]]
+    start_costs, end_costs = vertex_costs[arc_starts], vertex_costs[arc_ends]
+    dxs, dys = xs[arc_ends] - xs[arc_starts], ys[arc_ends] - ys[arc_starts]
+    lengths = np.hypot(dxs, dys)
+    for distance in distances:
+        # the point at distance from the end within it, clamped to the arc
+        start_out = (start_costs <= distance) & (end_costs > distance)
+        end_out = (end_costs <= distance) & (start_costs > distance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = np.clip(np.where(start_out, distance - start_costs, end_costs + lengths - distance) / lengths, 0,
+                             1)
+        out = start_out | end_out
+        ratios = np.where(lengths > 0, ratios, np.where(start_out, 0, 1))[out]
+        point_xs.append(xs[arc_starts][out] + ratios * dxs[out])
+        point_ys.append(ys[arc_starts][out] + ratios * dys[out])
+        point_costs.append(np.full(np.count_nonzero(out), float(distance)))
+    point_costs = np.concatenate(point_costs)
+    order = np.argsort(point_costs, kind='stable')
+    return np.concatenate(point_xs)[order], np.concatenate(point_ys)[order], point_costs[order]
+
+
+class GraphArrays(object):
+    """
+    Array copy of a directed graph with one cost per arc
+    """
+
+    def __init__(self, xs, ys, arc_starts, arc_ends, arc_costs):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+        self.offsets, targets, costs = compressed_rows(len(self.xs), arc_starts, arc_ends,
+                                                       np.asarray(arc_costs, dtype=np.float64))
+        # python lists are faster than arrays for item access in the search loop
+        self.offsets = self.offsets.tolist()
+        self.targets = targets.tolist()
+        self.costs = costs.tolist()
+
+    def vertex_count(self):
+        return len(self.xs)
+
+    def bounded_dijkstra(self, origin, cutoff):
+        """
+        Returns the vertices with a cost up to cutoff from origin and their costs, in the order they are settled
+        """
+        offsets, targets, costs = self.offsets, self.targets, self.costs
+        best = {origin: 0.0}
+        settled = {}
+        queue = [(0.0, origin)]
+        while len(queue) > 0:
+            cost, vertex = heapq.heappop(queue)
+            if vertex in settled:
+                continue
+            if cost > cutoff:
+                break
+            settled[vertex] = cost
+            for idx in range(offsets[vertex], offsets[vertex + 1]):
+                target = targets[idx]
+                target_cost = cost + costs[idx]
+                if target not in settled and target_cost < best.get(target, np.inf):
+                    best[target] = target_cost
+                    heapq.heappush(queue, (target_cost, target))
+        return (np.fromiter(settled.keys(), dtype=np.int64, count=len(settled)),
+                np.fromiter(settled.values(), dtype=np.float64, count=len(settled)))
+
+
+class Network(object):
+    """
+    Lines of a graph (starts, ends, costs), that can be walked in both directions, the ids of the features they
+    come from (sources, -1 if unknown) and the coordinates of their vertices
+    """
+
+    def __init__(self, xs, ys, starts, ends, costs, sources=None):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.costs = np.asarray(costs, dtype=np.float64)
+        self.sources = np.full(len(self.starts), -1, dtype=np.int64) if sources is None else np.asarray(
+            sources, dtype=np.int64)
+
+    def graph_arrays(self):
+        return GraphArrays(self.xs, self.ys, np.concatenate((self.starts, self.ends)),
+                           np.concatenate((self.ends, self.starts)), np.tile(self.costs, 2))
+
+
+class CatchmentSearch(object):
+    """
+    Catchment arcs (starts, ends) of a graph and their costs and band points from every origin
+    """
+
+    def __init__(self, graph_arrays, starts, ends):
+        self.graph_arrays = graph_arrays
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        # catchment arcs of every vertex
+        self.vertex_arcs_offsets, self.vertex_arcs = compressed_rows(
+            graph_arrays.vertex_count(), np.concatenate((self.starts, self.ends)),
+            np.tile(np.arange(len(self.starts)), 2))
+        # vertices outside the catchment of an origin are not reached
+        self.cost = np.full(graph_arrays.vertex_count(), np.inf)
+
+    def arc_count(self):
+        return len(self.starts)
+
+    def origin_catchment(self, origin, distances):
+        """
+        Returns the arcs within the largest distance of origin, their costs and the reached points (xs, ys, costs)
+        of the distance bands
+        """
+        starts, ends, cost = self.starts, self.ends, self.cost
+        cutoff = max(distances)
+        reached_vertices, reached_costs = self.graph_arrays.bounded_dijkstra(origin, cutoff)
+        cost[reached_vertices] = reached_costs
+        reached_arcs = np.unique(gather_rows(self.vertex_arcs_offsets, self.vertex_arcs, reached_vertices))
+        origin_arcs, origin_costs = arc_costs(starts, ends, cost, reached_arcs, origin, cutoff)
+        # the arcs of the origin add no points
+        point_arcs = origin_arcs[(starts[origin_arcs] != origin) & (ends[origin_arcs] != origin)]
+        points = reached_points(self.graph_arrays.xs, self.graph_arrays.ys, starts, ends, cost, point_arcs,
+                                distances)
+        cost[reached_vertices] = np.inf
+        return origin_arcs, origin_costs, points
+
+
+# search of the worker processes and the event that stops them, set once when they start
+search = None
+stop = None
+
+
+def init_search(catchment_search, stop_event=None):
+    global search, stop
+    search = catchment_search
+    stop = stop_event
+
+
+def search_origins(origins, distances):
+    """
+    Returns (origin index, arcs, costs, points) of every (origin index, origin vertex) of a chunk,
+    the origins left when the stop event is set are not searched
+    """
+    results = []
+    for index, vertex in origins:
+        if stop is not None and stop.is_set():
+            break
+        results.append((index,) + search.origin_catchment(vertex, distances))
+    return results
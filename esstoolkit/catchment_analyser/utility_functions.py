@@ -15,12 +15,9 @@
 
 from __future__ import print_function
 
-import ntpath
+from qgis.core import (QgsProject, QgsMapLayer, QgsVectorLayer, QgsField, QgsFeature, QgsGeometry, NULL)
 
-import psycopg2
-from psycopg2.extensions import AsIs
-from qgis.core import (QgsProject, QgsMapLayer, QgsVectorLayer, QgsField, QgsFeature, QgsGeometry, QgsVectorFileWriter,
-                       NULL, QgsWkbTypes, QgsCoordinateTransformContext)
+from esstoolkit.utilities import layer_writer
 
 
 def getLegendLayersNames(iface, geom='all', provider='all'):
@@ -84,59 +81,12 @@ def insertTempFeatures(layer, geometry, attributes):
         provider.addFeatures([fet])
     provider.updateExtents()
 
+
 # WRITE -----------------------------------------------------------------
 
 # geom_type allowed: 'Point', 'Linestring', 'Polygon'
-def to_layer(fields, crs, encoding, geom_type, layer_type, path):
-    layer = None
-    if layer_type == 'memory':
-        layer = QgsVectorLayer(geom_type + '?crs=' + crs.authid(), path, "memory")
-        pr = layer.dataProvider()
-        pr.addAttributes(fields.toList())
-        layer.updateFields()
-
-    elif layer_type == 'shapefile':
-
-        wkbTypes = {'Point': QgsWkbTypes.Point, 'Linestring': QgsWkbTypes.LineString, 'Polygon': QgsWkbTypes.Polygon}
-        options = QgsVectorFileWriter.SaveVectorOptions()
-        options.driverName = "ESRI Shapefile"
-        options.fileEncoding = encoding
-        file_writer = QgsVectorFileWriter.create(path, fields, wkbTypes[geom_type], crs,
-                                                 QgsCoordinateTransformContext(), options)
-        if file_writer.hasError() != QgsVectorFileWriter.NoError:
-            print("Error when creating shapefile: ", file_writer.errorMessage())
-        del file_writer
-        layer = QgsVectorLayer(path, ntpath.basename(path)[:-4], "ogr")
-
-    elif layer_type == 'postgis':
-
-        # this is needed to load the table later
-        # uri = connstring + """ type=""" + geom_types[geom_type] + """ table=\"""" + schema_name + """\".\"""" + table_name + """\" (geom) """
-
-        connstring, schema_name, table_name = path
-        uri = connstring + """ type=""" + geom_type + """ table=\"""" + schema_name + """\".\"""" + table_name + """\" (geom) """
-        crs_id = crs.postgisSrid()
-        try:
-            con = psycopg2.connect(connstring)
-            cur = con.cursor()
-            create_query = cur.mogrify(
-                """DROP TABLE IF EXISTS "%s"."%s"; CREATE TABLE "%s"."%s"( geom geometry(%s, %s))""", (
-                    AsIs(schema_name), AsIs(table_name), AsIs(schema_name), AsIs(table_name), geom_type, AsIs(crs_id)))
-            cur.execute(create_query)
-            con.commit()
-            post_q_flds = {2: 'bigint', 6: 'numeric', 1: 'bool', 'else': 'text', 4: 'numeric'}
-            for f in fields:
-                f_type = f.type()
-                if f_type not in [2, 6, 1]:
-                    f_type = 'else'
-                attr_query = cur.mogrify("""ALTER TABLE "%s"."%s" ADD COLUMN "%s" %s""", (
-                AsIs(schema_name), AsIs(table_name), AsIs(f.name()), AsIs(post_q_flds[f_type])))
-                cur.execute(attr_query)
-                con.commit()
-            layer = QgsVectorLayer(uri, table_name, 'postgres')
-        except psycopg2.DatabaseError as e:
-            print(e)
-    return layer
+def to_layer(fields, crs, encoding, geom_type, layer_type, path, features=()):
+    return layer_writer.write_features(features, fields, crs, encoding, geom_type, layer_type, path)
 
 
 def has_unique_values(column, layer):
@@ -312,6 +312,7 @@ class NetworkSegmenterTool(QObject):
                 cross_p_list = [self.my_segmentor.break_segm(feat) for feat in
                                 self.my_segmentor.list_iter(list(self.my_segmentor.feats.values()))]
                 self.my_segmentor.step = 20 / float(len(cross_p_list))
+                # segments are made here in the worker, only their writing is left to the GUI thread
                 segmented_feats = [self.my_segmentor.copy_feat(feat_geom_fid[0], feat_geom_fid[1], feat_geom_fid[2]) for
                                    feat_geom_fid in self.my_segmentor.break_feats_iter(cross_p_list)]
 
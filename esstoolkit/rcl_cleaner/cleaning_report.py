@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-11-10
+# copyright            : (C) 2016 by Space Syntax Ltd
+# author               : Ioanna Kolovou
+# email                : i.kolovou@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# Profiling report of the cleaning stages.
+# Every stage records its wall time, the peak memory of the process when it ends and the features, edges and nodes
+# it got and left. The report is logged as a table and saved as json at the end of every run, the last reports_kept
+# reports of the plugin are kept.
+
+from __future__ import absolute_import
+
+import json
+import os
+import re
+import time
+
+from qgis.core import QgsApplication, QgsMessageLog, Qgis
+
+from esstoolkit.utilities.utility_functions import peakMemoryMB
+
+columns = ('stage', 'seconds', 'process_peak_memory_mb', 'features_in', 'features_out', 'edges_in', 'edges_out', 'nodes_in',
+           'nodes_out', 'errors', 'unlinks')
+
+
+reports_kept = 50
+
+
+def reports_folder():
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'esstoolkit', 'rcl_cleaner', 'reports')
+
+
+# layer names can have any character, the file name keeps letters, digits, '-' and '_'
+def report_path(layer_name):
+    name = re.sub(r'[^A-Za-z0-9_-]+', '_', layer_name)[:64]
+    return os.path.join(reports_folder(), '%s_%s.json' % (time.strftime('%Y%m%d_%H%M%S'), name))
+
+
+# the file names start with the time of the run, the oldest come first
+def prune_reports(folder, kept=reports_kept):
+    reports = sorted(name for name in os.listdir(folder) if name.endswith('.json'))
+    for name in reports[:max(len(reports) - kept, 0)]:
+        os.remove(os.path.join(folder, name))
+
+
+# counts of a feature list or of a graph, None where they do not apply
+def stage_counts(features=None, graph=None):
+    counts = {'features': features, 'edges': None, 'nodes': None, 'errors': None, 'unlinks': None}
+    if graph is not None:
+        counts.update({'edges': graph.edge_count(), 'nodes': graph.node_count(), 'errors': len(graph.errors),
+                       'unlinks': len(graph.unlinks)})
+    return counts
+
+
+class CleaningReport(object):
+
+    def __init__(self, layer_name, settings=None):
+        self.layer_name = layer_name
+        self.settings = settings
+        # run_estimator.sample_layer of the input, if known
+        self.sample = None
+        self.stages = []
+        self.run_start = time.time()
+        self.stage_start = self.run_start
+        self.counts_in = stage_counts()
+
+    def start_stage(self, features=None, graph=None):
+        self.stage_start = time.time()
+        self.counts_in = stage_counts(features, graph)
+
+    # the outputs of a stage are the inputs of the next one
+    def end_stage(self, stage, features=None, graph=None):
+        counts_out = stage_counts(features, graph)
+        self.stages.append({'stage': stage,
+                            'seconds': round(time.time() - self.stage_start, 3),
+                            # the peak of the whole process so far (None on windows), not of the stage alone
+                            # a rise shows the stage that needed the memory
+                            'process_peak_memory_mb': peakMemoryMB(),
+                            'features_in': self.counts_in['features'],
+                            'features_out': counts_out['features'],
+                            'edges_in': self.counts_in['edges'],
+                            'edges_out': counts_out['edges'],
+                            'nodes_in': self.counts_in['nodes'],
+                            'nodes_out': counts_out['nodes'],
+                            'errors': counts_out['errors'],
+                            'unlinks': counts_out['unlinks']})
+        self.stage_start = time.time()
+        self.counts_in = counts_out
+
+    def total_seconds(self):
+        return round(time.time() - self.run_start, 3)
+
+    def table(self):
+        rows = [columns] + [tuple('' if stage[column] is None else str(stage[column]) for column in columns) for
+                            stage in self.stages]
+        widths = [max(len(row[idx]) for row in rows) for idx in range(len(columns))]
+        lines = ['  '.join(value.rjust(width) for value, width in zip(row, widths)) for row in rows]
+        lines.insert(1, '  '.join('-' * width for width in widths))
+        return '\n'.join(['Cleaning report %s, %s seconds' % (self.layer_name, self.total_seconds())] + lines)
+
+    def log(self):
+        QgsMessageLog.logMessage(self.table(), level=Qgis.Info)
+
+    # the plugin reports are pruned, a given path is kept as it is
+    def save(self, path=None):
+        pruned = path is None
+        path = path or report_path(self.layer_name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as report_file:
+            json.dump({'layer': self.layer_name, 'settings': self.settings, 'sample': self.sample,
+                       'seconds': self.total_seconds(), 'stages': self.stages}, report_file, indent=2, default=str)
+        if pruned:
+            prune_reports(os.path.dirname(path))
+        return path
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-11-10
+# copyright            : (C) 2016 by Space Syntax Ltd
+# author               : Ioanna Kolovou
+# email                : i.kolovou@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# Features as plain python values (wkb and attributes), for the saved states of the incremental cleaning and
+# the stage checkpoints
+
+from __future__ import absolute_import
+
+from qgis.core import (QgsFeature, QgsGeometry, NULL)
+
+
+def pack_feature(f):
+    return bytes(f.geometry().asWkb()), [None if attr == NULL else attr for attr in f.attributes()]
+
+
+def unpack_feature(packed, template):
+    wkb, attributes = packed
+    f = QgsFeature(template)
+    geometry = QgsGeometry()
+    geometry.fromWkb(wkb)
+    f.setGeometry(geometry)
+    f.setAttributes([NULL if attr is None else attr for attr in attributes])
+    return f
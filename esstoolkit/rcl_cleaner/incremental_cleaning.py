@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-11-10
+# copyright            : (C) 2016 by Space Syntax Ltd
+# author               : Ioanna Kolovou
+# email                : i.kolovou@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# Incremental re-cleaning of edited road networks.
+# The cleaned edges of a run are stored together with the input features they were made from. On the next run
+# only the edges of the added, changed and deleted input features are cleaned again, with the edges around them.
+
+from __future__ import absolute_import
+
+import hashlib
+import os
+import pickle
+from collections import defaultdict
+
+from qgis.core import (QgsApplication, QgsRectangle, QgsSpatialIndex, NULL)
+
+from .sGraph import spatialHash as spatial_hash
+
+# settings that change the cleaned output
+state_settings = ('break', 'merge', 'snap', 'orphans', 'unlinks', 'errors', 'collinear_angle',
+                  'simplification_threshold', 'fix_unlinks', 'precision')
+
+
+def settings_key(layer, settings):
+    key = repr([layer.source()] + [settings.get(name) for name in state_settings])
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def state_path(layer, settings):
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'esstoolkit', 'rcl_cleaner',
+                        settings_key(layer, settings) + '.pickle')
+
+
+def load_state(path):
+    try:
+        with open(path, 'rb') as state_file:
+            return pickle.load(state_file)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def save_state(path, state):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as state_file:
+        pickle.dump(state, state_file, pickle.HIGHEST_PROTOCOL)
+
+
+def feature_digest(f):
+    attributes = [None if attr == NULL else attr for attr in f.attributes()]
+    return hashlib.md5(bytes(f.geometry().asWkb()) + repr(attributes).encode('utf-8')).hexdigest()
+
+
+def geometry_coords(geometry):
+    if geometry.isMultipart():
+        return [(p.x(), p.y()) for pl in geometry.asMultiPolyline() for p in pl]
+    return [(p.x(), p.y()) for p in geometry.asPolyline()]
+
+
+# edges made from the edited input features, and all the input features these edges were made from
+# (an edge made from an edited feature and an unchanged one is cleaned again with both)
+def affected_edges(edge_sources, edited_fids):
+    input_edges = defaultdict(list)
+    for key, fids in list(edge_sources.items()):
+        for fid in fids:
+            input_edges[fid].append(key)
+
+    dirty_edges = set([])
+    source_fids = set([])
+    fids_to_visit = list(edited_fids)
+    while len(fids_to_visit) > 0:
+        fid = fids_to_visit.pop()
+        if fid in source_fids:
+            continue
+        source_fids.add(fid)
+        for key in input_edges[fid]:
+            if key not in dirty_edges:
+                dirty_edges.add(key)
+                fids_to_visit += edge_sources[key]
+    return dirty_edges, source_fids
+
+
+# input features of every cleaned edge
+# candidates: [(geometry, [input feature ids])]
+def edge_sources(edges, candidates):
+    matches = spatial_hash.vertex_sources([geometry_coords(f.geometry()) for f in edges],
+                                          [geometry_coords(geometry) for geometry, fids in candidates])
+    sources = []
+    spIndex = None
+    for f, candidate_indices in zip(edges, matches):
+        if len(candidate_indices) == 0:
+            # no shared vertex, closest candidate
+            if spIndex is None:
+                spIndex = QgsSpatialIndex()
+                for idx, (geometry, fids) in enumerate(candidates):
+                    spIndex.addFeature(idx, geometry.boundingBox())
+            candidate_indices = spIndex.nearestNeighbor(f.geometry().centroid().asPoint(), 1)[:1]
+        sources.append(sorted(set(fid for idx in candidate_indices for fid in candidates[idx][1])))
+    return sources
+
+
+# keys of the features within tolerance of any of the geometries
+def features_near(features, geometries, tolerance):
+    spIndex = QgsSpatialIndex()
+    for key, f in list(features.items()):
+        spIndex.addFeature(key, f.geometry().boundingBox())
+    near_keys = set([])
+    for geometry in geometries:
+        rect = geometry.boundingBox()
+        rect = QgsRectangle(rect.xMinimum() - tolerance, rect.yMinimum() - tolerance, rect.xMaximum() + tolerance,
+                            rect.yMaximum() + tolerance)
+        near_keys.update(key for key in spIndex.intersects(rect) if
+                         key not in near_keys and features[key].geometry().distance(geometry) <= tolerance)
+    return near_keys
+
+
+# edges (of the keys) whose endpoints do not touch any other edge
+def orphan_edges(edges, keys):
+    endpoint_edges = defaultdict(set)
+    for key, f in list(edges.items()):
+        coords = geometry_coords(f.geometry())
+        for point in (coords[0], coords[-1]):
+            endpoint_edges[point].add(key)
+    orphans = []
+    for key in keys:
+        coords = geometry_coords(edges[key].geometry())
+        if endpoint_edges[coords[0]] == endpoint_edges[coords[-1]] == {key}:
+            orphans.append(key)
+    return orphans
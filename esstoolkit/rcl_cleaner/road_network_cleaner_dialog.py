@@ -53,6 +53,9 @@ class RoadNetworkCleanerDialog(QDialog, FORM_CLASS):
         self.angularChangeSpinBox.setRange(1, 45)
         self.angularChangeSpinBox.setSingleStep(1)
         self.angularChangeSpinBox.setValue(10)
+        self.precisionSpinBox.setRange(0, 9)
+        self.precisionSpinBox.setSingleStep(1)
+        self.precisionSpinBox.setValue(6)
 
         self.memoryRadioButton.setChecked(True)
         self.shpRadioButton.setChecked(False)
@@ -177,6 +180,12 @@ class RoadNetworkCleanerDialog(QDialog, FORM_CLASS):
         self.disable_browse()
         self.unlinksCheckBox.setDisabled(onoff)
         self.errorsCheckBox.setDisabled(onoff)
+        self.compactCheckBox.setDisabled(onoff)
+        self.incrementalCheckBox.setDisabled(onoff)
+        self.checkpointsCheckBox.setDisabled(onoff)
+        self.precisionCheckBox.setDisabled(onoff)
+        self.precisionSpinBox.setDisabled(onoff)
+        self.validateCheckBox.setDisabled(onoff)
         self.cleanButton.setDisabled(onoff)
         self.dataSourceCombo.setDisabled(onoff)
         self.inputCombo.setDisabled(onoff)
@@ -239,6 +248,24 @@ class RoadNetworkCleanerDialog(QDialog, FORM_CLASS):
     def get_unlinks(self):
         return self.unlinksCheckBox.isChecked()
 
+    def get_compact(self):
+        return self.compactCheckBox.isChecked()
+
+    def get_incremental(self):
+        return self.incrementalCheckBox.isChecked()
+
+    def get_checkpoints(self):
+        return self.checkpointsCheckBox.isChecked()
+
+    def get_precision(self):
+        if self.precisionCheckBox.isChecked():
+            return self.precisionSpinBox.value()
+        else:
+            return None
+
+    def get_validate(self):
+        return self.validateCheckBox.isChecked()
+
     def get_output_type(self):
         if self.shpRadioButton.isChecked():
             return 'shapefile'
@@ -260,7 +287,10 @@ class RoadNetworkCleanerDialog(QDialog, FORM_CLASS):
                     'break': break_at_vertices, 'merge': merge_type, 'orphans': orphans,
                     'errors': self.get_errors(), 'unlinks': getUnlinks, 'collinear_angle': self.getCollinearThreshold(),
                     'simplification_threshold': self.getSimplificationTolerance(),
-                    'fix_unlinks': fix_unlinks, 'output_type': self.get_output_type(),
+                    'fix_unlinks': fix_unlinks, 'output_type': self.get_output_type(), 'compact': self.get_compact(),
+                    'incremental': self.get_incremental(),
+                    'checkpoints': self.get_checkpoints(), 'precision': self.get_precision(),
+                    'validate': self.get_validate(),
                     'progress_ranges': self.get_progress_ranges(break_at_vertices, merge_type, snap_threshold,
                                                                 getUnlinks, fix_unlinks)}
         return settings
@@ -21,14 +21,22 @@ from future import standard_library
 standard_library.install_aliases()
 from builtins import str
 import traceback
+from collections import Counter
 from qgis.PyQt.QtCore import (QObject, QThread, pyqtSignal)
-from qgis.core import (QgsProject, QgsMessageLog, Qgis)
+from qgis.core import (QgsProject, QgsMessageLog, Qgis, QgsFeature, QgsGeometry, QgsPointXY)
 import os
 
 from .road_network_cleaner_dialog import RoadNetworkCleanerDialog
-from .sGraph.sGraph import sGraph  # better give these a name to make it explicit to which module the methods belong
+from .sGraph.sGraph import sGraph, unlink_feat  # better give these a name to make it explicit to which module the methods belong
+from .sGraph.sCompactGraph import sCompactGraph
 from .sGraph import utilityFunctions as utf
-from esstoolkit.utilities import db_helpers as dbh, layer_field_helpers as lfh
+from .sGraph import spatialHash as spatial_hash
+from .sGraph import networkScan as network_scan
+from . import feature_packing
+from . import incremental_cleaning
+from . import stage_checkpoints
+from . import cleaning_report
+from esstoolkit.utilities import db_helpers as dbh, layer_field_helpers as lfh, run_estimator
 
 # Import the debug library - required for the cleaning class in separate thread
 # set is_debug to False in release version
@@ -199,8 +207,12 @@ class NetworkCleanerTool(QObject):
             layer = lfh.getLayerByName(layer_name)
 
             cleaned_features, errors_features, unlinks_features = ret
+            report = self.cleaning.report
+            report.start_stage()
+            # a scan only writes the errors
+            validate = self.settings.get('validate')
 
-            if self.settings['errors']:
+            if self.settings['errors'] or validate:
                 if len(errors_features) > 0:
                     errors = utf.to_layer(errors_features, layer.crs(), layer.dataProvider().encoding(), 'Point',
                                           output_type, errors_path)
@@ -212,7 +224,7 @@ class NetworkCleanerTool(QObject):
                 else:
                     self.giveMessage('No errors detected!', Qgis.Info)
 
-            if self.settings['unlinks']:
+            if self.settings['unlinks'] and not validate:
                 if len(unlinks_features) > 0:
                     unlinks = utf.to_layer(unlinks_features, layer.crs(), layer.dataProvider().encoding(), 'Point',
                                            output_type, unlinks_path)
@@ -223,13 +235,27 @@ class NetworkCleanerTool(QObject):
                 else:
                     self.giveMessage('No unlinks detected!', Qgis.Info)
 
-            cleaned = utf.to_layer(cleaned_features, layer.crs(), layer.dataProvider().encoding(), 'Linestring',
-                                   output_type, path)
-            cleaned.loadNamedStyle(os.path.dirname(__file__) + '/qgis_styles/cleaned.qml')
-            QgsProject.instance().addMapLayer(cleaned)
-            node = QgsProject.instance().layerTreeRoot().findLayer(cleaned.id())
-            self.iface.layerTreeView().layerTreeModel().refreshLayerLegend(node)
-            cleaned.updateExtents()
+            if validate:
+                report.end_stage('write', len(errors_features))
+            else:
+                cleaned = utf.to_layer(cleaned_features, layer.crs(), layer.dataProvider().encoding(), 'Linestring',
+                                       output_type, path)
+                cleaned.loadNamedStyle(os.path.dirname(__file__) + '/qgis_styles/cleaned.qml')
+                QgsProject.instance().addMapLayer(cleaned)
+                node = QgsProject.instance().layerTreeRoot().findLayer(cleaned.id())
+                self.iface.layerTreeView().layerTreeModel().refreshLayerLegend(node)
+                cleaned.updateExtents()
+                report.end_stage('write', cleaned.featureCount())
+            report.log()
+            # the outputs are written, a report that can not be saved does not fail the run
+            try:
+                report.save()
+            except (IOError, OSError) as e:
+                QgsMessageLog.logMessage('Cleaning report not saved: %s' % e, level=Qgis.Critical)
+
+            # the outputs are written, the run does not need to be resumed
+            if self.cleaning.checkpoint_path is not None:
+                stage_checkpoints.remove_checkpoint(self.cleaning.checkpoint_path)
 
             self.giveMessage('Process ended successfully!', Qgis.Info)
             self.dlg.cleaningProgress.setValue(100)
@@ -262,7 +288,8 @@ class NetworkCleanerTool(QObject):
                 pass
             # Clean up thread and analysis
             self.cleaning.kill()
-            self.cleaning.graph.kill()  # todo
+            if self.cleaning.graph:  # not created before the features are loaded
+                self.cleaning.graph.kill()  # todo
             self.cleaning.deleteLater()
             self.thread.quit()
             self.thread.wait()
@@ -290,6 +317,10 @@ class NetworkCleanerTool(QObject):
             self.iface = iface
             self.pseudo_graph = sGraph({}, {})
             self.graph = None
+            self.checkpoint_path = None
+            self.checkpoint = None
+            self.coordinate_grid = None
+            self.report = cleaning_report.CleaningReport(settings['input'], settings)
 
         def run(self):
             if has_pydevd and is_debug:
@@ -301,119 +332,366 @@ class NetworkCleanerTool(QObject):
                 # cleaning settings
                 layer_name = self.settings['input']
                 layer = lfh.getLayerByName(layer_name)
-                snap_threshold = self.settings['snap']
-                break_at_vertices = self.settings['break']
-                merge_type = self.settings['merge']
-                collinear_threshold = self.settings['collinear_angle']
-                angle_threshold = self.settings['simplification_threshold']
-                fix_unlinks = self.settings['fix_unlinks']
-                orphans = self.settings['orphans']
-                getUnlinks = self.settings['unlinks']
-                [load_range, cl1_range, cl2_range, cl3_range, break_range, merge_range, snap_range, unlinks_range,
-                 fix_range] = self.settings['progress_ranges']
                 QgsMessageLog.logMessage('settings %s' % self.settings, level=Qgis.Critical)
 
                 self.cl_progress.emit(0)
+                # recorded with the report, to calibrate the estimates of later runs
+                self.report.sample = run_estimator.sample_layer(layer, self.settings['snap'])
+
+                if self.settings.get('precision') is not None:
+                    extent = layer.extent()
+                    self.coordinate_grid = spatial_hash.coordinate_grid(
+                        self.settings['precision'], extent.xMinimum(), extent.yMinimum(), extent.xMaximum(),
+                        extent.yMaximum())
+                    self.pseudo_graph.coordinate_grid = self.coordinate_grid
+
+                if not (self.settings.get('incremental') or self.settings.get('validate')) and self.settings.get(
+                        'checkpoints'):
+                    self.resume_checkpoint(layer)
+
+                if self.settings.get('validate'):
+                    ret = self.scan_features(layer)
+                elif self.settings.get('incremental'):
+                    ret = self.clean_incremental(layer)
+                else:
+                    ret = self.clean_features(layer.getFeatures(), layer.featureCount())
 
-                if break_at_vertices:
-
-                    self.pseudo_graph.step = load_range / float(layer.featureCount())
-                    self.pseudo_graph.progress.connect(self.cl_progress.emit)
-                    self.graph = sGraph({}, {})
-                    self.graph.total_progress = load_range
-                    self.pseudo_graph.load_edges_w_o_topology(utf.clean_features_iter(layer.getFeatures()))
-                    QgsMessageLog.logMessage('pseudo_graph edges added %s' % load_range, level=Qgis.Critical)
-                    self.pseudo_graph.step = break_range / float(len(self.pseudo_graph.sEdges))
-                    self.graph.load_edges(
-                        self.pseudo_graph.break_features_iter(getUnlinks, angle_threshold, fix_unlinks),
-                        angle_threshold)
-                    QgsMessageLog.logMessage('pseudo_graph edges broken %s' % break_range, level=Qgis.Critical)
-                    self.pseudo_graph.progress.disconnect()
-                    self.graph.progress.connect(self.cl_progress.emit)
-                    self.graph.total_progress = self.pseudo_graph.total_progress
+                if is_debug:
+                    print("survived!")
+                self.cl_progress.emit(95)
 
-                else:
-                    self.graph = sGraph({}, {})
-                    self.graph.progress.connect(self.cl_progress.emit)
-                    self.graph.step = load_range / float(layer.featureCount())
-                    self.graph.load_edges(utf.clean_features_iter(layer.getFeatures()), angle_threshold)
-                    QgsMessageLog.logMessage('graph edges added %s' % load_range, level=Qgis.Critical)
+            except Exception as e:
+                # forward the exception upstream
+                self.error.emit(e, traceback.format_exc())
+
+            self.finished.emit(ret)
 
-                self.graph.step = cl1_range / (float(len(self.graph.sEdges)) * 2.0)
+        def clean_features(self, features, feature_count, settings=None):
+            settings = settings or self.settings
+            snap_threshold = settings['snap']
+            break_at_vertices = settings['break']
+            merge_type = settings['merge']
+            collinear_threshold = settings['collinear_angle']
+            angle_threshold = settings['simplification_threshold']
+            fix_unlinks = settings['fix_unlinks']
+            orphans = settings['orphans']
+            getUnlinks = settings['unlinks']
+            [load_range, cl1_range, cl2_range, cl3_range, break_range, merge_range, snap_range, unlinks_range,
+             fix_range] = settings['progress_ranges']
+
+            if not self.stage_pending('load'):
+                # restored from the checkpoint
+                self.graph.progress.connect(self.cl_progress.emit)
+                self.graph.total_progress = self.checkpoint['progress']
+                self.cl_progress.emit(self.graph.total_progress)
+                self.report.start_stage(graph=self.graph)
+
+            elif break_at_vertices and settings.get('compact'):
+
+                # the compact graph breaks the coordinates of the features, no feature graph is made
+                self.report.start_stage(feature_count)
+                self.graph = self.new_graph()
+                self.graph.progress.connect(self.cl_progress.emit)
+                self.graph.total_progress = 0
+                self.graph.step = load_range / float(feature_count)
+                polylines = self.graph.read_polylines(utf.clean_features_iter(features, settings.get('precision')))
+                QgsMessageLog.logMessage('polylines read %s' % load_range, level=Qgis.Critical)
+                self.report.end_stage('load', len(polylines[0]))
+                self.graph.step = break_range / float(max(len(polylines[0]), 1))
+                self.graph.load_broken_edges(polylines, angle_threshold)
+                del polylines
+                QgsMessageLog.logMessage('polylines broken %s' % break_range, level=Qgis.Critical)
+                self.report.end_stage('break', graph=self.graph)
+
+            elif break_at_vertices:
+
+                self.report.start_stage(feature_count)
+
+                self.pseudo_graph.step = load_range / float(feature_count)
+                self.pseudo_graph.total_progress = 0
+                self.pseudo_graph.progress.connect(self.cl_progress.emit)
+                self.graph = self.new_graph()
+                self.graph.total_progress = load_range
+                self.pseudo_graph.load_edges_w_o_topology(
+                    utf.clean_features_iter(features, settings.get('precision')))
+                QgsMessageLog.logMessage('pseudo_graph edges added %s' % load_range, level=Qgis.Critical)
+                self.report.end_stage('load', graph=self.pseudo_graph)
+                self.pseudo_graph.step = break_range / float(len(self.pseudo_graph.sEdges))
+                self.graph.load_edges(
+                    self.pseudo_graph.break_features_iter(getUnlinks, angle_threshold, fix_unlinks),
+                    angle_threshold)
+                QgsMessageLog.logMessage('pseudo_graph edges broken %s' % break_range, level=Qgis.Critical)
+                self.report.end_stage('break', graph=self.graph)
+                self.pseudo_graph.progress.disconnect()
+                self.graph.progress.connect(self.cl_progress.emit)
+                self.graph.total_progress = self.pseudo_graph.total_progress
+
+            else:
+                self.report.start_stage(feature_count)
+                self.graph = self.new_graph()
+                self.graph.progress.connect(self.cl_progress.emit)
+                self.graph.total_progress = 0
+                self.graph.step = load_range / float(feature_count)
+                self.graph.load_edges(utf.clean_features_iter(features, settings.get('precision')), angle_threshold)
+                QgsMessageLog.logMessage('graph edges added %s' % load_range, level=Qgis.Critical)
+                self.report.end_stage('load', graph=self.graph)
+            if self.stage_pending('load'):
+                self.stage_done('load')
+
+            if self.stage_pending('clean'):
+                self.graph.step = cl1_range / (float(self.graph.edge_count()) * 2.0)
                 if orphans:
                     self.graph.clean(True, False, snap_threshold, True)
                 else:
                     self.graph.clean(True, False, snap_threshold, False)
                 QgsMessageLog.logMessage('graph clean parallel and closed pl %s' % cl1_range, level=Qgis.Critical)
+                self.report.end_stage('clean', graph=self.graph)
+                self.stage_done('clean')
 
-                if fix_unlinks:
-                    self.graph.step = fix_range / float(len(self.graph.sEdges))
-                    self.graph.fix_unlinks()
-                    QgsMessageLog.logMessage('unlinks added  %s' % fix_range, level=Qgis.Critical)
+            if fix_unlinks and self.stage_pending('fix_unlinks'):
+                self.graph.step = fix_range / float(self.graph.edge_count())
+                self.graph.fix_unlinks()
+                QgsMessageLog.logMessage('unlinks added  %s' % fix_range, level=Qgis.Critical)
+                self.report.end_stage('fix_unlinks', graph=self.graph)
+                self.stage_done('fix_unlinks')
 
-                # TODO clean iteratively until no error
+            # TODO clean iteratively until no error
 
-                if snap_threshold != 0:
+            if snap_threshold != 0 and self.stage_pending('snap'):
 
-                    self.graph.step = snap_range / float(len(self.graph.sNodes))
-                    self.graph.snap_endpoints(snap_threshold)
-                    QgsMessageLog.logMessage('snap  %s' % snap_range, level=Qgis.Critical)
-                    self.graph.step = cl2_range / (float(len(self.graph.sEdges)) * 2.0)
+                self.graph.step = snap_range / float(self.graph.node_count())
+                self.graph.snap_endpoints(snap_threshold)
+                QgsMessageLog.logMessage('snap  %s' % snap_range, level=Qgis.Critical)
+                self.report.end_stage('snap', graph=self.graph)
+                self.graph.step = cl2_range / (float(self.graph.edge_count()) * 2.0)
 
-                    if orphans:
-                        self.graph.clean(True, False, snap_threshold, True)
-                    else:
-                        self.graph.clean(True, False, snap_threshold, False)
-                    QgsMessageLog.logMessage('clean   %s' % cl2_range, level=Qgis.Critical)
+                if orphans:
+                    self.graph.clean(True, False, snap_threshold, True)
+                else:
+                    self.graph.clean(True, False, snap_threshold, False)
+                QgsMessageLog.logMessage('clean   %s' % cl2_range, level=Qgis.Critical)
+                self.report.end_stage('snap_clean', graph=self.graph)
+                self.stage_done('snap')
 
-                if merge_type == 'intersections':
+            if merge_type == 'intersections' and self.stage_pending('merge'):
 
-                    self.graph.step = merge_range / float(len(self.graph.sNodes))
-                    self.graph.merge_b_intersections(angle_threshold)
-                    QgsMessageLog.logMessage('merge %s %s angle_threshold ' % (merge_range, angle_threshold),
-                                             level=Qgis.Critical)
+                self.graph.step = merge_range / float(self.graph.node_count())
+                self.graph.merge_b_intersections(angle_threshold)
+                QgsMessageLog.logMessage('merge %s %s angle_threshold ' % (merge_range, angle_threshold),
+                                         level=Qgis.Critical)
+                self.report.end_stage('merge', graph=self.graph)
+                self.stage_done('merge')
 
-                elif merge_type == 'collinear':
+            elif merge_type == 'collinear' and self.stage_pending('merge'):
 
-                    self.graph.step = merge_range / float(len(self.graph.sEdges))
-                    self.graph.merge_collinear(collinear_threshold, angle_threshold)
-                    QgsMessageLog.logMessage('merge  %s' % merge_range, level=Qgis.Critical)
+                self.graph.step = merge_range / float(self.graph.edge_count())
+                self.graph.merge_collinear(collinear_threshold, angle_threshold)
+                QgsMessageLog.logMessage('merge  %s' % merge_range, level=Qgis.Critical)
+                self.report.end_stage('merge', graph=self.graph)
+                self.stage_done('merge')
 
-                # cleaned multiparts so that unlinks are generated properly
+            # cleaned multiparts so that unlinks are generated properly
+            if self.stage_pending('final_clean'):
                 if orphans:
-                    self.graph.step = cl3_range / (float(len(self.graph.sEdges)) * 2.0)
+                    self.graph.step = cl3_range / (float(self.graph.edge_count()) * 2.0)
                     self.graph.clean(True, orphans, snap_threshold, False, True)
                     QgsMessageLog.logMessage('clean  %s' % cl3_range, level=Qgis.Critical)
                 else:
-                    self.graph.step = cl3_range / (float(len(self.graph.sEdges)) * 2.0)
+                    self.graph.step = cl3_range / (float(self.graph.edge_count()) * 2.0)
                     self.graph.clean(True, False, snap_threshold, False, True)
                     QgsMessageLog.logMessage('clean %s' % cl3_range, level=Qgis.Critical)
+                self.report.end_stage('final_clean', graph=self.graph)
+                self.stage_done('final_clean')
 
-                if getUnlinks:
-                    self.graph.step = unlinks_range / float(len(self.graph.sEdges))
+            if getUnlinks:
+                if self.stage_pending('unlinks'):
+                    self.graph.step = unlinks_range / float(self.graph.edge_count())
                     self.graph.generate_unlinks()
                     QgsMessageLog.logMessage('unlinks generated %s' % unlinks_range, level=Qgis.Critical)
-                    unlinks = self.graph.unlinks
-                else:
-                    unlinks = []
-
-                cleaned_features = [e.feature for e in list(self.graph.sEdges.values())]
-                # add to errors multiparts and points
-                self.graph.errors += utf.multiparts
-                self.graph.errors += utf.points
-
-                if is_debug:
-                    print("survived!")
-                self.graph.progress.disconnect()
-                self.cl_progress.emit(95)
-                # return cleaned data, errors and unlinks
-                ret = cleaned_features, self.graph.errors, unlinks
-
-            except Exception as e:
-                # forward the exception upstream
-                self.error.emit(e, traceback.format_exc())
-
-            self.finished.emit(ret)
+                    self.report.end_stage('unlinks', graph=self.graph)
+                    self.stage_done('unlinks')
+                unlinks = utf.FeatureStream(len(self.graph.unlinks), self.graph.unlink_features)
+            else:
+                unlinks = []
+
+            # edge features are made while they are written to the output
+            cleaned_features = self.graph.edge_features()
+            # add to errors multiparts and points, error features are made while they are written to the output
+            errors = utf.FeatureStream(len(self.graph.errors) + len(utf.multiparts) + len(utf.points),
+                                       self.graph.error_features, list(utf.multiparts), list(utf.points))
+
+            self.graph.progress.disconnect()
+            # return cleaned data, errors and unlinks
+            return cleaned_features, errors, unlinks
+
+        def scan_features(self, layer):
+            # read-only pre-flight check: the input is read once and only the errors are returned
+            self.report.start_stage(layer.featureCount())
+            del utf.points[:]
+            del utf.multiparts[:]
+            polylines = []
+            step = 50.0 / max(layer.featureCount(), 1)
+            for f in utf.clean_features_iter(layer.getFeatures(), self.settings.get('precision')):
+                if self.cl_killed is True:
+                    return None
+                polylines.append([(p.x(), p.y()) for p in f.geometry().asPolyline()])
+                self.cl_progress.emit(len(polylines) * step)
+
+            errors = []
+            for x, y, error_type in network_scan.scan_polylines(polylines, self.settings['snap'],
+                                                                self.coordinate_grid):
+                err_f = QgsFeature(utf.error_feat)
+                err_f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+                err_f.setAttributes([error_type])
+                errors.append(err_f)
+            errors += utf.multiparts + utf.points
+            QgsMessageLog.logMessage('Network scan %s: %s' % (layer.name(), ', '.join(
+                '%s %s' % count for count in sorted(Counter(f.attributes()[0] for f in errors).items()))),
+                                     level=Qgis.Info)
+            self.report.end_stage('scan', len(polylines))
+            return [], errors, []
+
+        def clean_incremental(self, layer):
+            # only the edited parts of the network are cleaned again, the rest comes from the previous run
+            path = incremental_cleaning.state_path(layer, self.settings)
+            state = incremental_cleaning.load_state(path)
+            features = dict((f.id(), f) for f in layer.getFeatures())
+            digests = dict((fid, incremental_cleaning.feature_digest(f)) for fid, f in list(features.items()))
+
+            if state is None:
+                cleaned_features, errors, unlinks = self.clean_features((QgsFeature(f) for f in list(features.values())),
+                                                                        len(features))
+                cleaned_features = list(cleaned_features)
+                sources = incremental_cleaning.edge_sources(cleaned_features, [(f.geometry(), [fid]) for fid, f in
+                                                                               list(features.items())])
+                edges = dict(enumerate(cleaned_features))
+                edge_sources = dict(enumerate(sources))
+            else:
+                edited = set(fid for fid, digest in list(digests.items()) if state['digests'].get(fid) != digest)
+                edited.update(set(state['digests']) - set(digests))
+                QgsMessageLog.logMessage('edited features %s' % len(edited), level=Qgis.Info)
+                edges = dict((key, feature_packing.unpack_feature(packed, QgsFeature(layer.fields()))) for key, packed in
+                             list(state['edges'].items()))
+                edge_sources = state['edge_sources']
+                errors = [feature_packing.unpack_feature(packed, QgsFeature(utf.error_feat)) for packed in
+                          state['errors']]
+                unlinks = [feature_packing.unpack_feature(packed, QgsFeature(unlink_feat)) for packed in
+                           state['unlinks']]
+                if len(edited) > 0:
+                    errors, unlinks = self.clean_edited(features, edited, edges, edge_sources, errors, unlinks)
+                cleaned_features = list(edges.values())
+
+            incremental_cleaning.save_state(path, {
+                'digests': digests,
+                'edges': dict((key, feature_packing.pack_feature(f)) for key, f in list(edges.items())),
+                'edge_sources': edge_sources,
+                'errors': [feature_packing.pack_feature(f) for f in errors],
+                'unlinks': [feature_packing.pack_feature(f) for f in unlinks]})
+            return cleaned_features, errors, unlinks
+
+        # updates edges and edge_sources in place
+        def clean_edited(self, features, edited, edges, edge_sources, errors, unlinks):
+            snap_threshold = self.settings['snap']
+            dirty_edges, source_fids = incremental_cleaning.affected_edges(edge_sources, edited)
+            region_features = [features[fid] for fid in source_fids if fid in features]
+            dirty_geometries = [edges[key].geometry() for key in dirty_edges]
+            for key in dirty_edges:
+                del edges[key]
+                del edge_sources[key]
+
+            # the edges around the edits are cleaned again too, to be broken, snapped and merged with them
+            context_edges = incremental_cleaning.features_near(
+                edges, [f.geometry() for f in region_features] + dirty_geometries, snap_threshold)
+            candidates = [(f.geometry(), [f.id()]) for f in region_features] + [
+                (edges[key].geometry(), edge_sources[key]) for key in context_edges]
+            region_input = [QgsFeature(f) for f in region_features] + [QgsFeature(edges[key]) for key in context_edges]
+            QgsMessageLog.logMessage('re-cleaning features %s edges %s' % (len(region_features), len(context_edges)),
+                                     level=Qgis.Info)
+
+            # orphans are found once the edges are put back together
+            region_cleaned, region_errors, region_unlinks = [], [], []
+            if len(region_input) > 0:
+                del utf.points[:]
+                del utf.multiparts[:]
+                region_cleaned, region_errors, region_unlinks = self.clean_features(
+                    iter(region_input), len(region_input), settings=dict(self.settings, orphans=False))
+                region_cleaned = list(region_cleaned)
+                region_errors = list(region_errors)
+                region_unlinks = list(region_unlinks)
+            region_sources = incremental_cleaning.edge_sources(region_cleaned, candidates)
+
+            replaced_geometries = dirty_geometries + [edges[key].geometry() for key in context_edges]
+            for key in context_edges:
+                del edges[key]
+                del edge_sources[key]
+            next_key = max(list(edges.keys()) + list(dirty_edges) + list(context_edges) + [-1]) + 1
+            region_keys = list(range(next_key, next_key + len(region_cleaned)))
+            edges.update(zip(region_keys, region_cleaned))
+            edge_sources.update(zip(region_keys, region_sources))
+
+            # errors and unlinks of the replaced edges
+            replaced_errors = incremental_cleaning.features_near(dict(enumerate(errors)), replaced_geometries,
+                                                                 snap_threshold)
+            errors = [f for idx, f in enumerate(errors) if idx not in replaced_errors] + region_errors
+            replaced_unlinks = incremental_cleaning.features_near(dict(enumerate(unlinks)), dirty_geometries,
+                                                                  snap_threshold)
+            unlinks = [f for idx, f in enumerate(unlinks) if idx not in replaced_unlinks]
+            unlink_points = set(f.geometry().asPoint() for f in unlinks)
+            unlinks += [f for f in region_unlinks if f.geometry().asPoint() not in unlink_points]
+            # the ids of the region unlinks start at 0 again
+            for unlinks_id, un_f in enumerate(unlinks):
+                un_f.setId(unlinks_id)
+                un_f.setAttributes([unlinks_id])
+
+            if self.settings['orphans']:
+                for key in incremental_cleaning.orphan_edges(edges, region_keys):
+                    coords = incremental_cleaning.geometry_coords(edges[key].geometry())
+                    for p in set([coords[0], coords[-1]]):
+                        err_f = QgsFeature(utf.error_feat)
+                        err_f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(*p)))
+                        err_f.setAttributes(['orphan'])
+                        errors.append(err_f)
+                    del edges[key]
+                    del edge_sources[key]
+            return errors, unlinks
+
+        def resume_checkpoint(self, layer):
+            self.checkpoint_path = stage_checkpoints.checkpoint_path(layer, self.settings)
+            self.checkpoint = stage_checkpoints.load_checkpoint(self.checkpoint_path)
+            if self.checkpoint is None:
+                return
+            QgsMessageLog.logMessage('resuming after stage %s' % self.checkpoint['stage'], level=Qgis.Critical)
+            self.report.start_stage()
+            self.graph = self.new_graph()
+            self.graph.restore(self.checkpoint['graph'], layer.fields())
+            self.report.end_stage('restore', graph=self.graph)
+            utf.points[:] = [feature_packing.unpack_feature(packed, QgsFeature(utf.error_feat)) for packed in
+                             self.checkpoint['points']]
+            utf.multiparts[:] = [feature_packing.unpack_feature(packed, QgsFeature(utf.error_feat)) for packed in
+                                 self.checkpoint['multiparts']]
+
+        def stage_pending(self, stage):
+            return stage_checkpoints.stage_pending(self.checkpoint, stage)
+
+        def stage_done(self, stage):
+            # a stage interrupted by a cancel is not saved
+            if self.checkpoint_path is None or self.cl_killed:
+                return
+            self.checkpoint = {'stage': stage,
+                               'progress': self.graph.total_progress,
+                               'graph': self.graph.snapshot(),
+                               'points': [feature_packing.pack_feature(f) for f in utf.points],
+                               'multiparts': [feature_packing.pack_feature(f) for f in utf.multiparts]}
+            stage_checkpoints.save_checkpoint(self.checkpoint_path, self.checkpoint)
+
+        def new_graph(self):
+            # the compact graph keeps topology in arrays and only creates features for the outputs
+            if self.settings.get('compact'):
+                graph = sCompactGraph()
+            else:
+                graph = sGraph({}, {})
+            graph.coordinate_grid = self.coordinate_grid
+            return graph
 
         def kill(self):
             self.cl_killed = True
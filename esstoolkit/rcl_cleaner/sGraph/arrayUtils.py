@@ -0,0 +1,13 @@
+# general imports
+import numpy as np
+
+
+# helpers of the growable numpy arrays of the topology and the point stores
+
+# returns array, or a copy of it with room for index size, doubling its length
+def grow(array, size):
+    if size < len(array):
+        return array
+    new_array = np.zeros(max(size + 1, 2 * len(array)), dtype=array.dtype)
+    new_array[:len(array)] = array
+    return new_array
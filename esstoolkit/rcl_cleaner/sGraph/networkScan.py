@@ -0,0 +1,78 @@
+# general imports
+from collections import defaultdict
+
+import numpy as np
+
+# plugin module imports
+try:
+    from . import spatialHash as spatial_hash
+except ImportError:
+    pass
+
+
+# read-only detection of the errors the cleaner would fix, on the coordinates of the polylines
+# polylines are broken at their common vertices (broken), pieces with the same geometry are duplicates if they are
+# whole polylines or overlaps if they are parts of them, pieces that touch nothing else are orphans and
+# endpoints within the snap threshold of other endpoints are unsnapped (snapped)
+# returns [(x, y, error_type)]
+
+def node_key(grid, x, y):
+    if grid is None:
+        return x, y
+    return spatial_hash.coordinate_key(grid, x, y)
+
+
+def split_polyline(polyline, break_positions, grid=None):
+    if len(break_positions) == 0:
+        return [polyline]
+    break_points = set(node_key(grid, *polyline[idx]) for idx in break_positions)
+    # every occurrence of a break point splits the polyline, not only the first
+    splits = [idx for idx in range(1, len(polyline) - 1) if node_key(grid, *polyline[idx]) in break_points]
+    bounds = [0] + splits + [len(polyline) - 1]
+    return [polyline[start:end + 1] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def scan_polylines(polylines, snap_threshold, grid=None):
+    polylines = [[(float(x), float(y)) for x, y in polyline] for polyline in polylines]
+    errors = []
+
+    break_vertices = spatial_hash.common_vertices(polylines, grid)
+    pieces = []
+    for polyline, positions in zip(polylines, break_vertices):
+        errors += [polyline[idx] + ('broken',) for idx in positions]
+        polyline_pieces = split_polyline(polyline, positions, grid)
+        pieces += [(piece, len(polyline_pieces) == 1) for piece in polyline_pieces]
+
+    # duplicates and overlaps, the first piece of every geometry is kept
+    spacing = grid[0] if grid is not None else None
+    kept_pieces = {}
+    for piece, whole in pieces:
+        fingerprint = spatial_hash.geometry_fingerprint([piece], spacing)
+        if fingerprint not in kept_pieces:
+            kept_pieces[fingerprint] = piece, whole
+        else:
+            error_type = 'duplicate' if whole and kept_pieces[fingerprint][1] else 'overlap'
+            errors += [point + (error_type,) for point in set([piece[0], piece[-1]])]
+    pieces = [piece for piece, whole in list(kept_pieces.values())]
+
+    # pieces at every endpoint
+    node_pieces = defaultdict(set)
+    node_points = {}
+    for idx, piece in enumerate(pieces):
+        for point in (piece[0], piece[-1]):
+            key = node_key(grid, *point)
+            node_pieces[key].add(idx)
+            node_points.setdefault(key, point)
+
+    for idx, piece in enumerate(pieces):
+        ends = set([node_key(grid, *piece[0]), node_key(grid, *piece[-1])])
+        if all(node_pieces[key] == set([idx]) for key in ends):
+            errors += [node_points[key] + ('orphan',) for key in ends]
+
+    if snap_threshold > 0 and len(node_points) > 0:
+        points = list(node_points.values())
+        coords = np.array(points, dtype=np.float64).reshape(-1, 2)
+        neighbours = spatial_hash.snap_neighbours(np.arange(len(points)), coords[:, 0], coords[:, 1],
+                                                  snap_threshold)
+        errors += [points[idx] + ('snapped',) for idx in sorted(neighbours)]
+    return errors
@@ -0,0 +1,83 @@
+# general imports
+import numpy as np
+
+# plugin module imports
+try:
+    from .arrayUtils import grow
+except ImportError:
+    pass
+
+
+# columnar store of the error and unlink points of a graph
+# every point is a row of growable arrays (x, y, type code, id of the edge it comes from, -1 if none)
+# a point is recorded once per location and type, and features are only made from the rows when they are written
+
+point_types = ('broken', 'snapped', 'duplicate', 'multipart', 'orphan', 'merged', 'point', 'unlink')
+type_codes = dict((point_type, code) for code, point_type in enumerate(point_types))
+
+
+class PointStore(object):
+
+    def __init__(self, capacity=1024):
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.code = np.zeros(capacity, dtype=np.int8)
+        self.edge = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        # (x, y) -> bit mask of the types recorded at the location
+        self.locations = {}
+
+    def __len__(self):
+        return self.count
+
+    # returns False if the point is already recorded
+    def add(self, x, y, point_type, edge=-1):
+        # + 0.0 so that -0.0 and 0.0 are the same location
+        location = (x + 0.0, y + 0.0)
+        mask = self.locations.get(location, 0)
+        bit = 1 << type_codes[point_type]
+        if mask & bit:
+            return False
+        self.locations[location] = mask | bit
+        if self.count >= len(self.x):
+            self.x = grow(self.x, self.count)
+            self.y = grow(self.y, self.count)
+            self.code = grow(self.code, self.count)
+            self.edge = grow(self.edge, self.count)
+        self.x[self.count] = x
+        self.y[self.count] = y
+        self.code[self.count] = type_codes[point_type]
+        self.edge[self.count] = edge
+        self.count += 1
+        return True
+
+    def add_many(self, xs, ys, point_type, edges=None):
+        if edges is None:
+            edges = [-1] * len(xs)
+        for x, y, edge in zip(xs, ys, edges):
+            self.add(x, y, point_type, edge)
+        return
+
+    # (x, y, type, edge) of every point, in the order they were recorded
+    def rows(self):
+        for x, y, code, edge in zip(self.x[:self.count].tolist(), self.y[:self.count].tolist(),
+                                    self.code[:self.count].tolist(), self.edge[:self.count].tolist()):
+            yield x, y, point_types[code], edge
+
+    def type_counts(self):
+        counts = np.bincount(self.code[:self.count], minlength=len(point_types))
+        return dict((point_type, int(count)) for point_type, count in zip(point_types, counts) if count > 0)
+
+    # SNAPSHOTS -----------------------------------------------------------------
+
+    def state(self):
+        return {'x': self.x[:self.count].copy(), 'y': self.y[:self.count].copy(),
+                'code': self.code[:self.count].copy(), 'edge': self.edge[:self.count].copy()}
+
+    @classmethod
+    def from_state(cls, state):
+        store = cls(max(len(state['x']), 1))
+        for x, y, code, edge in zip(state['x'].tolist(), state['y'].tolist(), state['code'].tolist(),
+                                    state['edge'].tolist()):
+            store.add(x, y, point_types[code], edge)
+        return store
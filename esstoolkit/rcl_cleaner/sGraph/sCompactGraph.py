@@ -0,0 +1,608 @@
+from __future__ import absolute_import
+
+import copy
+import itertools
+# general imports
+from builtins import zip
+
+import numpy as np
+from qgis.PyQt.QtCore import QObject
+from qgis.core import (QgsGeometry, QgsSpatialIndex, QgsFeature, QgsMessageLog, Qgis, QgsWkbTypes, QgsPointXY,
+                       QgsRectangle, NULL)
+
+# plugin module imports
+try:
+    from . import networkScan as network_scan
+    from . import segmentCrossings as segment_crossings
+    from . import spatialHash as spatial_hash
+    from . import utilityFunctions as uf
+    from .sGraph import sGraph, point_features
+    from .sTopology import sTopology
+    from .pointStore import PointStore
+except ImportError:
+    pass
+
+
+# low memory alternative to sGraph
+# nodes and edges are integer ids in the arrays of an sTopology, geometries and attributes are kept in its side tables
+# and features are only created when the results are requested (edge_features, error_features, unlink_features)
+# errors and unlinks are kept in point stores, as in sGraph
+# the cleaning methods follow the ones of sGraph step by step so that both give the same results
+
+
+def as_coords(polyline):
+    return np.array([(p.x(), p.y()) for p in polyline], dtype=np.float64)
+
+
+def as_polyline(coords):
+    return [QgsPointXY(x, y) for x, y in coords.tolist()]
+
+
+class sCompactGraph(sGraph):
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.topology = sTopology()
+        self.fields = None
+        self.total_progress = 0
+        self.step = 0
+        self.coordinate_grid = None
+
+        self.errors = PointStore()
+        self.unlinks = PointStore()
+
+    def edge_count(self):
+        return self.topology.edges_count
+
+    def node_count(self):
+        return self.topology.nodes_count
+
+    def edge_geometry(self, e):
+        parts = self.topology.edge_parts(e)
+        if isinstance(self.topology.geometries[e], list):
+            return QgsGeometry.fromMultiPolylineXY([as_polyline(part) for part in parts])
+        return QgsGeometry.fromPolylineXY(as_polyline(parts[0]))
+
+    def set_edge_geometry(self, e, geometry):
+        if geometry.isMultipart():
+            self.topology.geometries[e] = [as_coords(pl) for pl in geometry.asMultiPolyline()]
+        else:
+            self.topology.geometries[e] = as_coords(geometry.asPolyline())
+        return
+
+    def edge_rectangle(self, e):
+        return QgsRectangle(*self.topology.edge_bounds(e))
+
+    def node_point(self, n):
+        return QgsPointXY(*self.topology.node_coords(n))
+
+    def add_error(self, n, error_type, edge=-1):
+        self.errors.add(*(self.topology.node_coords(n) + (error_type, edge)))
+        return
+
+    # graph from feat iter
+    # updates the id
+    def load_edges(self, feat_iter, angle_threshold):
+
+        for f in feat_iter:
+
+            if self.killed is True:
+                break
+
+            # add edge
+            if self.fields is None:
+                self.fields = f.fields()
+            self.add_polyline_edge(f.geometry(), f.attributes(), angle_threshold)
+
+        self.topology.rebuild_adjacency()
+        return
+
+    def add_polyline_edge(self, geometry, attributes, angle_threshold):
+        geometry_pl = geometry.simplify(angle_threshold).asPolyline()
+        (x1, y1), (x2, y2) = geometry_pl[0], geometry_pl[-1]
+        start = self.topology.load_point(x1, y1, self.node_key(x1, y1))
+        end = self.topology.load_point(x2, y2, self.node_key(x2, y2))
+        self.topology.add_edge(start, end, as_coords(geometry_pl), attributes)
+        return
+
+    # coordinates and attributes of the clean features, read once so that no feature is kept
+    # returns (ids, polylines, attributes)
+    def read_polylines(self, clean_feat_iter):
+        ids, polylines, attributes = [], [], []
+        for f in clean_feat_iter:
+
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            if self.fields is None:
+                self.fields = f.fields()
+            ids.append(f.id())
+            polylines.append(as_coords(f.geometry().asPolyline()))
+            attributes.append(f.attributes())
+        return ids, polylines, attributes
+
+    # graph from read_polylines, broken at self intersections and common vertices as in sGraph.break_features_iter
+    # but on the coordinate arrays, the pieces go straight to the topology
+    def load_broken_edges(self, polylines, angle_threshold):
+        ids, polylines, attributes = polylines
+        break_vertices = spatial_hash.common_vertices(polylines, self.coordinate_grid)
+
+        for fid, coords, attrs, vertices in zip(ids, polylines, attributes, break_vertices):
+
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            for idx in vertices:
+                self.errors.add(coords[idx, 0], coords[idx, 1], 'broken', fid)
+            for piece in network_scan.split_polyline(coords, vertices, self.coordinate_grid):
+                geometry = QgsGeometry.fromPolylineXY(as_polyline(piece))
+                # simplified when broken, as the features of sGraph.break_features_iter, and when loaded
+                if angle_threshold is not None:
+                    geometry = geometry.simplify(angle_threshold)
+                self.add_polyline_edge(geometry, list(attrs), angle_threshold)
+
+        self.topology.rebuild_adjacency()
+        return
+
+    def remove_edge(self, nodes, e):
+        self.topology.remove_edge(e)
+        return
+
+    def delete_node(self, node_id):
+        self.topology.remove_node(node_id)
+        return True
+
+    def fix_unlinks(self):
+
+        topology = self.topology
+        edgeSpIndex = QgsSpatialIndex()
+        self.step = self.step / 2.0
+
+        for e in topology.edge_ids().tolist():
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            edgeSpIndex.addFeature(e, self.edge_rectangle(e))
+
+        for e in topology.edge_ids().tolist():
+
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            f_geom = self.edge_geometry(e)
+            pl = f_geom.asPolyline()
+            lines = [line for line in edgeSpIndex.intersects(f_geom.boundingBox()) if line != e]
+            lines = [line for line in lines if f_geom.crosses(self.edge_geometry(line))]
+            for line in lines:
+                crossing_points = f_geom.intersection(self.edge_geometry(line))
+                if crossing_points.type() == QgsWkbTypes.PointGeometry:
+                    if not crossing_points.isMultipart():
+                        crossing_points = [crossing_points.asPoint()]
+                    else:
+                        crossing_points = crossing_points.asMultiPoint()
+                    for p in crossing_points:
+                        if p in pl[1:-1]:
+                            topology.geometries[e][pl.index(p)] = (p.x() + 1, p.y() + 1)
+
+        return
+
+    # find nodes within x distance
+    def snap_neighbours_index(self, snap_threshold):
+        topology = self.topology
+        nodes = topology.node_ids()
+        ndSpIndex = QgsSpatialIndex()
+        for n in nodes.tolist():
+            x, y = topology.node_coords(n)
+            ndSpIndex.addFeature(n, QgsRectangle(x, y, x, y))
+        filtered_nodes = {}
+        for n in nodes.tolist():
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            x, y = topology.node_coords(n)
+            candidates = np.array([nd for nd in ndSpIndex.intersects(
+                QgsRectangle(x - snap_threshold, y - snap_threshold, x + snap_threshold, y + snap_threshold)) if
+                nd != n], dtype=np.int64)
+            if len(candidates) > 0:
+                distances = np.hypot(topology.node_x[candidates] - x, topology.node_y[candidates] - y)
+                candidates = candidates[distances <= snap_threshold]
+            if len(candidates) > 0:
+                filtered_nodes[n] = candidates.tolist()
+        return filtered_nodes
+
+    # find nodes within x distance - node coordinates hashed into a grid with cell size = snap threshold
+    def snap_neighbours_grid(self, snap_threshold):
+        nodes = self.topology.node_ids()
+        filtered_nodes = spatial_hash.snap_neighbours(nodes, self.topology.node_x[nodes], self.topology.node_y[nodes],
+                                                      snap_threshold)
+
+        self.total_progress += self.step * len(nodes)
+        self.progress.emit(self.total_progress)
+        return filtered_nodes
+
+    # group points based on proximity
+    def snap_endpoints(self, snap_threshold, grid_snapping=True):
+        QgsMessageLog.logMessage('starting snapping', level=Qgis.Critical)
+        topology = self.topology
+        self.step = self.step / float(2)
+        if grid_snapping:
+            filtered_nodes = self.snap_neighbours_grid(snap_threshold)
+        else:
+            filtered_nodes = self.snap_neighbours_index(snap_threshold)
+
+        QgsMessageLog.logMessage('continuing snapping', level=Qgis.Critical)
+        self.step = (len(filtered_nodes) * self.step) / float(topology.nodes_count)
+        for group in self.con_comp_iter(filtered_nodes):
+
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            group_set = set(group)
+
+            # find con_edges
+            con_edges = set(itertools.chain.from_iterable([topology.node_edges(node) for node in group]))
+
+            # collapse nodes to node
+            merged_node_id = self.collapse_to_node(group)
+
+            # update connected edges and their topology
+            for edge in con_edges:
+                start, end = topology.edge_nodes(edge)
+                # if existing self loop
+                if start == end:
+                    if topology.edge_length(edge) <= snap_threshold:  # short self-loop
+                        topology.remove_edge(edge)
+                    else:
+                        topology.replace_start(edge, merged_node_id)
+                        topology.replace_end(edge, merged_node_id)
+                # if becoming self loop (if one intermediate vertex - turns back on itself)
+                elif start in group_set and end in group_set:
+                    if topology.edge_vertex_count(edge) <= 3 or topology.edge_length(edge) <= snap_threshold:
+                        topology.remove_edge(edge)
+                    else:
+                        topology.replace_start(edge, merged_node_id)
+                        topology.replace_end(edge, merged_node_id)
+                # if only start
+                elif start in group_set:
+                    topology.replace_start(edge, merged_node_id)
+                # if only end
+                elif end in group_set:
+                    topology.replace_end(edge, merged_node_id)
+
+            # errors
+            for node in group:
+                self.add_error(node, 'snapped')
+
+            # delete old nodes
+            for node in group:
+                topology.remove_node(node)
+
+        return
+
+    def collapse_to_node(self, group):
+        # centroid of the group
+        return self.topology.add_node(float(np.mean(self.topology.node_x[group])),
+                                      float(np.mean(self.topology.node_y[group])))
+
+    def edge_fingerprint(self, e):
+        spacing = self.coordinate_grid[0] if self.coordinate_grid is not None else None
+        return frozenset(self.topology.edge_nodes(e)), spatial_hash.geometry_fingerprint(
+            self.topology.edge_parts(e), spacing)
+
+    def clean_dupl(self, group_edges, snap_threshold, parallel=False):
+
+        kept_edges = {}
+        for e in group_edges:
+
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            fingerprint = self.edge_fingerprint(e)
+            if fingerprint not in kept_edges:
+                kept_edges[fingerprint] = e
+                continue
+            # delete line
+            for n in set(self.topology.edge_nodes(e)):
+                self.add_error(n, 'duplicate', e)
+            self.topology.remove_edge(e)
+        return
+
+    def clean_multipart(self, e):
+
+        self.total_progress += self.step
+        self.progress.emit(self.total_progress)
+
+        # only used in the last cleaning iteration - exploded edges are not added to the nodes
+        for singlepart in self.topology.edge_parts(e):
+            self.topology.add_edge(0, 0, singlepart, list(self.topology.attributes[e]))
+            for x, y in singlepart.tolist():
+                self.errors.add(x, y, 'multipart', e)
+
+        self.topology.remove_edge(e)
+        return
+
+    def clean_orphan(self, e):
+
+        self.total_progress += self.step
+        self.progress.emit(self.total_progress)
+
+        topology = self.topology
+        nds = topology.edge_nodes(e)
+        # connectivity of both endpoints 1
+        if len(set(topology.node_topology(nds[0]))) == len(set(topology.node_topology(nds[1]))) == 1 and len(
+                set(topology.node_edges(nds[0]))) == 1:
+            topology.remove_edge(e)
+            for nd in set(nds):
+                self.add_error(nd, 'orphan', e)
+                topology.remove_node(nd)
+        return True
+
+    def clean(self, duplicates, orphans, snap_threshold, closed_polylines, multiparts=False):
+        topology = self.topology
+        # clean duplicates - edges with the same geometry in any direction
+        step_original = float(self.step)
+        if duplicates:
+            self.clean_dupl(topology.edge_ids().tolist(), snap_threshold, False)
+
+        self.step = step_original
+        # clean orphans
+        if orphans:
+            for e in topology.edge_ids().tolist():
+
+                if self.killed is True:
+                    break
+
+                self.total_progress += self.step
+                self.progress.emit(self.total_progress)
+
+                self.clean_orphan(e)
+
+        # clean orphan closed polylines
+        elif closed_polylines:
+
+            for e in topology.edge_ids().tolist():
+
+                if self.killed is True:
+                    break
+
+                self.total_progress += self.step
+                self.progress.emit(self.total_progress)
+
+                if topology.edge_start[e] == topology.edge_end[e]:
+                    self.clean_orphan(e)
+
+        # break multiparts
+        if multiparts:
+            for e in topology.edge_ids().tolist():
+
+                if self.killed is True:
+                    break
+
+                self.total_progress += self.step
+                self.progress.emit(self.total_progress)
+
+                if isinstance(topology.geometries[e], list):
+                    self.clean_multipart(e)
+
+        return
+
+    # merge
+
+    def merge_b_intersections(self, angle_threshold):
+
+        # special cases: merge parallels (becomes orphan)
+        # do not merge two parallel self loops
+
+        edges_passed = set([])
+
+        for e in self.edge_edges_iter():
+            if {e}.isdisjoint(edges_passed) and self.topology.edge_alive[e]:
+                edges_passed.update({e})
+                group_nodes, group_edges = self.route_polylines(e)
+                if group_edges:
+                    edges_passed.update({group_edges[-1]})
+                    self.merge_edges(group_nodes, group_edges, angle_threshold)
+        return
+
+    def merge_collinear(self, collinear_threshold, angle_threshold=0):
+
+        topology = self.topology
+        filtered_nodes = {}
+        for n in topology.node_ids().tolist():
+            con_nodes, con_edges = topology.node_topology(n), topology.node_edges(n)
+            if len(con_nodes) == 2 and len(con_edges) == 2 and uf.angle_3_points(
+                    self.node_point(con_nodes[0]), self.node_point(n),
+                    self.node_point(con_nodes[1])) <= collinear_threshold:
+                filtered_nodes[n] = con_edges
+        filtered_edges = {}
+        for k, v in list(filtered_nodes.items()):
+            try:
+                filtered_edges[v[0]].append(v[1])
+            except KeyError:
+                filtered_edges[v[0]] = [v[1]]
+            try:
+                filtered_edges[v[1]].append(v[0])
+            except KeyError:
+                filtered_edges[v[1]] = [v[0]]
+
+        self.step = (len(filtered_edges) * self.step) / float(topology.edges_count)
+
+        for group in self.collinear_comp_iter(filtered_edges):
+            nodes = [topology.edge_nodes(e) for e in group]
+            for idx, pair in enumerate(nodes[:-1]):
+                if pair[0] in nodes[idx + 1]:
+                    nodes[idx] = pair[::-1]
+            if nodes[-1][1] in nodes[-2]:
+                nodes[-1] = nodes[-1][::-1]
+            nodes = [n[0] for n in nodes] + [nodes[-1][-1]]
+            self.merge_edges(nodes, group, angle_threshold)
+        return
+
+    def edge_edges_iter(self):
+        # what if two parallel edges at the edge - should become self loop
+        for nd in self.topology.node_ids().tolist():
+
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
+
+            if not self.topology.node_alive[nd]:
+                continue
+            con_edges = self.topology.node_edges(nd)
+            if len(con_edges) != 2:  # not set to include parallels and self loops
+                for e in con_edges:
+                    yield e
+
+    def route_polylines(self, startedge):
+        topology = self.topology
+        # if edge has been passed
+        startnode, endnode = topology.edge_nodes(startedge)
+        if len(topology.node_edges(endnode)) != 2:  # not set to account for self loops
+            startnode, endnode = endnode, startnode
+        group_nodes = [startnode, endnode]
+        group_edges = [startedge]
+        while len(set(topology.node_edges(group_nodes[-1]))) == 2:
+            last_visited = group_nodes[-1]
+            if last_visited in topology.node_topology(last_visited):  # to account for self loops
+                break
+            con_edge = set(topology.node_edges(last_visited)).difference(set(group_edges)).pop()
+            con_node = topology.other_node(con_edge, last_visited)
+            group_nodes.append(con_node)
+            group_edges.append(con_edge)
+        if len(group_nodes) > 2:
+            return group_nodes, group_edges
+        else:
+            return None, None
+
+    def generate_unlinks(self):  # for osm or other
+
+        # crossings of all edges at once, on their coordinates (shared vertices are not crossings)
+        topology = self.topology
+        edges = topology.edge_ids().tolist()
+        # multipart edges (lists of parts) are split in the last cleaning
+        polylines = [topology.geometries[e] if not isinstance(topology.geometries[e], list) else [] for e in edges]
+        xs, ys, edges1, edges2 = segment_crossings.crossings(edges, polylines)
+        self.unlinks.add_many(xs.tolist(), ys.tolist(), 'unlink')
+
+        self.total_progress += self.step * len(edges)
+        self.progress.emit(self.total_progress)
+        return
+
+    def merge_edges(self, group_nodes, group_edges, angle_threshold):
+
+        topology = self.topology
+        geoms = [self.edge_geometry(e) for e in group_edges]
+        lengths = [g.length() for g in geoms]
+        max_len = max(lengths)
+
+        # attributes from longest
+        attributes = topology.attributes[group_edges[lengths.index(max_len)]]
+        # chain coordinates in node order, concatenated once
+        polylines = [topology.geometries[e] for e in group_edges]
+        merged_points = None
+        if not any(isinstance(polyline, list) for polyline in polylines):
+            merged_points = uf.merge_polylines(polylines, [topology.node_coords(n) for n in group_nodes[:-1]])
+        selfloop_point = self.node_point(group_nodes[0])
+        if merged_points is not None:
+            merged_geom = QgsGeometry.fromPolylineXY(as_polyline(np.asarray(merged_points)))
+            if angle_threshold != 0:
+                merged_geom = merged_geom.simplify(angle_threshold)
+            p0 = QgsPointXY(*merged_points[0])
+        else:
+            # edges not continuous in node order
+            merged_geom = uf.merge_geoms(geoms, angle_threshold)
+            if merged_geom.type() == QgsWkbTypes.LineGeometry:
+                if not merged_geom.isMultipart():
+                    p0 = merged_geom.asPolyline()[0]
+                    p1 = merged_geom.asPolyline()[-1]
+                else:
+                    p0 = merged_geom.asMultiPolyline()[0][0]
+                    p1 = merged_geom.asMultiPolyline()[-1][-1]
+
+            # special case - if self loop breaks at intersection of other line & then merged back on old self loop point
+            if p0 == p1 and p0 != selfloop_point:
+                merged_points = geoms[0].asPolyline()
+                if not merged_points[0] == selfloop_point:
+                    merged_points = merged_points[::-1]
+                for geom in geoms[1:]:
+                    points = geom.asPolyline()
+                    if not points[0] == merged_points[-1]:
+                        merged_points += (points[::-1])[1:]
+                    else:
+                        merged_points += points[1:]
+                merged_geom = QgsGeometry.fromPolylineXY(merged_points)
+
+        if p0 == selfloop_point:
+            merged_nodes = group_nodes[0], group_nodes[-1]
+        else:
+            merged_nodes = group_nodes[-1], group_nodes[0]
+
+        # del edges
+        for e in group_edges:
+            topology.remove_edge(e)
+
+        merged_edge = topology.add_edge(merged_nodes[0], merged_nodes[1], None, list(attributes))
+        self.set_edge_geometry(merged_edge, merged_geom)
+
+        # middle nodes del
+        for nd in group_nodes[1:-1]:
+            self.add_error(nd, 'merged', merged_edge)
+            topology.remove_node(nd)
+
+        return
+
+    # SNAPSHOTS -----------------------------------------------------------------
+
+    # copy of the graph that can be pickled (NULL attributes as None), sharing no arrays or geometries with it
+    def snapshot(self):
+        attributes = dict((e, [None if attr == NULL else attr for attr in attributes]) for e, attributes in
+                          list(self.topology.attributes.items()))
+        # the memo puts the converted attributes in place of the attributes, instead of copying them again
+        topology = copy.deepcopy(self.topology, {id(self.topology.attributes): attributes})
+        return {'topology': topology, 'errors': self.errors.state(),
+                'unlinks': self.unlinks.state()}
+
+    def restore(self, state, fields):
+        self.topology = state['topology']
+        self.topology.attributes = dict((e, [NULL if attr is None else attr for attr in attributes]) for e, attributes
+                                        in list(self.topology.attributes.items()))
+        self.fields = fields
+        self.errors = PointStore.from_state(state['errors'])
+        self.unlinks = PointStore.from_state(state['unlinks'])
+        return
+
+    # OUTPUT -----------------------------------------------------------------
+
+    def edge_features(self):
+        for e in self.topology.edge_ids().tolist():
+            feat = QgsFeature(self.fields)
+            feat.setAttributes(self.topology.attributes[e])
+            feat.setGeometry(self.edge_geometry(e))
+            feat.setId(e)
+            yield feat
+
+    def error_features(self):
+        return point_features(self.errors)
@@ -4,17 +4,21 @@ from __future__ import print_function
 import itertools
 # general imports
 from builtins import zip
-from collections import defaultdict
 
+import numpy as np
 from qgis.PyQt.QtCore import (QObject, pyqtSignal, QVariant)
 from qgis.core import (QgsGeometry, QgsSpatialIndex, QgsFields, QgsField, QgsFeature, QgsMessageLog, Qgis, NULL,
-                       QgsWkbTypes)
+                       QgsWkbTypes, QgsPointXY)
 
 # plugin module imports
 try:
     from . import utilityFunctions as uf
+    from . import segmentCrossings as segment_crossings
+    from . import spatialHash as spatial_hash
+    from . import unionFind as union_find
     from .sNode import sNode
     from .sEdge import sEdge
+    from .pointStore import PointStore
 except ImportError:
     pass
 
@@ -38,6 +42,23 @@ error_flds.append(QgsField('error_type', QVariant.String))
 error_feat.setFields(error_flds)
 
 
+def point_features(errors):
+    for x, y, error_type, edge in errors.rows():
+        err_f = QgsFeature(error_feat)
+        err_f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        err_f.setAttributes([error_type])
+        yield err_f
+
+
+def unlink_features(unlinks):
+    for unlinks_id, (x, y, unlink_type, edge) in enumerate(unlinks.rows()):
+        un_f = QgsFeature(unlink_feat)
+        un_f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        un_f.setId(unlinks_id)
+        un_f.setAttributes([unlinks_id])
+        yield un_f
+
+
 class sGraph(QObject):
     finished = pyqtSignal(object)
     error = pyqtSignal(Exception, str)
@@ -51,6 +72,8 @@ class sGraph(QObject):
         self.sNodes = nodes  # can be empty
         self.total_progress = 0
         self.step = 0
+        # node keys on a fixed precision grid (spatial_hash.coordinate_grid), exact coordinates if None
+        self.coordinate_grid = None
 
         if len(self.sEdges) == 0:
             self.edge_id = 0
@@ -59,19 +82,54 @@ class sGraph(QObject):
         else:
             self.edge_id = max(self.sEdges.keys())
             self.node_id = max(self.sNodes.keys())
-            self.sNodesCoords = {snode.getCoords(): snode.id for snode in list(self.sNodes.values())}
+            self.sNodesCoords = {self.node_key(*snode.getCoords()): snode.id for snode in list(self.sNodes.values())}
 
+        # the edge index is kept in sync with every insert, delete and geometry change
+        # the node index is only needed by snapping without the grid, it is built there
         self.edgeSpIndex = QgsSpatialIndex()
         self.ndSpIndex = QgsSpatialIndex()
-        res = [self.edgeSpIndex.addFeature(sedge.feature) for sedge in list(self.sEdges.values())]
-        del res
+        self.rebuild_spatial_indexes()
 
-        self.errors = []
         # breakages, orphans, merges, snaps, duplicate, points, mlparts
-        self.unlinks = []
+        self.errors = PointStore()
+        self.unlinks = PointStore()
         self.points = []
         self.multiparts = []
 
+    def edge_count(self):
+        return len(self.sEdges)
+
+    def node_count(self):
+        return len(self.sNodes)
+
+    # SPATIAL INDEXES -----------------------------------------------------------
+
+    # full refresh, if edges were changed without the methods below
+    def rebuild_spatial_indexes(self):
+        self.edgeSpIndex = QgsSpatialIndex()
+        for sedge in list(self.sEdges.values()):
+            self.edgeSpIndex.addFeature(sedge.feature)
+        return
+
+    # geometry changes replace the index entry (the old bounding box is needed for the delete)
+    def update_edge_geometry(self, e, geometry):
+        self.edgeSpIndex.deleteFeature(self.sEdges[e].feature)
+        self.sEdges[e].feature.setGeometry(geometry)
+        self.edgeSpIndex.addFeature(self.sEdges[e].feature)
+        return
+
+    def move_edge_start(self, e, node_id, point):
+        self.edgeSpIndex.deleteFeature(self.sEdges[e].feature)
+        self.sEdges[e].replace_start(node_id, point)
+        self.edgeSpIndex.addFeature(self.sEdges[e].feature)
+        return
+
+    def move_edge_end(self, e, node_id, point):
+        self.edgeSpIndex.deleteFeature(self.sEdges[e].feature)
+        self.sEdges[e].replace_end(node_id, point)
+        self.edgeSpIndex.addFeature(self.sEdges[e].feature)
+        return
+
     # graph from feat iter
     # updates the id
     def load_edges(self, feat_iter, angle_threshold):
@@ -96,6 +154,7 @@ class sGraph(QObject):
             f.setGeometry(geometry)
             sedge = sEdge(self.edge_id, f, snodes)
             self.sEdges[self.edge_id] = sedge
+            self.edgeSpIndex.addFeature(f)
 
         return
 
@@ -110,18 +169,24 @@ class sGraph(QObject):
             self.total_progress += self.step
             self.progress.emit(self.total_progress)
 
-            # add edge
+            # add edge (not indexed, breaking does not query the index)
             sedge = sEdge(f.id(), f, [])
             self.sEdges[f.id()] = sedge
-            self.edgeSpIndex.addFeature(f)
 
         self.edge_id = f.id()
         return
 
+    # key of the node at a point, a packed integer if a coordinate grid is set
+    def node_key(self, x, y):
+        if self.coordinate_grid is None:
+            return x, y
+        return spatial_hash.coordinate_key(self.coordinate_grid, x, y)
+
     # find existing or generate new node
     def load_point(self, point):
+        key = self.node_key(point[0], point[1])
         try:
-            node_id = self.sNodesCoords[(point[0], point[1])]
+            node_id = self.sNodesCoords[key]
         except KeyError:
             self.node_id += 1
             node_id = self.node_id
@@ -129,7 +194,7 @@ class sGraph(QObject):
             feature.setId(node_id)
             feature.setAttributes([node_id])
             feature.setGeometry(QgsGeometry.fromPointXY(point))
-            self.sNodesCoords[(point[0], point[1])] = node_id
+            self.sNodesCoords[key] = node_id
             snode = sNode(node_id, feature, [], [])
             self.sNodes[self.node_id] = snode
         return node_id
@@ -152,15 +217,20 @@ class sGraph(QObject):
         self.sNodes[nodes[0]].topology.remove(nodes[1])
         self.sNodes[nodes[1]].adj_edges.remove(e)  # if self loop - removed twice
         self.sNodes[nodes[1]].topology.remove(nodes[0])  # if self loop - removed twice
+        self.edgeSpIndex.deleteFeature(self.sEdges[e].feature)
         del self.sEdges[e]
-        # spIndex self.edgeSpIndex.deleteFeature(self.sEdges[e].feature)
         return
 
     # create graph (broken_features_iter)
     # can be applied to edges w-o topology for speed purposes
     def break_features_iter(self, getUnlinks, angle_threshold, fix_unlinks=False):
 
-        for sedge in list(self.sEdges.values()):
+        # self intersections and common vertices of all edges, hashed in one pass
+        polylines = [[(p.x(), p.y()) for p in sedge.feature.geometry().asPolyline()] for sedge in
+                     list(self.sEdges.values())]
+        break_vertices = spatial_hash.common_vertices(polylines, self.coordinate_grid)
+
+        for sedge, vertices in zip(list(self.sEdges.values()), break_vertices):
 
             if self.killed is True:
                 break
@@ -169,53 +239,31 @@ class sGraph(QObject):
             self.progress.emit(self.total_progress)
 
             f = sedge.feature
-            f_geom = f.geometry()
-            pl = f_geom.asPolyline()
-            lines = [line for line in self.edgeSpIndex.intersects(f_geom.boundingBox()) if line != f.id()]
-
-            # self intersections
-            # include first and last
-            self_intersections = uf.getSelfIntersections(pl)
-
-            # common vertices
-            intersections = list(itertools.chain.from_iterable(
-                [set(pl[1:-1]).intersection(set(self.sEdges[line].feature.geometry().asPolyline())) for line in lines]))
-            intersections += self_intersections
-            intersections = (set(intersections))
+            pl = f.geometry().asPolyline()
+            intersections = [pl[idx] for idx in vertices]
 
             if len(intersections) > 0:
                 # broken features iterator
                 # errors
                 for pnt in intersections:
-                    err_f = QgsFeature(error_feat)
-                    err_f.setGeometry(QgsGeometry.fromPointXY(pnt))
-                    err_f.setAttributes(['broken'])
-                    self.errors.append(err_f)
+                    self.errors.add(pnt.x(), pnt.y(), 'broken', sedge.id)
                 vertices_indices = uf.find_vertex_indices(pl, intersections)
                 for start, end in zip(vertices_indices[:-1], vertices_indices[1:]):
                     broken_feat = QgsFeature(f)
-                    broken_geom = QgsGeometry.fromPolylineXY(pl[start:end + 1]).simplify(angle_threshold)
+                    broken_geom = QgsGeometry.fromPolylineXY(pl[start:end + 1])
+                    # no simplification if None (vertices might be needed for breaking later)
+                    if angle_threshold is not None:
+                        broken_geom = broken_geom.simplify(angle_threshold)
                     broken_feat.setGeometry(broken_geom)
                     yield broken_feat
             else:
-                simpl_geom = f.geometry().simplify(angle_threshold)
-                f.setGeometry(simpl_geom)
+                if angle_threshold is not None:
+                    simpl_geom = f.geometry().simplify(angle_threshold)
+                    f.setGeometry(simpl_geom)
                 yield f
 
     def fix_unlinks(self):
 
-        self.edgeSpIndex = QgsSpatialIndex()
-        self.step = self.step / 2.0
-
-        for e in list(self.sEdges.values()):
-            if self.killed is True:
-                break
-
-            self.total_progress += self.step
-            self.progress.emit(self.total_progress)
-
-            self.edgeSpIndex.addFeature(e.feature)
-
         for sedge in list(self.sEdges.values()):
 
             if self.killed is True:
@@ -238,7 +286,7 @@ class sGraph(QObject):
                             edge_geometry.moveVertex(crossing_points.asPoint().x() + 1,
                                                      crossing_points.asPoint().y() + 1,
                                                      pl.index(crossing_points.asPoint()))
-                            self.sEdges[sedge.id].feature.setGeometry(edge_geometry)
+                            self.update_edge_geometry(sedge.id, edge_geometry)
                     else:
                         for p in crossing_points.asMultiPoint():
                             if p in pl[1:-1]:
@@ -246,37 +294,26 @@ class sGraph(QObject):
                                 edge_geometry.moveVertex(p.x() + 1,
                                                          p.y() + 1,
                                                          pl.index(p))
-                                self.sEdges[sedge.id].feature.setGeometry(edge_geometry)
+                                self.update_edge_geometry(sedge.id, edge_geometry)
             # TODO: exclude vertices - might be in one of the lines
 
         return
 
+    # groups of connected items (union-find)
     def con_comp_iter(self, group_dictionary):
-        components_passed = set([])
-        for id in list(group_dictionary.keys()):
+        for group in union_find.components(group_dictionary):
 
-            self.total_progress += self.step
+            self.total_progress += self.step * len(group)
             self.progress.emit(self.total_progress)
 
-            if {id}.isdisjoint(components_passed):
-                group = [[id]]
-                candidates = ['dummy', 'dummy']
-                while len(candidates) > 0:
-                    flat_group = group[:-1] + group[-1]
-                    candidates = [set(group_dictionary[last_visited_node]).difference(set(flat_group)) for
-                                  last_visited_node in group[-1]]
-                    candidates = list(set(itertools.chain.from_iterable(candidates)))
-                    group = flat_group + [candidates]
-                    components_passed.update(set(candidates))
-                yield group[:-1]
-
-    # group points based on proximity - spatial index is not updated
-    def snap_endpoints(self, snap_threshold):
-        QgsMessageLog.logMessage('starting snapping', level=Qgis.Critical)
+            yield group
+
+    # find nodes within x distance
+    def snap_neighbours_index(self, snap_threshold):
+        self.ndSpIndex = QgsSpatialIndex()
         res = [self.ndSpIndex.addFeature(snode.feature) for snode in list(self.sNodes.values())]
         filtered_nodes = {}
         # exclude nodes where connectivity = 2 - they will be merged
-        self.step = self.step / float(2)
         for node in [n for n in list(self.sNodes.values()) if n.adj_edges != 2]:
             if self.killed is True:
                 break
@@ -290,6 +327,26 @@ class sGraph(QObject):
                      nd != node.id and node_geom.distance(self.sNodes[nd].feature.geometry()) <= snap_threshold]
             if len(nodes) > 0:
                 filtered_nodes[node.id] = nodes
+        return filtered_nodes
+
+    # find nodes within x distance - node coordinates hashed into a grid with cell size = snap threshold
+    def snap_neighbours_grid(self, snap_threshold):
+        ids = list(self.sNodes.keys())
+        coords = np.array([snode.getCoords() for snode in list(self.sNodes.values())], dtype=np.float64).reshape(-1, 2)
+        filtered_nodes = spatial_hash.snap_neighbours(ids, coords[:, 0], coords[:, 1], snap_threshold)
+
+        self.total_progress += self.step * len(ids)
+        self.progress.emit(self.total_progress)
+        return filtered_nodes
+
+    # group points based on proximity
+    def snap_endpoints(self, snap_threshold, grid_snapping=True):
+        QgsMessageLog.logMessage('starting snapping', level=Qgis.Critical)
+        self.step = self.step / float(2)
+        if grid_snapping:
+            filtered_nodes = self.snap_neighbours_grid(snap_threshold)
+        else:
+            filtered_nodes = self.snap_neighbours_index(snap_threshold)
 
         QgsMessageLog.logMessage('continuing snapping', level=Qgis.Critical)
         self.step = (len(filtered_nodes) * self.step) / float(len(self.sNodes))
@@ -316,10 +373,10 @@ class sGraph(QObject):
                     if sedge.feature.geometry().length() <= snap_threshold:  # short self-loop
                         self.remove_edge((start, end), edge)
                     else:
-                        self.sEdges[edge].replace_start(self.node_id, centroid_point)
+                        self.move_edge_start(edge, self.node_id, centroid_point)
                         self.update_topology(merged_node_id, merged_node_id, edge)
                         self.sNodes[end].topology.remove(start)
-                        self.sEdges[edge].replace_end(self.node_id, centroid_point)
+                        self.move_edge_end(edge, self.node_id, centroid_point)
                         self.sNodes[start].topology.remove(end)
                     # self.sNodes[start].topology.remove(end)
                 # if becoming self loop (if one intermediate vertex - turns back on itself)
@@ -328,21 +385,21 @@ class sGraph(QObject):
                             or sedge.feature.geometry().length() <= snap_threshold):
                         self.remove_edge((start, end), edge)
                     else:
-                        self.sEdges[edge].replace_start(self.node_id, centroid_point)
-                        self.sEdges[edge].replace_end(self.node_id, centroid_point)
+                        self.move_edge_start(edge, self.node_id, centroid_point)
+                        self.move_edge_end(edge, self.node_id, centroid_point)
                         self.update_topology(merged_node_id, merged_node_id, edge)
                         self.sNodes[end].topology.remove(start)
                         self.sNodes[start].topology.remove(end)
                 # if only start
                 elif start in group:
-                    self.sEdges[edge].replace_start(self.node_id, centroid_point)
+                    self.move_edge_start(edge, self.node_id, centroid_point)
                     self.sNodes[merged_node_id].topology.append(end)
                     self.sNodes[merged_node_id].adj_edges.append(edge)
                     self.sNodes[end].topology.append(merged_node_id)
                     self.sNodes[end].topology.remove(start)
                 # if only end
                 elif end in group:
-                    self.sEdges[edge].replace_end(self.node_id, centroid_point)
+                    self.move_edge_end(edge, self.node_id, centroid_point)
                     self.sNodes[merged_node_id].topology.append(start)
                     self.sNodes[merged_node_id].adj_edges.append(edge)
                     self.sNodes[start].topology.append(merged_node_id)
@@ -350,10 +407,7 @@ class sGraph(QObject):
 
             # errors
             for node in group:
-                err_f = QgsFeature(error_feat)
-                err_f.setGeometry(self.sNodes[node].feature.geometry())
-                err_f.setAttributes(['snapped'])
-                self.errors.append(err_f)
+                self.errors.add(*(self.sNodes[node].getCoords() + ('snapped',)))
 
             # delete old nodes
             res = [self.delete_node(item) for item in group]
@@ -372,7 +426,6 @@ class sGraph(QObject):
         feat.setId(self.node_id)
         snode = sNode(self.node_id, feat, [], [])
         self.sNodes[self.node_id] = snode
-        self.ndSpIndex.addFeature(feat)
 
         return self.node_id, centroid.asPoint()
 
@@ -408,30 +461,37 @@ class sGraph(QObject):
     # TODO: snap_geometries (not endpoints)
     # TODO: extend
 
+    # nodes and geometry fingerprint of an edge, the same for duplicates in any direction
+    def edge_fingerprint(self, e):
+        geometry = self.sEdges[e].feature.geometry()
+        if geometry.isMultipart():
+            parts = geometry.asMultiPolyline()
+        else:
+            parts = [geometry.asPolyline()]
+        spacing = self.coordinate_grid[0] if self.coordinate_grid is not None else None
+        return frozenset(self.sEdges[e].nodes), spatial_hash.geometry_fingerprint(
+            [[(p.x(), p.y()) for p in part] for part in parts], spacing)
+
+    # duplicates found in one pass, by their fingerprints - the first edge of every geometry is kept
     def clean_dupl(self, group_edges, snap_threshold, parallel=False):
 
-        self.total_progress += self.step
-        self.progress.emit(self.total_progress)
+        kept_edges = {}
+        for e in group_edges:
+
+            if self.killed is True:
+                break
+
+            self.total_progress += self.step
+            self.progress.emit(self.total_progress)
 
-        # keep line with minimum length
-        # TODO: add distance centroids
-        lengths = [self.sEdges[e].feature.geometry().length() for e in group_edges]
-        sorted_edges = [x for _, x in sorted(zip(lengths, group_edges))]
-        min_len = min(lengths)
-
-        # if parallel is False:
-        prl_dist_threshold = 0
-        # else:
-        #    dist_threshold = snap_threshold
-        for e in sorted_edges[1:]:
+            fingerprint = self.edge_fingerprint(e)
+            if fingerprint not in kept_edges:
+                kept_edges[fingerprint] = e
+                continue
             # delete line
-            if abs(self.sEdges[e].feature.geometry().length() - min_len) <= prl_dist_threshold:
-                for p in set([self.sNodes[n].feature.geometry() for n in self.sEdges[e].nodes]):
-                    err_f = QgsFeature(error_feat)
-                    err_f.setGeometry(p)
-                    err_f.setAttributes(['duplicate'])
-                    self.errors.append(err_f)
-                self.remove_edge(self.sEdges[e].nodes, e)
+            for n in set(self.sEdges[e].nodes):
+                self.errors.add(*(self.sNodes[n].getCoords() + ('duplicate', e)))
+            self.remove_edge(self.sEdges[e].nodes, e)
         return
 
     def clean_multipart(self, e):
@@ -456,11 +516,8 @@ class sGraph(QObject):
 
             if len(multi_poly) >= 1:
                 # add points as multipart errors if there was actually more than one line
-                for p in single_geom.asPolyline():
-                    err_f = QgsFeature(error_feat)
-                    err_f.setGeometry(QgsGeometry.fromPointXY(p))
-                    err_f.setAttributes(['multipart'])
-                    self.errors.append(err_f)
+                for p in singlepart:
+                    self.errors.add(p.x(), p.y(), 'multipart', e.id)
 
         # delete old feature - spIndex
 
@@ -482,37 +539,21 @@ class sGraph(QObject):
         # if selfloop
         # if selfloop and parallel
         if len(set(snds[0].topology)) == len(set(snds[1].topology)) == 1 and len(set(snds[0].adj_edges)) == 1:
+            self.edgeSpIndex.deleteFeature(e.feature)
             del self.sEdges[e.id]
             for nd in set(nds):
-                err_f = QgsFeature(error_feat)
-                err_f.setGeometry(self.sNodes[nd].feature.geometry())
-                err_f.setAttributes(['orphan'])
-                self.errors.append(err_f)
-                del self.sNodes[nd]
+                self.errors.add(*(self.sNodes[nd].getCoords() + ('orphan', e.id)))
+                self.delete_node(nd)
         return True
 
     # find duplicate geometries
     # find orphans
 
     def clean(self, duplicates, orphans, snap_threshold, closed_polylines, multiparts=False):
-        # clean duplicates - delete longest from group using snap threshold
+        # clean duplicates - edges with the same geometry in any direction
         step_original = float(self.step)
         if duplicates:
-            input = [(e.id, frozenset(e.nodes)) for e in list(self.sEdges.values())]
-            groups = defaultdict(list)
-            for v, k in input: groups[k].append(v)
-
-            dupl_candidates = dict([nodes_edges for nodes_edges in list(groups.items()) if len(nodes_edges[1]) > 1])
-
-            self.step = (len(dupl_candidates) * self.step) / float(len(self.sEdges))
-            for (nodes, group_edges) in list(dupl_candidates.items()):
-
-                if self.killed is True:
-                    break
-
-                self.total_progress += self.step
-                self.progress.emit(self.total_progress)
-                self.clean_dupl(group_edges, snap_threshold, False)
+            self.clean_dupl(list(self.sEdges.keys()), snap_threshold, False)
 
         self.step = step_original
         # clean orphans
@@ -577,11 +618,11 @@ class sGraph(QObject):
 
     def merge_collinear(self, collinear_threshold, angle_threshold=0):
 
-        filtered_nodes = dict([id_nd for id_nd in list(graph.sNodes.items()) if
+        filtered_nodes = dict([id_nd for id_nd in list(self.sNodes.items()) if
                                len(id_nd[1].topology) == 2 and len(id_nd[1].adj_edges) == 2])
         filtered_nodes = dict([id_nd1 for id_nd1 in list(filtered_nodes.items()) if
-                               uf.angle_3_points(graph.sNodes[id_nd1[1].topology[0]].feature.geometry().asPoint(),
-                                                 id_nd1[1].feature.geometry().asPoint(), graph.sNodes[
+                               uf.angle_3_points(self.sNodes[id_nd1[1].topology[0]].feature.geometry().asPoint(),
+                                                 id_nd1[1].feature.geometry().asPoint(), self.sNodes[
                                                      id_nd1[1].topology[
                                                          1]].feature.geometry().asPoint()) <= collinear_threshold])
         filtered_nodes = {id: nd.adj_edges for id, nd in list(filtered_nodes.items())}
@@ -609,24 +650,14 @@ class sGraph(QObject):
             self.merge_edges(nodes, group, angle_threshold)
         return
 
+    # chains of connected edges, from one end to the other (union-find)
     def collinear_comp_iter(self, group_dictionary):
-        components_passed = set([])
-        for id, top in list(group_dictionary.items()):
+        for group in union_find.chains(group_dictionary):
 
-            self.total_progress += self.step
+            self.total_progress += self.step * len(group)
             self.progress.emit(self.total_progress)
 
-            if {id}.isdisjoint(components_passed) and len(top) != 2:
-                group = [[id]]
-                candidates = ['dummy', 'dummy']
-                while len(candidates) > 0:
-                    flat_group = group[:-1] + group[-1]
-                    candidates = [set(group_dictionary[last_visited_node]).difference(set(flat_group)) for
-                                  last_visited_node in group[-1]]
-                    candidates = list(set(itertools.chain.from_iterable(candidates)))
-                    group = flat_group + [candidates]
-                    components_passed.update(set(candidates))
-                yield group[:-1]
+            yield group
 
     def edge_edges_iter(self):
         # what if two parallel edges at the edge - should become self loop
@@ -665,57 +696,68 @@ class sGraph(QObject):
 
     def generate_unlinks(self):  # for osm or other
 
-        # spIndex # TODO change OTF - insert/delete feature
-        self.edgeSpIndex = QgsSpatialIndex()
-
-        self.step = self.step / float(4)
-        for e in list(self.sEdges.values()):
-            if self.killed is True:
-                break
-
-            self.total_progress += self.step
-            self.progress.emit(self.total_progress)
+        # crossings of all edges at once, on their coordinates (shared vertices are not crossings)
+        polylines = [[(p.x(), p.y()) for p in sedge.feature.geometry().asPolyline()] for sedge in
+                     list(self.sEdges.values())]
+        xs, ys, edges1, edges2 = segment_crossings.crossings(list(self.sEdges.keys()), polylines)
+        self.unlinks.add_many(xs.tolist(), ys.tolist(), 'unlink')
 
-            self.edgeSpIndex.addFeature(e.feature)
+        self.total_progress += self.step * len(polylines)
+        self.progress.emit(self.total_progress)
+        return
 
-        unlinks_id = 0
-        self.step = float(3.0) * self.step
-        for id, e in list(self.sEdges.items()):
+    # SNAPSHOTS -----------------------------------------------------------------
+
+    # plain python copy of the graph that can be pickled (geometries as wkb, NULL attributes as None)
+    def snapshot(self):
+        return {'edges': dict((e, (bytes(sedge.feature.geometry().asWkb()),
+                                   [None if attr == NULL else attr for attr in sedge.feature.attributes()],
+                                   list(sedge.nodes))) for e, sedge in list(self.sEdges.items())),
+                'nodes': dict((n, (snode.getCoords(), list(snode.topology), list(snode.adj_edges))) for n, snode in
+                              list(self.sNodes.items())),
+                'edge_id': self.edge_id,
+                'node_id': self.node_id,
+                'errors': self.errors.state(),
+                'unlinks': self.unlinks.state()}
+
+    # replaces the graph with a snapshot, edge features get the fields given
+    def restore(self, state, fields):
+        self.sEdges = {}
+        for e, (wkb, attributes, nodes) in list(state['edges'].items()):
+            feat = QgsFeature(fields)
+            geometry = QgsGeometry()
+            geometry.fromWkb(wkb)
+            feat.setGeometry(geometry)
+            feat.setAttributes([NULL if attr is None else attr for attr in attributes])
+            feat.setId(e)
+            self.sEdges[e] = sEdge(e, feat, nodes)
+        self.sNodes = {}
+        for n, (coords, topology, adj_edges) in list(state['nodes'].items()):
+            feature = QgsFeature()
+            feature.setId(n)
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(*coords)))
+            self.sNodes[n] = sNode(n, feature, topology, adj_edges)
+        self.sNodesCoords = dict((self.node_key(*coords), n) for n, (coords, topology, adj_edges) in
+                                 list(state['nodes'].items()))
+        self.edge_id = state['edge_id']
+        self.node_id = state['node_id']
+        self.errors = PointStore.from_state(state['errors'])
+        self.unlinks = PointStore.from_state(state['unlinks'])
+        self.rebuild_spatial_indexes()
+        return
 
-            if self.killed is True:
-                break
+    # OUTPUT -----------------------------------------------------------------
 
-            self.total_progress += self.step
-            self.progress.emit(self.total_progress)
+    def edge_features(self):
+        return [e.feature for e in list(self.sEdges.values())]
 
-            f_geom = e.feature.geometry()
-            # to avoid duplicate unlinks - id > line
-            lines = [line for line in self.edgeSpIndex.intersects(f_geom.boundingBox()) if
-                     f_geom.crosses(self.sEdges[line].feature.geometry()) and id > line]
+    # features are made from the point stores as they are iterated (written)
+    def error_features(self):
+        return point_features(self.errors)
 
-            for line in lines:
-                crossing_points = f_geom.intersection(self.sEdges[line].feature.geometry())
-                # in some cases the startpoint or endpoint is returned - exclude
-                if crossing_points.type() == QgsWkbTypes.PointGeometry:
-                    if not crossing_points.isMultipart():
-                        un_f = QgsFeature(unlink_feat)
-                        un_f.setGeometry(crossing_points)
-                        un_f.setId(unlinks_id)
-                        un_f.setAttributes([unlinks_id])
-                        unlinks_id += 1
-                        self.unlinks.append(un_f)
-                    else:
-                        for p in crossing_points.asMultiPoint():
-                            if p not in f_geom.asPolyline():
-                                un_f = QgsFeature(unlink_feat)
-                                un_f.setGeometry(QgsGeometry.fromPointXY(p))
-                                un_f.setId(unlinks_id)
-                                un_f.setAttributes([unlinks_id])
-                                unlinks_id += 1
-                                self.unlinks.append(un_f)
-        return
+    def unlink_features(self):
+        return unlink_features(self.unlinks)
 
-    # TODO: features added - pass through clean_iterator (can be ml line)
     def merge_edges(self, group_nodes, group_edges, angle_threshold):
 
         geoms = [self.sEdges[e].feature.geometry() for e in group_edges]
@@ -728,32 +770,42 @@ class sGraph(QObject):
         # attributes from longest
         longest_feat = self.sEdges[group_edges[lengths.index(max_len)]].feature
         feat.setAttributes(longest_feat.attributes())
-        merged_geom = uf.merge_geoms(geoms, angle_threshold)
-        if merged_geom.type() == QgsWkbTypes.LineGeometry:
-            if not merged_geom.isMultipart():
-                p0 = merged_geom.asPolyline()[0]
-                p1 = merged_geom.asPolyline()[-1]
-            else:
-                p0 = merged_geom.asMultiPolyline()[0][0]
-                p1 = merged_geom.asMultiPolyline()[-1][-1]
-
-        # special case - if self loop breaks at intersection of other line & then merged back on old self loop point
-        # TODO: include in merged_geoms functions to make indepedent
-        selfloop_point = self.sNodes[group_nodes[0]].feature.geometry().asPoint()
-        if p0 == p1 and p0 != selfloop_point:
-            merged_points = geoms[0].asPolyline()
-            geom1 = self.sEdges[group_edges[0]].feature.geometry().asPolyline()
-            if not geom1[0] == selfloop_point:
-                merged_points = merged_points[::-1]
-            for geom in geoms[1:]:
-                points = geom.asPolyline()
-                if not points[0] == merged_points[-1]:
-                    merged_points += (points[::-1])[1:]
-                else:
-                    merged_points += points[1:]
+        # chain coordinates in node order, concatenated once
+        merged_points = uf.merge_polylines([g.asPolyline() for g in geoms],
+                                           [self.sNodes[n].feature.geometry().asPoint() for n in group_nodes[:-1]])
+        if merged_points is not None:
             merged_geom = QgsGeometry.fromPolylineXY(merged_points)
-            if merged_geom.wkbType() != QgsWkbTypes.LineString:
-                print('ml', merged_geom.wkbType())
+            if angle_threshold != 0:
+                merged_geom = merged_geom.simplify(angle_threshold)
+            p0 = merged_points[0]
+        else:
+            # edges not continuous in node order
+            merged_geom = uf.merge_geoms(geoms, angle_threshold)
+            if merged_geom.type() == QgsWkbTypes.LineGeometry:
+                if not merged_geom.isMultipart():
+                    p0 = merged_geom.asPolyline()[0]
+                    p1 = merged_geom.asPolyline()[-1]
+                else:
+                    p0 = merged_geom.asMultiPolyline()[0][0]
+                    p1 = merged_geom.asMultiPolyline()[-1][-1]
+
+            # special case - if self loop breaks at intersection of other line & then merged back on old self loop point
+            # TODO: include in merged_geoms functions to make indepedent
+            selfloop_point = self.sNodes[group_nodes[0]].feature.geometry().asPoint()
+            if p0 == p1 and p0 != selfloop_point:
+                merged_points = geoms[0].asPolyline()
+                geom1 = self.sEdges[group_edges[0]].feature.geometry().asPolyline()
+                if not geom1[0] == selfloop_point:
+                    merged_points = merged_points[::-1]
+                for geom in geoms[1:]:
+                    points = geom.asPolyline()
+                    if not points[0] == merged_points[-1]:
+                        merged_points += (points[::-1])[1:]
+                    else:
+                        merged_points += points[1:]
+                merged_geom = QgsGeometry.fromPolylineXY(merged_points)
+                if merged_geom.wkbType() != QgsWkbTypes.LineString:
+                    print('ml', merged_geom.wkbType())
 
         feat.setGeometry(merged_geom)
         feat.setId(self.edge_id)
@@ -763,6 +815,7 @@ class sGraph(QObject):
         else:
             merged_edge = sEdge(self.edge_id, feat, [group_nodes[-1], group_nodes[0]])
         self.sEdges[self.edge_id] = merged_edge
+        self.edgeSpIndex.addFeature(feat)
 
         # update ends
         self.sNodes[group_nodes[0]].topology.remove(group_nodes[1])
@@ -774,14 +827,12 @@ class sGraph(QObject):
 
         # middle nodes del
         for nd in group_nodes[1:-1]:
-            err_f = QgsFeature(error_feat)
-            err_f.setGeometry(self.sNodes[nd].feature.geometry())
-            err_f.setAttributes(['merged'])
-            self.errors.append(err_f)
-            del self.sNodes[nd]
+            self.errors.add(*(self.sNodes[nd].getCoords() + ('merged', self.edge_id)))
+            self.delete_node(nd)
 
         # del edges
         for e in group_edges:
+            self.edgeSpIndex.deleteFeature(self.sEdges[e].feature)
             del self.sEdges[e]
 
         return
@@ -0,0 +1,209 @@
+# general imports
+import numpy as np
+
+# plugin module imports
+try:
+    from .arrayUtils import grow
+except ImportError:
+    pass
+
+
+# Array backed store for the topology of an sGraph
+# node and edge ids are integers that index growable numpy arrays (id 0 is never used, as in sGraph)
+# adjacency is kept in CSR form (indptr, entries) that is rebuilt in bulk. Edges added or re-attached
+# between two rebuilds go into a small overlay which is merged back on the next rebuild.
+# every adjacency entry remembers which end of the edge it refers to (0: start, 1: end) so that
+# self loops appear twice, exactly like in sNode.adj_edges
+
+class sTopology(object):
+
+    def __init__(self, capacity=1024):
+        self.node_x = np.zeros(capacity, dtype=np.float64)
+        self.node_y = np.zeros(capacity, dtype=np.float64)
+        self.node_alive = np.zeros(capacity, dtype=bool)
+        self.edge_start = np.zeros(capacity, dtype=np.int64)
+        self.edge_end = np.zeros(capacity, dtype=np.int64)
+        self.edge_alive = np.zeros(capacity, dtype=bool)
+
+        # last allocated ids
+        self.node_id = 0
+        self.edge_id = 0
+        self.nodes_count = 0
+        self.edges_count = 0
+
+        # (x, y) or coordinate key -> node id
+        self.nodes_coords = {}
+
+        # side tables, edge id -> coordinates (k x 2 array, or list of arrays if multipart) / attributes
+        self.geometries = {}
+        self.attributes = {}
+
+        # adjacency
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.adj_edges = np.zeros(0, dtype=np.int64)
+        self.adj_sides = np.zeros(0, dtype=np.int8)
+        self.overlay = {}
+        self.overlay_size = 0
+
+    # ALLOCATION -----------------------------------------------------------------
+
+    def add_node(self, x, y):
+        self.node_id += 1
+        if self.node_id >= len(self.node_alive):
+            self.node_x = grow(self.node_x, self.node_id)
+            self.node_y = grow(self.node_y, self.node_id)
+            self.node_alive = grow(self.node_alive, self.node_id)
+        self.node_x[self.node_id] = x
+        self.node_y[self.node_id] = y
+        self.node_alive[self.node_id] = True
+        self.nodes_count += 1
+        return self.node_id
+
+    # find existing or generate new node
+    def load_point(self, x, y, key=None):
+        if key is None:
+            key = (x, y)
+        try:
+            node_id = self.nodes_coords[key]
+        except KeyError:
+            node_id = self.add_node(x, y)
+            self.nodes_coords[key] = node_id
+        return node_id
+
+    def add_edge(self, start, end, coords, attributes):
+        self.edge_id += 1
+        if self.edge_id >= len(self.edge_alive):
+            self.edge_start = grow(self.edge_start, self.edge_id)
+            self.edge_end = grow(self.edge_end, self.edge_id)
+            self.edge_alive = grow(self.edge_alive, self.edge_id)
+        self.edge_start[self.edge_id] = start
+        self.edge_end[self.edge_id] = end
+        self.edge_alive[self.edge_id] = True
+        self.geometries[self.edge_id] = coords
+        self.attributes[self.edge_id] = attributes
+        self.edges_count += 1
+        self.attach(start, self.edge_id, 0)
+        self.attach(end, self.edge_id, 1)
+        self.compact_overlay()
+        return self.edge_id
+
+    def remove_edge(self, e):
+        self.edge_alive[e] = False
+        del self.geometries[e]
+        del self.attributes[e]
+        self.edges_count -= 1
+        return
+
+    def remove_node(self, n):
+        self.node_alive[n] = False
+        self.nodes_count -= 1
+        return
+
+    # ITERATION -----------------------------------------------------------------
+
+    # snapshots of the alive ids, in insertion order
+    def edge_ids(self):
+        return np.flatnonzero(self.edge_alive[:self.edge_id + 1])
+
+    def node_ids(self):
+        return np.flatnonzero(self.node_alive[:self.node_id + 1])
+
+    # ADJACENCY -----------------------------------------------------------------
+
+    def attach(self, n, e, side):
+        # edges without nodes (e.g. exploded multiparts) are not part of the topology
+        if n == 0:
+            return
+        self.overlay.setdefault(n, []).append((e, side))
+        self.overlay_size += 1
+        return
+
+    def compact_overlay(self):
+        if self.overlay_size > max(1024, self.edges_count // 4):
+            self.rebuild_adjacency()
+        return
+
+    def rebuild_adjacency(self):
+        edges = self.edge_ids()
+        edges = edges[(self.edge_start[edges] != 0) | (self.edge_end[edges] != 0)]
+        entry_nodes = np.concatenate((self.edge_start[edges], self.edge_end[edges]))
+        entry_edges = np.concatenate((edges, edges))
+        entry_sides = np.concatenate((np.zeros(len(edges), dtype=np.int8), np.ones(len(edges), dtype=np.int8)))
+        # per node, in edge insertion order
+        order = np.lexsort((entry_sides, entry_edges, entry_nodes))
+        self.adj_edges = entry_edges[order]
+        self.adj_sides = entry_sides[order]
+        self.indptr = np.zeros(self.node_id + 2, dtype=np.int64)
+        np.cumsum(np.bincount(entry_nodes, minlength=self.node_id + 1), out=self.indptr[1:])
+        self.overlay = {}
+        self.overlay_size = 0
+        return
+
+    def is_attached(self, n, e, side):
+        if not self.edge_alive[e]:
+            return False
+        if side == 0:
+            return self.edge_start[e] == n
+        return self.edge_end[e] == n
+
+    # list of adjacent edges, a self loop is included twice
+    def node_edges(self, n):
+        node_edges = []
+        if n + 1 < len(self.indptr):
+            entries = slice(self.indptr[n], self.indptr[n + 1])
+            edges = self.adj_edges[entries]
+            ends = np.where(self.adj_sides[entries] == 0, self.edge_start[edges], self.edge_end[edges])
+            node_edges = edges[self.edge_alive[edges] & (ends == n)].tolist()
+        for e, side in self.overlay.get(n, []):
+            if self.is_attached(n, e, side):
+                node_edges.append(e)
+        return node_edges
+
+    # list of adjacent nodes, a self loop is included twice
+    def node_topology(self, n):
+        return [self.other_node(e, n) for e in self.node_edges(n)]
+
+    def other_node(self, e, n):
+        if self.edge_start[e] == n:
+            return int(self.edge_end[e])
+        return int(self.edge_start[e])
+
+    def edge_nodes(self, e):
+        return int(self.edge_start[e]), int(self.edge_end[e])
+
+    # re-attach an endpoint of an edge to another node and move the geometry vertex
+    def replace_start(self, e, n):
+        self.edge_start[e] = n
+        self.geometries[e][0] = (self.node_x[n], self.node_y[n])
+        self.attach(n, e, 0)
+        self.compact_overlay()
+        return
+
+    def replace_end(self, e, n):
+        self.edge_end[e] = n
+        self.geometries[e][-1] = (self.node_x[n], self.node_y[n])
+        self.attach(n, e, 1)
+        self.compact_overlay()
+        return
+
+    # GEOMETRY -----------------------------------------------------------------
+
+    def node_coords(self, n):
+        return float(self.node_x[n]), float(self.node_y[n])
+
+    def edge_parts(self, e):
+        coords = self.geometries[e]
+        if isinstance(coords, list):
+            return coords
+        return [coords]
+
+    def edge_length(self, e):
+        return sum(float(np.hypot(*np.diff(part, axis=0).T).sum()) for part in self.edge_parts(e))
+
+    def edge_vertex_count(self, e):
+        return sum(len(part) for part in self.edge_parts(e))
+
+    def edge_bounds(self, e):
+        coords = np.concatenate(self.edge_parts(e))
+        (xmin, ymin), (xmax, ymax) = coords.min(axis=0), coords.max(axis=0)
+        return float(xmin), float(ymin), float(xmax), float(ymax)
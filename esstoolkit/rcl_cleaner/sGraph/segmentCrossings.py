@@ -0,0 +1,136 @@
+# general imports
+import numpy as np
+
+
+# crossings between polylines, on coordinate arrays
+# the segments are swept cell by cell over a uniform grid: only segments sharing a grid cell are tested,
+# and the exact segment intersections are computed for all candidate pairs at once
+
+# split polylines in segments (x1, y1, x2, y2), with their polyline index and vertex index of the start
+def polyline_segments(polylines):
+    counts = np.array([len(polyline) for polyline in polylines], dtype=np.int64)
+    if np.sum(np.maximum(counts - 1, 0)) == 0:
+        return np.empty((0, 4)), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), counts
+    coords = np.concatenate([np.asarray(polyline, dtype=np.float64).reshape(-1, 2) for polyline in polylines if
+                             len(polyline) > 0])
+    polyline_idx = np.repeat(np.arange(len(polylines)), counts)
+    vertex_idx = np.arange(len(coords)) - np.repeat(np.cumsum(counts) - counts, counts)
+    # a segment starts at every vertex but the last one of each polyline
+    starts = np.flatnonzero(vertex_idx < np.repeat(counts - 1, counts))
+    segments = np.c_[coords[starts], coords[starts + 1]]
+    return segments, polyline_idx[starts], vertex_idx[starts], counts
+
+
+# pairs of segments (i < j) whose bounding boxes share at least one grid cell, in batches of at most about max_pairs
+# a pair is given once, by the first cell both boxes cover
+def candidate_pairs(segments, cell_size=None, max_pairs=1000000):
+    xmin = np.minimum(segments[:, 0], segments[:, 2])
+    xmax = np.maximum(segments[:, 0], segments[:, 2])
+    ymin = np.minimum(segments[:, 1], segments[:, 3])
+    ymax = np.maximum(segments[:, 1], segments[:, 3])
+    if cell_size is None:
+        extent = max(xmax.max() - xmin.min(), ymax.max() - ymin.min())
+        # typical segment extent, so that most segments cover one to four cells
+        # long segments are in few cells and the grid has a bounded size, whatever the median
+        cell_size = max(float(np.median(np.maximum(xmax - xmin, ymax - ymin))), extent / 4096.0)
+        if not cell_size > 0:
+            cell_size = max(extent, 1.0)
+    ix0 = np.floor((xmin - xmin.min()) / cell_size).astype(np.int64)
+    ix1 = np.floor((xmax - xmin.min()) / cell_size).astype(np.int64)
+    iy0 = np.floor((ymin - ymin.min()) / cell_size).astype(np.int64)
+    iy1 = np.floor((ymax - ymin.min()) / cell_size).astype(np.int64)
+    ny = int(iy1.max()) + 1
+
+    # every (cell, segment) of the cells a segment box covers
+    nx_cells, ny_cells = ix1 - ix0 + 1, iy1 - iy0 + 1
+    cells_count = nx_cells * ny_cells
+    seg = np.repeat(np.arange(len(segments)), cells_count)
+    offset = np.arange(cells_count.sum()) - np.repeat(np.cumsum(cells_count) - cells_count, cells_count)
+    cell = (ix0[seg] + offset // ny_cells[seg]) * ny + iy0[seg] + offset % ny_cells[seg]
+    order = np.lexsort((seg, cell))
+    cell, seg = cell[order], seg[order]
+
+    # sweep the cells: every segment with the ones after it in the same cell
+    group_starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(cell)])
+    group_end = np.repeat(group_starts + group_sizes, group_sizes)
+    partners = group_end - np.arange(len(cell)) - 1
+
+    cumulative = np.cumsum(partners)
+    batch_start = 0
+    while batch_start < len(cell):
+        done = cumulative[batch_start - 1] if batch_start > 0 else 0
+        batch_end = max(int(np.searchsorted(cumulative, done + max_pairs, side='right')), batch_start + 1)
+        positions = np.arange(batch_start, batch_end)
+        counts = partners[positions]
+        first = np.repeat(positions, counts)
+        second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        # seg is sorted within each cell, so first < second
+        first_seg, second_seg = seg[first], seg[second]
+        # boxes sharing several cells are paired in the lowest one only
+        lowest = np.maximum(ix0[first_seg], ix0[second_seg]) * ny + np.maximum(iy0[first_seg], iy0[second_seg])
+        kept = cell[first] == lowest
+        yield np.c_[first_seg[kept], second_seg[kept]]
+        batch_start = batch_end
+
+
+# points where polylines cross each other
+# shared vertices and endpoints (touching polylines) are not crossings
+# returns x, y, ids of the first and second polyline (first < second in polylines order)
+def crossings(ids, polylines, eps=1e-9):
+    ids = np.asarray(ids)
+    segments, seg_polyline, seg_vertex, counts = polyline_segments(polylines)
+    empty = np.empty(0)
+    if len(segments) < 2:
+        return empty, empty, ids[:0], ids[:0]
+
+    # the candidate pairs are tested batch by batch and only the crossings are kept
+    hits = [np.empty((0, 4))]
+    for pairs in candidate_pairs(segments):
+        hits.append(pair_crossings(pairs, segments, seg_polyline, seg_vertex, counts, eps))
+
+    # one point per polyline pair and location (a crossing at a vertex is found on both its segments)
+    result = np.unique(np.concatenate(hits), axis=0)
+    first, second = result[:, 0].astype(np.int64), result[:, 1].astype(np.int64)
+    return result[:, 2], result[:, 3], ids[first], ids[second]
+
+
+# crossings of the segment pairs of different polylines, as rows (first polyline, second polyline, x, y)
+def pair_crossings(pairs, segments, seg_polyline, seg_vertex, counts, eps):
+    pairs = pairs[seg_polyline[pairs[:, 0]] != seg_polyline[pairs[:, 1]]]
+    a, b = segments[pairs[:, 0]], segments[pairs[:, 1]]
+
+    # p + t r = q + u s
+    r = a[:, 2:] - a[:, :2]
+    s = b[:, 2:] - b[:, :2]
+    qp = b[:, :2] - a[:, :2]
+    denominator = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    # parallel and collinear segments do not cross
+    valid = denominator != 0
+    denominator[~valid] = 1
+    t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / denominator
+    u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denominator
+    valid &= (t >= -eps) & (t <= 1 + eps) & (u >= -eps) & (u <= 1 + eps)
+    pairs, a, b, r, t, u = pairs[valid], a[valid], b[valid], r[valid], t[valid], u[valid]
+
+    # intersections at a vertex take the exact vertex coordinates
+    a_vertex = np.where(t <= eps, 0, np.where(t >= 1 - eps, 1, -1))
+    b_vertex = np.where(u <= eps, 0, np.where(u >= 1 - eps, 1, -1))
+    points = a[:, :2] + t[:, None] * r
+    points = np.where((b_vertex == 0)[:, None], b[:, :2], points)
+    points = np.where((b_vertex == 1)[:, None], b[:, 2:], points)
+    points = np.where((a_vertex == 0)[:, None], a[:, :2], points)
+    points = np.where((a_vertex == 1)[:, None], a[:, 2:], points)
+
+    # exclude endpoints of either polyline and vertices of both
+    polyline_a, polyline_b = seg_polyline[pairs[:, 0]], seg_polyline[pairs[:, 1]]
+    vertex_a = seg_vertex[pairs[:, 0]] + a_vertex
+    vertex_b = seg_vertex[pairs[:, 1]] + b_vertex
+    endpoint_a = (a_vertex >= 0) & ((vertex_a == 0) | (vertex_a == counts[polyline_a] - 1))
+    endpoint_b = (b_vertex >= 0) & ((vertex_b == 0) | (vertex_b == counts[polyline_b] - 1))
+    shared = (a_vertex >= 0) & (b_vertex >= 0)
+    keep = ~(endpoint_a | endpoint_b | shared)
+
+    first = np.minimum(polyline_a, polyline_b)[keep]
+    second = np.maximum(polyline_a, polyline_b)[keep]
+    return np.c_[first, second, points[keep] + 0.0]
@@ -0,0 +1,185 @@
+# general imports
+import numpy as np
+
+
+# uniform grid hashing of point coordinates
+# cell size = snap threshold, so that all points within the threshold of a point are in its cell or the 8 around it
+
+def grid_cells(xs, ys, cell_size):
+    ix = np.floor(xs / cell_size).astype(np.int64)
+    iy = np.floor(ys / cell_size).astype(np.int64)
+    # pad by one cell on each side so that neighbouring cells of the border cells get a valid key
+    ix -= ix.min() - 1
+    iy -= iy.min() - 1
+    return ix, iy, int(iy.max()) + 2
+
+
+# find the points within snap_threshold of each point
+# returns {id: [ids of the other points within the threshold]} for the points that have at least one
+def snap_neighbours(ids, xs, ys, snap_threshold, batch_size=100000):
+    ids = np.asarray(ids, dtype=np.int64)
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if len(ids) == 0:
+        return {}
+
+    ix, iy, ny = grid_cells(xs, ys, snap_threshold)
+    keys = ix * ny + iy
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    pairs_from = []
+    pairs_to = []
+    for batch_start in range(0, len(ids), batch_size):
+        # points in cell order, so that the cell lookups are sorted too
+        points = order[batch_start:batch_start + batch_size]
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell_keys = (ix[points] + dx) * ny + iy[points] + dy
+                lo = np.searchsorted(sorted_keys, cell_keys, side='left')
+                hi = np.searchsorted(sorted_keys, cell_keys, side='right')
+                counts = hi - lo
+                if counts.sum() == 0:
+                    continue
+                # expand every point to all the points of the cell
+                candidates_from = np.repeat(points, counts)
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                candidates_to = order[np.repeat(lo, counts) + offsets]
+                distances = np.hypot(xs[candidates_to] - xs[candidates_from], ys[candidates_to] - ys[candidates_from])
+                within = (distances <= snap_threshold) & (candidates_to != candidates_from)
+                pairs_from.append(candidates_from[within])
+                pairs_to.append(candidates_to[within])
+
+    pairs_from = np.concatenate(pairs_from) if len(pairs_from) > 0 else np.empty(0, dtype=np.int64)
+    pairs_to = np.concatenate(pairs_to) if len(pairs_to) > 0 else np.empty(0, dtype=np.int64)
+    if len(pairs_from) == 0:
+        return {}
+    pairs_order = np.lexsort((pairs_to, pairs_from))
+    pairs_from, pairs_to = pairs_from[pairs_order], pairs_to[pairs_order]
+
+    # group by point, in input order
+    starts = np.flatnonzero(np.r_[True, pairs_from[1:] != pairs_from[:-1]])
+    neighbours = np.split(ids[pairs_to], starts[1:])
+    return dict(zip(ids[pairs_from[starts]].tolist(), [group.tolist() for group in neighbours]))
+
+
+# fixed precision coordinate keys
+# coordinates are rounded to a grid with a spacing of 10^-precision and the two grid indices are packed in one integer,
+# counted from the lower left corner of the extent (with a margin of one snap threshold or more) so that
+# the keys fit in an int64 and points that round to the same grid point get the same key
+def coordinate_grid(precision, xmin, ymin, xmax, ymax, margin=100):
+    spacing = 10.0 ** -precision
+    cells_margin = int(np.ceil(margin / spacing))
+    origin_x = int(np.floor(xmin / spacing)) - cells_margin
+    origin_y = int(np.floor(ymin / spacing)) - cells_margin
+    columns = int(np.ceil(xmax / spacing)) + cells_margin - origin_x + 1
+    rows = int(np.ceil(ymax / spacing)) + cells_margin - origin_y + 1
+    if columns * rows >= np.iinfo(np.int64).max:
+        raise ValueError('Coordinate precision of %s decimals is too fine for the extent of the layer' % precision)
+    return spacing, origin_x, origin_y, rows
+
+
+def coordinate_key(grid, x, y):
+    spacing, origin_x, origin_y, rows = grid
+    return (int(round(x / spacing)) - origin_x) * rows + int(round(y / spacing)) - origin_y
+
+
+def coordinate_keys(grid, xs, ys):
+    spacing, origin_x, origin_y, rows = grid
+    columns = np.round(np.asarray(xs, dtype=np.float64) / spacing).astype(np.int64) - origin_x
+    return columns * rows + np.round(np.asarray(ys, dtype=np.float64) / spacing).astype(np.int64) - origin_y
+
+
+# fingerprint of a polyline, given as its parts, that is the same for a reversed copy
+# vertices are rounded to the spacing if given (e.g. of a coordinate grid), compared exactly otherwise
+# the fingerprint is the canonical vertex sequence as bytes, so a dictionary of fingerprints only compares
+# the vertices of two polylines when their hashes collide
+def geometry_fingerprint(parts, spacing=None):
+    counts = [len(part) for part in parts]
+    if sum(counts) == 0:
+        return b''
+    # + 0.0 so that -0.0 and 0.0 are the same
+    coords = np.concatenate([np.asarray(part, dtype=np.float64).reshape(-1, 2) for part in parts if len(part) > 0])
+    coords = coords + 0.0
+    if spacing is not None:
+        coords = np.round(coords / spacing).astype(np.int64)
+    # the direction whose sequence is smaller at the first vertex where the two differ
+    forward, backward = coords.ravel(), coords[::-1].ravel()
+    differences = np.flatnonzero(forward != backward)
+    if len(differences) > 0 and backward[differences[0]] < forward[differences[0]]:
+        coords, counts = coords[::-1], counts[::-1]
+    return np.array([len(counts)] + counts, dtype=np.int64).tobytes() + coords.tobytes()
+
+
+# hash the vertices of all polylines at once and find where the polylines need to break
+# a vertex is a break point of a polyline if it is repeated within the polyline (self intersection)
+# or if it is an inner vertex of the polyline and any other polyline has the same vertex
+# vertices are compared by their coordinate keys if a coordinate grid is given, by their exact coordinates otherwise
+# returns, for every polyline, the positions of the first occurrence of each of its break points
+def common_vertices(polylines, grid=None):
+    counts = np.array([len(polyline) for polyline in polylines], dtype=np.int64)
+    if counts.sum() == 0:
+        return [[] for polyline in polylines]
+    # + 0.0 so that -0.0 and 0.0 hash the same
+    coords = np.concatenate([np.asarray(polyline, dtype=np.float64).reshape(-1, 2) for polyline in polylines]) + 0.0
+    edges = np.repeat(np.arange(len(polylines), dtype=np.int64), counts)
+    positions = np.arange(len(coords)) - np.repeat(np.cumsum(counts) - counts, counts)
+    inner = (positions > 0) & (positions < np.repeat(counts - 1, counts))
+
+    # number the distinct coordinates
+    if grid is not None:
+        points = np.unique(coordinate_keys(grid, coords[:, 0], coords[:, 1]), return_inverse=True)[1].ravel()
+    else:
+        order = np.lexsort((coords[:, 1], coords[:, 0]))
+        sorted_coords = coords[order]
+        new_point = np.r_[True, np.any(sorted_coords[1:] != sorted_coords[:-1], axis=1)]
+        points = np.empty(len(coords), dtype=np.int64)
+        points[order] = np.cumsum(new_point) - 1
+
+    # (point, polyline) pairs
+    pair_keys = points * len(polylines) + edges
+    pairs, first_vertex, pair_idx, pair_counts = np.unique(pair_keys, return_index=True, return_inverse=True,
+                                                           return_counts=True)
+    pair_points = pairs // len(polylines)
+    pair_inner = np.bincount(pair_idx.ravel(), weights=inner, minlength=len(pairs)) > 0
+    polylines_per_point = np.bincount(pair_points)
+    is_break = (pair_counts > 1) | (pair_inner & (polylines_per_point[pair_points] > 1))
+
+    # group by polyline, in vertex order
+    break_vertices = np.sort(first_vertex[is_break])
+    splits = np.searchsorted(edges[break_vertices], np.arange(1, len(polylines)))
+    return [group.tolist() for group in np.split(positions[break_vertices], splits)]
+
+
+# match polylines (e.g. cleaned edges) to the polylines they were made from (e.g. input features) by their vertices
+# a source of an edge is a polyline that has at least two of the edge vertices,
+# or, if there is none, at least one (for edges whose vertices were snapped or simplified away)
+# returns, for every edge, the indices of its sources (empty if no vertex is shared)
+def vertex_sources(edges, sources):
+    edge_counts = np.array([len(polyline) for polyline in edges], dtype=np.int64)
+    source_counts = np.array([len(polyline) for polyline in sources], dtype=np.int64)
+    if edge_counts.sum() == 0 or source_counts.sum() == 0:
+        return [[] for polyline in edges]
+    coords = np.concatenate([np.asarray(polyline, dtype=np.float64).reshape(-1, 2) for polyline in
+                             list(edges) + list(sources) if len(polyline) > 0]) + 0.0
+    points = np.unique(coords, axis=0, return_inverse=True)[1].ravel()
+    edge_points, source_points = points[:edge_counts.sum()], points[edge_counts.sum():]
+
+    # distinct (point, polyline) pairs on both sides
+    edge_pairs = np.unique(np.c_[edge_points, np.repeat(np.arange(len(edges)), edge_counts)], axis=0)
+    source_pairs = np.unique(np.c_[source_points, np.repeat(np.arange(len(sources)), source_counts)], axis=0)
+
+    # join on the point
+    lo = np.searchsorted(source_pairs[:, 0], edge_pairs[:, 0], side='left')
+    hi = np.searchsorted(source_pairs[:, 0], edge_pairs[:, 0], side='right')
+    counts = hi - lo
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    matches = np.c_[np.repeat(edge_pairs[:, 1], counts), source_pairs[np.repeat(lo, counts) + offsets, 1]]
+    matches, shared = np.unique(matches, axis=0, return_counts=True)
+
+    # keep the sources with the most shared vertices, up to two
+    best = np.zeros(len(edges), dtype=np.int64)
+    np.maximum.at(best, matches[:, 0], shared)
+    matches = matches[shared >= np.minimum(best[matches[:, 0]], 2)]
+    splits = np.searchsorted(matches[:, 0], np.arange(1, len(edges)))
+    return [group.tolist() for group in np.split(matches[:, 1], splits)]
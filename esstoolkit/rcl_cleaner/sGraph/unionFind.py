@@ -0,0 +1,86 @@
+# general imports
+from builtins import object
+
+
+# disjoint set (union-find) with path compression and union by size
+# used to group connected items of an adjacency dictionary {item: [adjacent items]} in near-linear time
+
+class UnionFind(object):
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+        return
+
+    def find(self, item):
+        self.add(item)
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, item1, item2):
+        root1, root2 = self.find(item1), self.find(item2)
+        if root1 == root2:
+            return root1
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+        return root1
+
+
+# groups of connected items, in order of first appearance in the dictionary
+def components(group_dictionary):
+    union_find = UnionFind()
+    for item, adjacent in group_dictionary.items():
+        union_find.add(item)
+        for adj_item in adjacent:
+            union_find.union(item, adj_item)
+
+    groups = {}
+    for item, adjacent in group_dictionary.items():
+        for member in [item] + list(adjacent):
+            root = union_find.find(member)
+            try:
+                group, members = groups[root]
+            except KeyError:
+                group, members = groups[root] = [], set()
+            if member not in members:
+                members.add(member)
+                group.append(member)
+    return [group for group, members in groups.values()]
+
+
+# groups of items that form chains (every item has at most two adjacent items)
+# each chain is returned in walking order, starting from its end that comes first in the dictionary
+# closed chains (rings) are not returned
+def chains(group_dictionary):
+    ends = dict((item, idx) for idx, (item, adjacent) in enumerate(group_dictionary.items()) if len(adjacent) != 2)
+    chains_list = []
+    for group in components(group_dictionary):
+        group_ends = [item for item in group if item in ends]
+        if len(group_ends) == 0:
+            continue
+        start = min(group_ends, key=ends.get)
+        chain = [start]
+        visited = {start}
+        walking = True
+        while walking:
+            walking = False
+            for adj_item in group_dictionary.get(chain[-1], []):
+                if adj_item not in visited:
+                    visited.add(adj_item)
+                    chain.append(adj_item)
+                    walking = True
+                    break
+        chains_list.append(chain)
+    return sorted(chains_list, key=lambda chain: ends[chain[0]])
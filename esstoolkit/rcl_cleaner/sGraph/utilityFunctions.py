@@ -2,14 +2,12 @@ from __future__ import print_function
 
 import collections
 import math
-import ntpath
 from collections import defaultdict
 
-import psycopg2
-from psycopg2.extensions import AsIs
 from qgis.PyQt.QtCore import QVariant
-from qgis.core import QgsFields, QgsField, QgsGeometry, QgsFeature, QgsVectorLayer, QgsVectorFileWriter, NULL, \
-    QgsWkbTypes, QgsCoordinateTransformContext
+from qgis.core import QgsFields, QgsField, QgsGeometry, QgsFeature, NULL, QgsWkbTypes
+
+from esstoolkit.utilities import layer_writer
 
 # FEATURES -----------------------------------------------------------------
 
@@ -23,11 +21,29 @@ error_flds.append(QgsField('error_type', QVariant.String))
 error_feat.setFields(error_flds)
 
 
+# features of several sources with a known count, made again every time they are iterated
+# callable sources (e.g. sGraph.error_features) are called on every iteration so that nothing is kept in between
+class FeatureStream(object):
+
+    def __init__(self, count, *sources):
+        self.count = count
+        self.sources = sources
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for source in self.sources:
+            for f in (source() if callable(source) else source):
+                yield f
+
+
 # do not snap - because if self loop needs to break it will not
 
 # FEATURES -----------------------------------------------------------------
 
-def clean_features_iter(feat_iter):
+# precision: decimals the vertices are rounded to, None to keep the coordinates as they are
+def clean_features_iter(feat_iter, precision=None):
     id = 0
     for f in feat_iter:
 
@@ -40,10 +56,15 @@ def clean_features_iter(feat_iter):
             f.geometry().constGet().dropZValue()
             f_geom = f.geometry()
 
+        # vertices moved to the precision grid, consecutive vertices on the same grid point are merged
+        grid_geom = None
+        if precision is not None and f_geom is not None and f_geom is not NULL and f_geom.constGet() is not None:
+            grid_geom = f_geom.snappedToGrid(10.0 ** -precision, 10.0 ** -precision)
+
         if f_geom is None or f_geom is NULL or not f_geom.isGeosValid():
             # empty or invalid geometry
             pass
-        elif f_geom.length() <= 0:
+        elif f_geom.length() <= 0 or (grid_geom is not None and grid_geom.isEmpty()):
             ml_error = QgsFeature(error_feat)
             if f_geom.isMultipart():
                 ml_error.setGeometry(QgsGeometry.fromPointXY(f_geom.asMultiPolyline()[0][0]))
@@ -52,6 +73,9 @@ def clean_features_iter(feat_iter):
             ml_error.setAttributes(['point'])
             points.append(ml_error)
         elif f_geom.type() == QgsWkbTypes.LineGeometry:
+            if grid_geom is not None:
+                f_geom = grid_geom
+                f.setGeometry(f_geom)
             if not f_geom.isMultipart():
                 f.setId(id)
                 id += 1
@@ -127,6 +151,26 @@ def angle_3_points(p1, p2, p3):
     return 180 - math.degrees(math.acos(cos_angle))
 
 
+# polylines of a chain of edges, in walking order, and the points of the nodes they start from
+# each polyline is reversed if it does not start at its node, then all are concatenated once
+# returns None if the polylines do not form a continuous line
+def merge_polylines(polylines, node_points):
+    merged_points = []
+    for polyline, point in zip(polylines, node_points):
+        if len(polyline) == 0:
+            return None
+        if math.hypot(polyline[-1][0] - point[0], polyline[-1][1] - point[1]) < \
+                math.hypot(polyline[0][0] - point[0], polyline[0][1] - point[1]):
+            polyline = polyline[::-1]
+        if len(merged_points) == 0:
+            merged_points = list(polyline)
+        elif (polyline[0][0], polyline[0][1]) != (merged_points[-1][0], merged_points[-1][1]):
+            return None
+        else:
+            merged_points += list(polyline[1:])
+    return merged_points
+
+
 def merge_geoms(geoms, simpl_threshold):
     # get attributes from longest
     new_geom = geoms[0]
@@ -148,78 +192,4 @@ gr = [[29, 27, 26, 28], [31, 11, 10, 3, 30], [71, 51, 52, 69],
 
 # geom_type allowed: 'Point', 'Linestring', 'Polygon'
 def to_layer(features, crs, encoding, geom_type, layer_type, path):
-    first_feat = features[0]
-    fields = first_feat.fields()
-    layer = None
-    if layer_type == 'memory':
-        layer = QgsVectorLayer(geom_type + '?crs=' + crs.authid(), path, "memory")
-        pr = layer.dataProvider()
-        pr.addAttributes(fields.toList())
-        layer.updateFields()
-        layer.startEditing()
-        pr.addFeatures(features)
-        layer.commitChanges()
-
-    elif layer_type == 'shapefile':
-
-        wkbTypes = {'Point': QgsWkbTypes.Point, 'Linestring': QgsWkbTypes.LineString, 'Polygon': QgsWkbTypes.Polygon}
-        options = QgsVectorFileWriter.SaveVectorOptions()
-        options.driverName = "ESRI Shapefile"
-        options.fileEncoding = encoding
-        file_writer = QgsVectorFileWriter.create(path, fields, wkbTypes[geom_type], crs,
-                                                 QgsCoordinateTransformContext(), options)
-        if file_writer.hasError() != QgsVectorFileWriter.NoError:
-            print("Error when creating shapefile: ", file_writer.errorMessage())
-        del file_writer
-        layer = QgsVectorLayer(path, ntpath.basename(path)[:-4], "ogr")
-        pr = layer.dataProvider()
-        layer.startEditing()
-        pr.addFeatures(features)
-        layer.commitChanges()
-
-    elif layer_type == 'postgis':
-
-        # this is needed to load the table later
-        # uri = connstring + """ type=""" + geom_types[geom_type] + """ table=\"""" + schema_name + """\".\"""" + table_name + """\" (geom) """
-
-        connstring, schema_name, table_name = path
-        uri = connstring + """ type=""" + geom_type + """ table=\"""" + schema_name + """\".\"""" + table_name + """\" (geom) """
-        crs_id = crs.postgisSrid()
-        try:
-            con = psycopg2.connect(connstring)
-            cur = con.cursor()
-            create_query = cur.mogrify(
-                """DROP TABLE IF EXISTS "%s"."%s"; CREATE TABLE "%s"."%s"( geom geometry(%s, %s))""", (
-                    AsIs(schema_name), AsIs(table_name), AsIs(schema_name), AsIs(table_name), geom_type, AsIs(crs_id)))
-            cur.execute(create_query)
-            con.commit()
-            post_q_flds = {2: 'bigint', 6: 'numeric', 1: 'bool', 'else': 'text', 4: 'numeric'}
-            for f in fields:
-                f_type = f.type()
-                if f_type not in [2, 6, 1]:
-                    f_type = 'else'
-                attr_query = cur.mogrify("""ALTER TABLE "%s"."%s" ADD COLUMN "%s" %s""", (
-                    AsIs(schema_name), AsIs(table_name), AsIs(f.name()), AsIs(post_q_flds[f_type])))
-                cur.execute(attr_query)
-                con.commit()
-            field_names = ",".join(['"' + f.name() + '"' for f in fields])
-            for feature in features:
-                attrs = [i if i else None for i in feature.attributes()]
-                insert_query = cur.mogrify("""INSERT INTO "%s"."%s" (%s, geom) VALUES %s, ST_GeomFromText(%s,%s))""", (
-                    AsIs(schema_name), AsIs(table_name), AsIs(field_names), tuple(attrs), feature.geometry().asWkt(),
-                    AsIs(crs_id)))
-                idx = insert_query.find(b', ST_GeomFromText') - 1
-                insert_query = insert_query[:idx] + insert_query[(idx + 1):]
-                # QgsMessageLog.logMessage('sql query %s' % insert_query, level=Qgis.Critical)
-                cur.execute(insert_query)
-                # con.commit()
-            pkey_query = cur.mogrify(
-                """ALTER TABLE "%s"."%s" DROP COLUMN IF EXISTS rcl_id; ALTER TABLE "%s"."%s" ADD COLUMN rcl_id serial PRIMARY KEY NOT NULL;""",
-                (AsIs(schema_name), AsIs(table_name), AsIs(schema_name), AsIs(table_name)))
-            cur.execute(pkey_query)
-            con.commit()
-            con.close()
-            layer = QgsVectorLayer(uri, table_name, 'postgres')
-        except psycopg2.DatabaseError as e:
-            print(e)
-    return layer
+    return layer_writer.write_features(features, None, crs, encoding, geom_type, layer_type, path, 'rcl_id')
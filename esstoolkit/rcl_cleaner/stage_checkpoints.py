@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-11-10
+# copyright            : (C) 2016 by Space Syntax Ltd
+# author               : Ioanna Kolovou
+# email                : i.kolovou@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# Checkpoints of the cleaning stages.
+# The graph, its errors and unlinks are saved after every stage of the cleaning. A run with the same input features
+# and settings starts again after the last saved stage. The checkpoints are keyed by a digest of all the input
+# features and the settings, so an edit of the layer or a change of the settings never reuses an old one.
+
+from __future__ import absolute_import
+
+import hashlib
+import os
+
+from qgis.core import QgsApplication
+
+from . import incremental_cleaning
+
+# in the order they run
+stages = ('load', 'clean', 'fix_unlinks', 'snap', 'merge', 'final_clean', 'unlinks')
+
+# settings that change the cleaned output, and the graph type that is saved
+checkpoint_settings = incremental_cleaning.state_settings + ('compact',)
+
+
+def checkpoint_key(layer, settings):
+    key = hashlib.md5(repr([layer.source()] + [settings.get(name) for name in checkpoint_settings]).encode('utf-8'))
+    for f in layer.getFeatures():
+        key.update(incremental_cleaning.feature_digest(f).encode('utf-8'))
+    return key.hexdigest()
+
+
+def checkpoint_path(layer, settings):
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'esstoolkit', 'rcl_cleaner', 'checkpoints',
+                        checkpoint_key(layer, settings) + '.pickle')
+
+
+def load_checkpoint(path):
+    return incremental_cleaning.load_state(path)
+
+
+def save_checkpoint(path, checkpoint):
+    # written aside first, a crash while saving keeps the previous checkpoint
+    incremental_cleaning.save_state(path + '.tmp', checkpoint)
+    os.replace(path + '.tmp', path)
+
+
+def remove_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# stages already done in the checkpoint are not run again
+def stage_pending(checkpoint, stage):
+    return checkpoint is None or stages.index(stage) > stages.index(checkpoint['stage'])
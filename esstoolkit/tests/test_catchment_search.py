@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2020-09-10
+# copyright            : (C) 2020 by Petros Koutsolampros / Space Syntax Ltd.
+# author               : Petros Koutsolampros
+# email                : p.koutsolampros@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import multiprocessing
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from esstoolkit.catchment_analyser import alpha_shape, graph_search
+
+
+class TestCatchmentSearch(unittest.TestCase):
+
+    @staticmethod
+    def make_graph(lines):
+        # both directions of every line (start, end, cost), vertices on a row
+        vertex_count = max(max(start, end) for start, end, cost in lines) + 1
+        starts = [start for start, end, cost in lines] + [end for start, end, cost in lines]
+        ends = [end for start, end, cost in lines] + [start for start, end, cost in lines]
+        costs = [cost for start, end, cost in lines] * 2
+        return graph_search.GraphArrays(np.arange(vertex_count), np.zeros(vertex_count), starts, ends, costs)
+
+    def test_compressed_rows(self):
+        offsets, ends, values = graph_search.compressed_rows(4, [2, 0, 2, 1], [10, 11, 12, 13], [0, 1, 2, 3])
+        self.assertEqual(offsets.tolist(), [0, 1, 2, 4, 4])
+        self.assertEqual(ends.tolist(), [11, 13, 10, 12])
+        self.assertEqual(values.tolist(), [1, 3, 0, 2])
+
+    def test_bounded_dijkstra(self):
+        # a line 0-1-2-3 with a shortcut 0-2, and 4-5 not connected
+        graph = self.make_graph([(0, 1, 1.0), (1, 2, 1.0), (2, 3, 5.0), (0, 2, 1.5), (4, 5, 1.0)])
+        vertices, costs = graph.bounded_dijkstra(0, np.inf)
+        self.assertEqual(dict(zip(vertices.tolist(), costs.tolist())), {0: 0.0, 1: 1.0, 2: 1.5, 3: 6.5})
+        # settled in cost order, vertices further than the cutoff are not settled
+        vertices, costs = graph.bounded_dijkstra(0, 1.5)
+        self.assertEqual(vertices.tolist(), [0, 1, 2])
+        self.assertEqual(costs.tolist(), [0.0, 1.0, 1.5])
+        vertices, costs = graph.bounded_dijkstra(4, 0)
+        self.assertEqual(vertices.tolist(), [4])
+
+    def test_gather_rows(self):
+        offsets, values = graph_search.compressed_rows(4, [0, 2, 2, 3], [10, 20, 21, 30])
+        self.assertEqual(graph_search.gather_rows(offsets, values, [2, 1, 3]).tolist(), [20, 21, 30])
+        self.assertEqual(graph_search.gather_rows(offsets, values, []).tolist(), [])
+
+    def test_arc_costs(self):
+        # arcs 0-1, 1-2, 2-3 from origin 1, vertex 3 beyond the cutoff
+        starts, ends = np.array([0, 1, 2]), np.array([1, 2, 3])
+        vertex_costs = np.array([3.5, 0.0, 2.5, np.inf])
+        arcs, costs = graph_search.arc_costs(starts, ends, vertex_costs, np.array([0, 1, 2]), 1, 3)
+        self.assertEqual(arcs.tolist(), [0, 1, 2])
+        self.assertEqual(costs.tolist(), [0, 0, 2])
+        self.assertEqual(costs.dtype, np.float32)
+        arcs, costs = graph_search.arc_costs(starts, ends, vertex_costs, np.array([2]), 1, 2)
+        self.assertEqual(arcs.tolist(), [])
+
+    def test_reached_points(self):
+        # arcs (0, 0)-(10, 0) and (20, 0)-(10, 0), costs 0 at x = 0 and 30 at x = 20
+        xs, ys = np.array([0.0, 10.0, 20.0]), np.zeros(3)
+        starts, ends = np.array([0, 2]), np.array([1, 1])
+        vertex_costs = np.array([0.0, 10.0, 30.0])
+        point_xs, point_ys, point_costs = graph_search.reached_points(xs, ys, starts, ends, vertex_costs,
+                                                                      np.array([0, 1]), [4, 15])
+        # ends within 15, the point 4 from (0, 0) on the first arc and 5 from (10, 0) on the second one
+        self.assertEqual(point_xs.tolist(), [0.0, 4.0, 10.0, 15.0])
+        self.assertEqual(point_ys.tolist(), [0.0] * 4)
+        self.assertEqual(point_costs.tolist(), [0.0, 4.0, 10.0, 15.0])
+
+    def test_search_origins(self):
+        # a grid of 5 x 5 vertices, with every origin searched in a worker process as in a serial run
+        lines = [(row * 5 + col, row * 5 + col + 1, 1.0 + col) for row in range(5) for col in range(4)] + [
+            (row * 5 + col, row * 5 + col + 5, 2.0) for row in range(4) for col in range(5)]
+        graph = self.make_graph(lines)
+        starts = np.array([min(start, end) for start, end, cost in lines])
+        ends = np.array([max(start, end) for start, end, cost in lines])
+        search = graph_search.CatchmentSearch(graph, starts, ends)
+        origins = [(0, 0), (1, 12), (2, 24)]
+        serial = [(index,) + search.origin_catchment(vertex, [2, 5]) for index, vertex in origins]
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(2, mp_context=context, initializer=graph_search.init_search,
+                                 initargs=(search,)) as pool:
+            parallel = pool.submit(graph_search.search_origins, origins[:2], [2, 5]).result() + pool.submit(
+                graph_search.search_origins, origins[2:], [2, 5]).result()
+        for serial_result, parallel_result in zip(serial, parallel):
+            self.assertEqual(serial_result[0], parallel_result[0])
+            self.assertEqual(serial_result[1].tolist(), parallel_result[1].tolist())
+            self.assertEqual(serial_result[2].tolist(), parallel_result[2].tolist())
+            for serial_points, parallel_points in zip(serial_result[3], parallel_result[3]):
+                self.assertEqual(serial_points.tolist(), parallel_points.tolist())
+        # a set stop event leaves the origins of the chunk unsearched
+        stop = context.Event()
+        stop.set()
+        with ProcessPoolExecutor(1, mp_context=context, initializer=graph_search.init_search,
+                                 initargs=(search, stop)) as pool:
+            self.assertEqual(pool.submit(graph_search.search_origins, origins, [2, 5]).result(), [])
+        # the arcs of the origin cost 0, the scratch costs are reset after every search
+        arcs, costs, points = search.origin_catchment(12, [2])
+        self.assertTrue(np.all(costs[(starts[arcs] == 12) | (ends[arcs] == 12)] == 0))
+        self.assertTrue(np.all(np.isinf(search.cost)))
+
+    def test_alpha_triangles(self):
+        # a 3 x 3 grid of unit squares split in two triangles, and a far point on long triangles at its right side
+        squares = [((x, y), (x + 1, y), (x + 1, y + 1), (x, y + 1)) for x in range(3) for y in range(3)]
+        corners = [(a, b, c) for a, b, c, d in squares] + [(a, c, d) for a, b, c, d in squares] + [
+            ((3, 0), (8, 1.5), (3, 1)), ((3, 1), (8, 1.5), (3, 2)), ((3, 2), (8, 1.5), (3, 3))]
+        points = np.unique(np.array([corner for triangle in corners for corner in triangle], dtype=np.float64), axis=0)
+        xs, ys = points[:, 0], points[:, 1]
+        self.assertEqual(len(xs), 17)
+        triangles = alpha_shape.triangle_vertices(xs, ys, [[x for x, y in triangle] for triangle in corners],
+                                                  [[y for x, y in triangle] for triangle in corners])
+        self.assertEqual(xs[triangles[0]].tolist(), [0.0, 1.0, 1.0])
+        # the length grows until the shortest of the long triangles puts the far point in one piece with the grid
+        kept, whole = alpha_shape.alpha_triangles(xs, ys, triangles, 1.0)
+        self.assertTrue(whole)
+        self.assertEqual(len(kept), 19)
+        self.assertEqual(sorted(zip(xs[kept[-1]].tolist(), ys[kept[-1]].tolist())), [(3.0, 1.0), (3.0, 2.0),
+                                                                                     (8.0, 1.5)])
+        # without the far point the triangles of the grid, counterclockwise
+        kept, whole = alpha_shape.alpha_triangles(xs, ys, triangles[:18], 1.0)
+        self.assertTrue(whole)
+        self.assertEqual(len(kept), 18)
+        corner_xs, corner_ys = xs[kept], ys[kept]
+        areas = 0.5 * ((corner_xs[:, 1] - corner_xs[:, 0]) * (corner_ys[:, 2] - corner_ys[:, 0]) -
+                       (corner_xs[:, 2] - corner_xs[:, 0]) * (corner_ys[:, 1] - corner_ys[:, 0]))
+        self.assertEqual(areas.tolist(), [0.5] * 18)
+        self.assertEqual(len(alpha_shape.alpha_triangles(xs, ys, np.zeros((0, 3), dtype=np.int64), 1.0)[0]), 0)
+
+    def test_band_ring(self):
+        # two triangles of the square (0, 0)-(2, 2), costs the distance along x
+        xs, ys = np.array([0.0, 2.0, 2.0, 0.0]), np.array([0.0, 0.0, 2.0, 2.0])
+        costs = xs.copy()
+        triangles = np.array([[0, 1, 2], [0, 2, 3]])
+        ring_xs, ring_ys = alpha_shape.band_ring(xs, ys, costs, triangles, 1.0)
+        # the half of the square up to x = 1, cut on the diagonal and the sides
+        self.assertEqual(sorted(set(zip(ring_xs.tolist(), ring_ys.tolist()))),
+                         [(0.0, 0.0), (0.0, 2.0), (1.0, 0.0), (1.0, 1.0), (1.0, 2.0)])
+        self.assertEqual(0.5 * np.sum(ring_xs[:-1] * ring_ys[1:] - ring_xs[1:] * ring_ys[:-1]), 2.0)
+        # all the square within 2, nothing within a negative distance
+        ring_xs, ring_ys = alpha_shape.band_ring(xs, ys, costs, triangles, 2.0)
+        self.assertEqual(len(ring_xs), 5)
+        self.assertEqual(len(alpha_shape.band_ring(xs, ys, costs, triangles, -1.0)[0]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2020-08-01
+# copyright            : (C) 2020 by Petros Koutsolampros / Space Syntax Ltd.
+# author               : Petros Koutsolampros
+# email                : p.koutsolampros@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import unittest
+
+from qgis.PyQt.QtCore import QByteArray, QDate, QDateTime, QTime
+
+from esstoolkit.utilities import layer_writer
+
+
+class TestLayerWriter(unittest.TestCase):
+
+    def test_batches(self):
+        self.assertEqual(list(layer_writer.batches(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(layer_writer.batches([], 2)), [])
+
+    def test_copy_value(self):
+        self.assertEqual(layer_writer.copy_value(None), '\\N')
+        self.assertEqual(layer_writer.copy_value(True), 't')
+        self.assertEqual(layer_writer.copy_value(0), '0')
+        self.assertEqual(layer_writer.copy_value('a\tb\\c'), 'a\\tb\\\\c')
+        self.assertEqual(layer_writer.copy_value(QDate(2020, 8, 1)), '2020-08-01')
+        self.assertEqual(layer_writer.copy_value(QDateTime(QDate(2020, 8, 1), QTime(9, 30))), '2020-08-01T09:30:00')
+        self.assertEqual(layer_writer.copy_value(QDate()), '\\N')
+        self.assertEqual(layer_writer.copy_value(QByteArray(b'\x01\xff')), '\\\\x01ff')
+        self.assertEqual(layer_writer.copy_value(b'\x01\xff'), '\\\\x01ff')
+
+
+if __name__ == '__main__':
+    unittest.main()
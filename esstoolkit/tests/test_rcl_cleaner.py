@@ -13,14 +13,16 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import pickle
 import unittest
 
 from qgis.core import (QgsApplication, QgsVectorLayer, QgsFeature, QgsLineString, QgsPoint)
 
 from esstoolkit.network_segmenter.segment_tools import segmentor
 from esstoolkit.rcl_cleaner.road_network_cleaner_dialog import RoadNetworkCleanerDialog
+from esstoolkit.rcl_cleaner.sGraph.sCompactGraph import sCompactGraph
 from esstoolkit.rcl_cleaner.sGraph.sGraph import sGraph
-from esstoolkit.rcl_cleaner.sGraph.utilityFunctions import clean_features_iter
+from esstoolkit.rcl_cleaner.sGraph.utilityFunctions import clean_features_iter, merge_polylines
 
 qgs = QgsApplication([], False)
 qgs.initQgis()
@@ -39,7 +41,80 @@ class TestRCLCleaner(unittest.TestCase):
         vl.updateExtents()
         return vl
 
+    def test_merge_polylines(self):
+        # second polyline reversed, third in order
+        polylines = [[(0, 0), (1, 0)], [(2, 1), (1, 1), (1, 0)], [(2, 1), (3, 1)]]
+        node_points = [(0, 0), (1, 0), (2, 1)]
+        self.assertEqual(merge_polylines(polylines, node_points), [(0, 0), (1, 0), (1, 1), (2, 1), (3, 1)])
+        # not continuous
+        self.assertIsNone(merge_polylines([[(0, 0), (1, 0)], [(2, 0), (3, 0)]], [(0, 0), (2, 0)]))
+
+    def test_snapshot(self):
+        self.check_snapshot(sGraph({}, {}), sGraph({}, {}))
+
+    def test_snapshot_compact(self):
+        self.check_snapshot(sCompactGraph(), sCompactGraph())
+
+    def test_snapshot_compact_copy(self):
+        graph = sCompactGraph()
+        lines = TestRCLCleaner.make_geometry_feature_layer(
+            "LineString",
+            [QgsLineString([QgsPoint(0, 0), QgsPoint(10, 0)]),
+             QgsLineString([QgsPoint(10, 0), QgsPoint(10, 10), QgsPoint(20, 10)])])
+        graph.load_edges(clean_features_iter(lines.getFeatures()), 0)
+        state = graph.snapshot()
+        # later changes of the graph are not in the snapshot
+        e = int(graph.topology.edge_ids()[0])
+        graph.topology.geometries[e][0] = (-1.0, -1.0)
+        graph.topology.remove_edge(e)
+        self.assertEqual(graph.edge_count(), 1)
+        self.assertEqual(state['topology'].edges_count, 2)
+        self.assertTrue(state['topology'].edge_alive[e])
+        self.assertEqual(state['topology'].geometries[e][0].tolist(), [0.0, 0.0])
+
+    def check_snapshot(self, graph, restored_graph):
+        lines = TestRCLCleaner.make_geometry_feature_layer(
+            "LineString",
+            [QgsLineString([QgsPoint(0, 0), QgsPoint(10, 0)]),
+             QgsLineString([QgsPoint(10, 0), QgsPoint(10, 10), QgsPoint(20, 10)])])
+        graph.load_edges(clean_features_iter(lines.getFeatures()), 0)
+        graph.unlinks.add(5.0, 5.0, 'unlink')
+
+        restored_graph.restore(pickle.loads(pickle.dumps(graph.snapshot())), lines.fields())
+        self.assertEqual(restored_graph.edge_count(), graph.edge_count())
+        self.assertEqual(restored_graph.node_count(), graph.node_count())
+        self.assertEqual([f.geometry().asWkt() for f in restored_graph.edge_features()],
+                         [f.geometry().asWkt() for f in graph.edge_features()])
+        self.assertEqual(list(restored_graph.unlinks.rows()), [(5.0, 5.0, 'unlink', -1)])
+
+    def test_break_compact(self):
+        lines = TestRCLCleaner.make_geometry_feature_layer(
+            "LineString",
+            [QgsLineString([QgsPoint(0, 0), QgsPoint(10, 0), QgsPoint(20, 0)]),
+             QgsLineString([QgsPoint(10, -10), QgsPoint(10, 0), QgsPoint(10, 10)]),
+             # self intersecting
+             QgsLineString([QgsPoint(30, 0), QgsPoint(40, 0), QgsPoint(40, 10), QgsPoint(35, 10), QgsPoint(35, 0),
+                            QgsPoint(35, -10)])])
+        pseudo_graph, graph = sGraph({}, {}), sGraph({}, {})
+        pseudo_graph.load_edges_w_o_topology(clean_features_iter(lines.getFeatures()))
+        graph.load_edges(pseudo_graph.break_features_iter(False, 0), 0)
+
+        # the compact graph is broken on the coordinates, to the same edges and break points
+        compact_graph = sCompactGraph()
+        compact_graph.load_broken_edges(compact_graph.read_polylines(clean_features_iter(lines.getFeatures())), 0)
+        self.assertEqual(compact_graph.edge_count(), graph.edge_count())
+        self.assertEqual(compact_graph.node_count(), graph.node_count())
+        self.assertEqual(sorted(f.geometry().asWkt() for f in compact_graph.edge_features()),
+                         sorted(f.geometry().asWkt() for f in graph.edge_features()))
+        self.assertEqual(sorted(compact_graph.errors.rows()), sorted(graph.errors.rows()))
+
     def test_merge_nodes(self):
+        self.check_merge_nodes(sGraph({}, {}))
+
+    def test_merge_nodes_compact(self):
+        self.check_merge_nodes(sCompactGraph())
+
+    def check_merge_nodes(self, graph):
 
         error_tolerance = 0.0001
 
@@ -101,7 +176,6 @@ class TestRCLCleaner(unittest.TestCase):
         if break_at_vertices:
 
             pseudo_graph.step = load_range / float(segment_layer.featureCount())
-            graph = sGraph({}, {})
             graph.total_progress = load_range
             pseudo_graph.load_edges_w_o_topology(clean_features_iter(segment_layer.getFeatures()))
             # QgsMessageLog.logMessage('pseudo_graph edges added %s' % load_range, level=Qgis.Critical)
@@ -112,12 +186,11 @@ class TestRCLCleaner(unittest.TestCase):
             # QgsMessageLog.logMessage('pseudo_graph edges broken %s' % break_range, level=Qgis.Critical)
 
         else:
-            graph = sGraph({}, {})
             graph.step = load_range / float(segment_layer.featureCount())
             graph.load_edges(clean_features_iter(segment_layer.getFeatures()), angle_threshold)
             # QgsMessageLog.logMessage('graph edges added %s' % load_range, level=Qgis.Critical)
 
-        graph.step = cl1_range / (float(len(graph.sEdges)) * 2.0)
+        graph.step = cl1_range / (float(graph.edge_count()) * 2.0)
         if orphans:
             graph.clean(True, False, snap_threshold, True)
         else:
@@ -125,16 +198,16 @@ class TestRCLCleaner(unittest.TestCase):
         # QgsMessageLog.logMessage('graph clean parallel and closed pl %s' % cl1_range, level=Qgis.Critical)
 
         if fix_unlinks:
-            graph.step = fix_range / float(len(graph.sEdges))
+            graph.step = fix_range / float(graph.edge_count())
             graph.fix_unlinks()
             # QgsMessageLog.logMessage('unlinks added  %s' % fix_range, level=Qgis.Critical)
 
         if snap_threshold != 0:
 
-            graph.step = snap_range / float(len(graph.sNodes))
+            graph.step = snap_range / float(graph.node_count())
             graph.snap_endpoints(snap_threshold)
             # QgsMessageLog.logMessage('snap  %s' % snap_range, level=Qgis.Critical)
-            graph.step = cl2_range / (float(len(graph.sEdges)) * 2.0)
+            graph.step = cl2_range / (float(graph.edge_count()) * 2.0)
 
             if orphans:
                 graph.clean(True, False, snap_threshold, True)
@@ -144,36 +217,35 @@ class TestRCLCleaner(unittest.TestCase):
 
         if merge_type == 'intersections':
 
-            graph.step = merge_range / float(len(graph.sNodes))
+            graph.step = merge_range / float(graph.node_count())
             graph.merge_b_intersections(angle_threshold)
             # QgsMessageLog.logMessage('merge %s %s angle_threshold ' % (merge_range, angle_threshold),
             #                          level=Qgis.Critical)
 
         elif merge_type == 'collinear':
 
-            graph.step = merge_range / float(len(graph.sEdges))
+            graph.step = merge_range / float(graph.edge_count())
             graph.merge_collinear(collinear_threshold, angle_threshold)
             # QgsMessageLog.logMessage('merge  %s' % merge_range, level=Qgis.Critical)
 
         # cleaned multiparts so that unlinks are generated properly
         if orphans:
-            graph.step = cl3_range / (float(len(graph.sEdges)) * 2.0)
+            graph.step = cl3_range / (float(graph.edge_count()) * 2.0)
             graph.clean(True, orphans, snap_threshold, False, True)
         else:
-            graph.step = cl3_range / (float(len(graph.sEdges)) * 2.0)
+            graph.step = cl3_range / (float(graph.edge_count()) * 2.0)
             graph.clean(True, False, snap_threshold, False, True)
 
         if get_unlinks:
-            graph.step = unlinks_range / float(len(graph.sEdges))
+            graph.step = unlinks_range / float(graph.edge_count())
             graph.generate_unlinks()
-            unlinks = graph.unlinks
+            unlinks = graph.unlink_features()
         else:
             unlinks = []
 
-        cleaned_features = [e.feature for e in list(graph.sEdges.values())]
+        cleaned_features = list(graph.edge_features())
         # add to errors multiparts and points
-        graph.errors += multiparts
-        graph.errors += points
+        errors = list(graph.error_features()) + multiparts + points
 
         expected_segments = [
             QgsLineString([QgsPoint(535088.141198, 185892.128181), QgsPoint(535061.604423, 186143.502228)]),
@@ -206,9 +278,9 @@ class TestRCLCleaner(unittest.TestCase):
             QgsPoint(535065.203499, 186141.459442)
         ]
 
-        self.assertEqual(len(graph.errors), len(expected_errors))
+        self.assertEqual(len(errors), len(expected_errors))
 
-        for break_point_feat in graph.errors:
+        for break_point_feat in errors:
             break_point = break_point_feat.geometry().asPoint()
             for expected_break_point in expected_errors:
                 xeq = abs(break_point.x() - expected_break_point.x()) < error_tolerance
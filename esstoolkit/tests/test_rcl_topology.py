@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2020-09-10
+# copyright            : (C) 2020 by Petros Koutsolampros / Space Syntax Ltd.
+# author               : Petros Koutsolampros
+# email                : p.koutsolampros@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import unittest
+
+import numpy as np
+
+from esstoolkit.rcl_cleaner.sGraph import networkScan
+from esstoolkit.rcl_cleaner.sGraph import pointStore
+from esstoolkit.rcl_cleaner.sGraph import segmentCrossings
+from esstoolkit.rcl_cleaner.sGraph import spatialHash
+from esstoolkit.rcl_cleaner.sGraph import unionFind
+from esstoolkit.rcl_cleaner.sGraph.sTopology import sTopology
+
+
+class TestRCLTopology(unittest.TestCase):
+
+    @staticmethod
+    def make_topology(polylines):
+        topology = sTopology(capacity=2)
+        for polyline in polylines:
+            start = topology.load_point(*polyline[0])
+            end = topology.load_point(*polyline[-1])
+            topology.add_edge(start, end, np.array(polyline, dtype=np.float64), [len(polyline)])
+        topology.rebuild_adjacency()
+        return topology
+
+    def test_adjacency(self):
+        # a star of three lines and a self loop on the centre
+        topology = TestRCLTopology.make_topology([[(0, 0), (1, 0)],
+                                                  [(0, 0), (0, 1)],
+                                                  [(-1, 0), (0, 0)],
+                                                  [(0, 0), (1, 1), (0, 2), (0, 0)]])
+
+        self.assertEqual(topology.nodes_count, 4)
+        self.assertEqual(topology.edges_count, 4)
+        self.assertEqual(topology.node_edges(1), [1, 2, 3, 4, 4])
+        self.assertEqual(topology.node_topology(1), [2, 3, 4, 1, 1])
+        self.assertEqual(topology.node_edges(4), [3])
+        self.assertEqual(topology.edge_nodes(3), (4, 1))
+
+    def test_updates(self):
+        topology = TestRCLTopology.make_topology([[(0, 0), (1, 0)],
+                                                  [(1, 0), (2, 0)],
+                                                  [(2, 0), (2, 1)]])
+
+        # changes go to the overlay until the adjacency is rebuilt
+        topology.remove_edge(2)
+        merged = topology.add_node(1, 0.5)
+        topology.replace_end(1, merged)
+        new_edge = topology.add_edge(merged, merged, np.array([(1, 0.5), (1, 1), (1, 0.5)]), [])
+        self.assertEqual(topology.node_edges(2), [])
+        self.assertEqual(topology.node_edges(merged), [1, 4, 4])
+        self.assertEqual(topology.geometries[1].tolist(), [[0, 0], [1, 0.5]])
+
+        topology.rebuild_adjacency()
+        self.assertEqual(topology.node_edges(merged), [1, new_edge, new_edge])
+        self.assertEqual(topology.node_edges(3), [3])
+        self.assertEqual(topology.edge_ids().tolist(), [1, 3, 4])
+        self.assertEqual(topology.edges_count, 3)
+
+    def test_geometry(self):
+        topology = TestRCLTopology.make_topology([[(0, 0), (3, 4), (3, 8)]])
+
+        self.assertAlmostEqual(topology.edge_length(1), 9)
+        self.assertEqual(topology.edge_vertex_count(1), 3)
+        self.assertEqual(topology.edge_bounds(1), (0, 0, 3, 8))
+
+    def test_components(self):
+        snapped_nodes = {1: [2], 2: [1, 3], 3: [2], 7: [9], 9: [7], 4: [5, 6], 5: [4], 6: [4]}
+        self.assertEqual(unionFind.components(snapped_nodes), [[1, 2, 3], [7, 9], [4, 5, 6]])
+
+        union_find = unionFind.UnionFind()
+        for item1, item2 in zip(range(100), range(1, 101)):
+            union_find.union(item1, item2)
+        self.assertEqual(union_find.find(0), union_find.find(100))
+        self.assertEqual(union_find.size[union_find.find(50)], 101)
+
+    def test_chains(self):
+        # edges 3-1-2 form a chain, 4-5 a chain and 6-7-8 a ring
+        collinear_edges = {1: [3, 2], 2: [1], 3: [1], 4: [5], 5: [4], 6: [7, 8], 7: [6, 8], 8: [7, 6]}
+        self.assertEqual(unionFind.chains(collinear_edges), [[2, 1, 3], [4, 5]])
+
+    def test_snap_neighbours(self):
+        rng = np.random.RandomState(0)
+        coords = rng.uniform(-50, 50, (500, 2))
+        ids = np.arange(1, 501) * 3
+        snapped_nodes = spatialHash.snap_neighbours(ids, coords[:, 0], coords[:, 1], 2.5, batch_size=64)
+
+        # same as comparing all pairs
+        distances = np.hypot(coords[:, 0][:, None] - coords[:, 0], coords[:, 1][:, None] - coords[:, 1])
+        np.fill_diagonal(distances, np.inf)
+        expected = dict((int(ids[i]), ids[np.flatnonzero(distances[i] <= 2.5)].tolist()) for i in range(len(ids))
+                        if np.any(distances[i] <= 2.5))
+        self.assertEqual(list(snapped_nodes.items()), list(expected.items()))
+        self.assertEqual(spatialHash.snap_neighbours([1, 2], [0, 10], [0, 0], 1), {})
+
+    def test_common_vertices(self):
+        # a cross sharing its middle vertex, a line ending on the cross and a closed ring
+        polylines = [[(0, 0), (1, 0), (2, 0)],
+                     [(1, -1), (1, 0), (1, 1)],
+                     [(2, 0), (3, 0)],
+                     [(5, 5), (6, 5), (6, 6), (5, 5)]]
+        self.assertEqual(spatialHash.common_vertices(polylines), [[1], [1], [], [0]])
+
+    def test_coordinate_keys(self):
+        grid = spatialHash.coordinate_grid(3, -100.0, 500000.0, 100.0, 6000000.0)
+        # the same key within the precision, different keys a grid spacing away
+        self.assertEqual(spatialHash.coordinate_key(grid, 1.0, 500000.0),
+                         spatialHash.coordinate_key(grid, 1.0 + 1e-9, 500000.0 - 1e-9))
+        self.assertNotEqual(spatialHash.coordinate_key(grid, 1.0, 500000.0),
+                            spatialHash.coordinate_key(grid, 1.001, 500000.0))
+        self.assertNotEqual(spatialHash.coordinate_key(grid, 1.0, 500000.0),
+                            spatialHash.coordinate_key(grid, 1.0, 500000.001))
+        xs, ys = [-100.0, 0.0, 100.0], [6000000.0, 500000.0, 1234567.891]
+        self.assertEqual(spatialHash.coordinate_keys(grid, xs, ys).tolist(),
+                         [spatialHash.coordinate_key(grid, x, y) for x, y in zip(xs, ys)])
+        self.assertRaises(ValueError, spatialHash.coordinate_grid, 9, 0.0, 0.0, 1e7, 1e7)
+
+    def test_common_vertices_grid(self):
+        # the vertex of the cross differs by less than the precision
+        polylines = [[(0, 0), (1, 0), (2, 0)],
+                     [(1, -1), (1 + 1e-9, 0), (1, 1)]]
+        self.assertEqual(spatialHash.common_vertices(polylines), [[], []])
+        grid = spatialHash.coordinate_grid(6, 0, -1, 2, 1)
+        self.assertEqual(spatialHash.common_vertices(polylines, grid), [[1], [1]])
+
+    def test_geometry_fingerprint(self):
+        line = [(0, 0), (1, 0), (1, 1)]
+        fingerprint = spatialHash.geometry_fingerprint([line])
+        self.assertEqual(spatialHash.geometry_fingerprint([line[::-1]]), fingerprint)
+        self.assertEqual(spatialHash.geometry_fingerprint([[(-0.0, 0), (1, 0), (1, 1)]]), fingerprint)
+        self.assertNotEqual(spatialHash.geometry_fingerprint([[(0, 0), (0, 1), (1, 1)]]), fingerprint)
+        self.assertNotEqual(spatialHash.geometry_fingerprint([line[:2], line[1:]]), fingerprint)
+        # a closed ring and its reverse, and vertices within the spacing
+        ring = [(0, 0), (1, 0), (1, 1), (0, 0)]
+        self.assertEqual(spatialHash.geometry_fingerprint([ring[::-1]]), spatialHash.geometry_fingerprint([ring]))
+        self.assertEqual(spatialHash.geometry_fingerprint([[(0, 1e-9), (1, 0), (1, 1)]], 0.001),
+                         spatialHash.geometry_fingerprint([line], 0.001))
+
+    def test_scan_polylines(self):
+        polylines = [[(0, 0), (1, 0), (2, 0)],  # crossed in the middle by the next one
+                     [(1, -1), (1, 0), (1, 1)],
+                     [(1, 1), (1, 0)],  # overlaps the top half of the previous one
+                     [(5, 5), (6, 5)],  # orphan
+                     [(6, 5), (5, 5)],  # duplicate of the orphan
+                     [(2.5, 0), (3, 0)]]  # orphan, unsnapped from (2, 0)
+        errors = sorted(networkScan.scan_polylines(polylines, 0.6))
+        self.assertEqual([error for error in errors if error[2] == 'broken'], [(1.0, 0.0, 'broken')] * 2)
+        self.assertEqual(sorted(error[:2] for error in errors if error[2] == 'overlap'), [(1.0, 0.0), (1.0, 1.0)])
+        self.assertEqual(sorted(error[:2] for error in errors if error[2] == 'duplicate'), [(5.0, 5.0), (6.0, 5.0)])
+        self.assertEqual(sorted(error[:2] for error in errors if error[2] == 'orphan'),
+                         [(2.5, 0.0), (3.0, 0.0), (5.0, 5.0), (6.0, 5.0)])
+        self.assertEqual(sorted(error[:2] for error in errors if error[2] == 'snapped'),
+                         [(2.0, 0.0), (2.5, 0.0), (3.0, 0.0)])
+        self.assertEqual(networkScan.scan_polylines([], 1), [])
+
+    def test_point_store(self):
+        store = pointStore.PointStore(capacity=1)
+        self.assertTrue(store.add(0.0, 0.0, 'broken', 3))
+        # the same location is recorded once per type
+        self.assertFalse(store.add(-0.0, 0.0, 'broken', 4))
+        self.assertTrue(store.add(0.0, 0.0, 'orphan', 4))
+        store.add_many([1.0, 2.0, 1.0], [1.0, 2.0, 1.0], 'unlink')
+        self.assertEqual(len(store), 4)
+        self.assertEqual(list(store.rows()), [(0.0, 0.0, 'broken', 3), (0.0, 0.0, 'orphan', 4),
+                                              (1.0, 1.0, 'unlink', -1), (2.0, 2.0, 'unlink', -1)])
+        self.assertEqual(store.type_counts(), {'broken': 1, 'orphan': 1, 'unlink': 2})
+        restored = pointStore.PointStore.from_state(store.state())
+        self.assertEqual(list(restored.rows()), list(store.rows()))
+        self.assertFalse(restored.add(2.0, 2.0, 'unlink'))
+        self.assertEqual(list(pointStore.PointStore.from_state(pointStore.PointStore().state()).rows()), [])
+
+    def test_vertex_sources(self):
+        edges = [[(0, 0), (1, 0), (2, 0)], [(2, 0), (3, 0)], [(1.5, 5), (1, 1)], [(9, 9), (8, 8)]]
+        sources = [[(0, 0), (1, 0), (2, 0), (3, 0)], [(2, 0), (2, 5)], [(1, 5), (1, 1), (1, 0)]]
+        # edge 1 shares two vertices with source 0 and one with source 1, edge 2 was snapped at one end
+        self.assertEqual(spatialHash.vertex_sources(edges, sources), [[0], [0], [2], []])
+
+    def test_crossings(self):
+        polylines = [[(0, 0), (4, 4)],  # crosses 2 and touches 3 with its end
+                     [(0, 4), (2, 2)],  # ends on 1 - not a crossing, crosses 3
+                     [(0, 3), (4, 3)],
+                     [(4, 4), (6, 4), (6, 0)],
+                     [(5, 5), (6, 4), (7, 5)],  # shares a vertex with 4 - not a crossing
+                     [(5, 3), (7, 3), (8, 2)]]  # crosses 4 between its vertices
+        xs, ys, edges1, edges2 = segmentCrossings.crossings([10, 20, 30, 40, 50, 60], polylines)
+        self.assertEqual(list(zip(xs.tolist(), ys.tolist(), edges1.tolist(), edges2.tolist())),
+                         [(3.0, 3.0, 10, 30), (1.0, 3.0, 20, 30), (6.0, 3.0, 40, 60)])
+
+    def test_candidate_pairs_long_segment(self):
+        # tiny segments would make a grid of 1e12 cells across the long one without a bound on the cell size
+        tiny = [(x, 0.5, x + 1e-6, 0.5 + 1e-6) for x in np.linspace(0, 1000, 1000)]
+        segments = np.array(tiny + [(0, 0, 1000, 1)], dtype=np.float64)
+        pairs = np.concatenate(list(segmentCrossings.candidate_pairs(segments)))
+        self.assertIn([500, 1000], pairs.tolist())
+
+    def test_candidate_pairs_batches(self):
+        # small batches give every pair once, as one batch does
+        segments = np.array([(0, 0, 3, 3), (0, 3, 3, 0), (1, 0, 1, 3), (0, 1, 3, 1), (2, 2, 2.5, 2.5)],
+                            dtype=np.float64)
+        whole = np.concatenate(list(segmentCrossings.candidate_pairs(segments, cell_size=1.0)))
+        batched = np.concatenate(list(segmentCrossings.candidate_pairs(segments, cell_size=1.0, max_pairs=2)))
+        self.assertEqual(len(np.unique(whole, axis=0)), len(whole))
+        self.assertEqual(sorted(batched.tolist()), sorted(whole.tolist()))
+        self.assertEqual(len(whole), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2020-08-01
+# copyright            : (C) 2020 by Petros Koutsolampros / Space Syntax Ltd.
+# author               : Petros Koutsolampros
+# email                : p.koutsolampros@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import math
+import unittest
+
+from esstoolkit.utilities import run_estimator
+
+
+class TestRunEstimator(unittest.TestCase):
+
+    def test_estimate(self):
+        sample = {'features': 1000, 'mean_vertices': 5, 'density': 0.001, 'snap': 10}
+        calibration = {'cleaner': {'load': {'seconds': {'features': 0.001}, 'memory_mb': {'base': 100}},
+                                   'snap': {'seconds': {'neighbours': 0.01}, 'memory_mb': {'vertices': 0.01}}}}
+        estimate = run_estimator.estimate('cleaner', sample, {'snap': 10}, calibration)
+        self.assertEqual([stage for stage, seconds, memory_mb in estimate], ['load', 'snap'])
+        self.assertAlmostEqual(estimate[0][1], 1)
+        self.assertAlmostEqual(estimate[1][1], 1000 * 0.001 * math.pi * 100 * 0.01)
+        self.assertAlmostEqual(estimate[1][2], 50)
+        self.assertEqual(len(run_estimator.estimate('cleaner', sample, {'snap': 0}, calibration)), 1)
+        # stages without coefficients are not estimated, an uncalibrated tool has no estimate
+        self.assertEqual(run_estimator.estimate('segmenter', sample, calibration=calibration), [])
+
+    def test_fit_calibration(self):
+        reports = [{'sample': {'features': n, 'mean_vertices': v, 'density': 0, 'snap': 0},
+                    'stages': [{'stage': 'load', 'seconds': 0.002 * n + 0.0001 * n * v,
+                                'process_peak_memory_mb': 200 + 0.01 * n}]} for n, v in
+                   ((100, 2), (1000, 3), (5000, 10), (20000, 4))]
+        calibration = run_estimator.fit_calibration(reports, {'cleaner': {}})
+        self.assertAlmostEqual(calibration['cleaner']['load']['seconds']['features'], 0.002)
+        self.assertAlmostEqual(calibration['cleaner']['load']['seconds']['vertices'], 0.0001)
+        self.assertAlmostEqual(calibration['cleaner']['load']['memory_mb']['base'], 200)
+        segmenter_reports = [dict(report, tool='segmenter') for report in reports]
+        calibration = run_estimator.fit_calibration(segmenter_reports, {'cleaner': {}})
+        self.assertEqual(calibration['cleaner'], {})
+        self.assertAlmostEqual(calibration['segmenter']['load']['seconds']['features'], 0.002)
+
+
+if __name__ == '__main__':
+    unittest.main()
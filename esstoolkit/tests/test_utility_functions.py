@@ -114,6 +114,12 @@ class TestUtilityFunctions(unittest.TestCase):
         self.assertAlmostEqual(uf.calcPvalue([0, 5, 10], [10, 5, 0]), -1)
         self.assertAlmostEqual(uf.calcPvalue([2.044, -2.709, 0.192, 0.695], [-0.473, -0.578, 0.222, -0.686]), 0.1011293)
 
+    def test_peakMemoryMB(self):
+        peak = uf.peakMemoryMB()
+        if peak is not None:
+            self.assertGreater(peak, 1)
+            self.assertLessEqual(peak, uf.peakMemoryMB())
+
 
 if __name__ == '__main__':
     unittest.main()
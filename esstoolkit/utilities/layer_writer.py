@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2014-04-01
+# copyright            : (C) 2015, UCL
+# author               : Jorge Gil, Petros Koutsolampros
+# email                : jorge.gil@ucl.ac.uk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Streaming output of features to memory, shapefile and PostGIS layers
+"""
+
+from __future__ import print_function
+
+import binascii
+import io
+import itertools
+import ntpath
+import struct
+
+import psycopg2
+from psycopg2.extensions import AsIs
+from qgis.core import (QgsVectorLayer, QgsFields, QgsVectorFileWriter, QgsCoordinateTransformContext, QgsWkbTypes,
+                       NULL)
+from qgis.PyQt.QtCore import QByteArray, QDate, QDateTime, QTime, Qt
+
+# features are written in batches, never all at once
+batch_size = 10000
+
+wkb_srid_flag = 0x20000000
+
+
+def batches(features, size=batch_size):
+    features = iter(features)
+    while True:
+        batch = list(itertools.islice(features, size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+# hex EWKB (wkb with the srid), loaded by PostGIS without parsing text
+def ewkb_hex(geometry, srid):
+    wkb = bytes(geometry.asWkb())
+    byte_order = '<' if wkb[0:1] == b'\x01' else '>'
+    wkb_type = struct.unpack(byte_order + 'I', wkb[1:5])[0]
+    ewkb = wkb[0:1] + struct.pack(byte_order + 'II', wkb_type | wkb_srid_flag, srid) + wkb[5:]
+    return binascii.hexlify(ewkb).decode('ascii')
+
+
+# value in the text format of COPY
+def copy_value(value):
+    if value is None or value == NULL:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        return '\\N' if value.isNull() else value.toString(Qt.ISODate)
+    if isinstance(value, (QByteArray, bytes, bytearray)):
+        # bytea in the hex format, its backslash escaped for COPY
+        return '\\\\x' + binascii.hexlify(bytes(value)).decode('ascii')
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_rows(features, srid):
+    rows = io.StringIO()
+    for feature in features:
+        values = [copy_value(attr) for attr in feature.attributes()]
+        if feature.hasGeometry():
+            values.append(ewkb_hex(feature.geometry(), srid))
+        else:
+            values.append('\\N')
+        rows.write('\t'.join(values) + '\n')
+    rows.seek(0)
+    return rows
+
+
+# features: any iterable of features, consumed once
+# fields: the output fields, the fields of the first feature if None
+# geom_type allowed: 'Point', 'Linestring', 'Polygon'
+# path: file path for shapefiles, (connstring, schema, table name) for PostGIS
+# primary_key: name of a serial primary key column added to PostGIS tables
+def write_features(features, fields, crs, encoding, geom_type, layer_type, path, primary_key=None):
+    features = iter(features)
+    first_feat = next(features, None)
+    if first_feat is not None:
+        features = itertools.chain([first_feat], features)
+    if fields is None:
+        fields = first_feat.fields() if first_feat is not None else QgsFields()
+    layer = None
+    if layer_type == 'memory':
+        layer = QgsVectorLayer(geom_type + '?crs=' + crs.authid(), path, "memory")
+        pr = layer.dataProvider()
+        pr.addAttributes(fields.toList())
+        layer.updateFields()
+        for batch in batches(features):
+            pr.addFeatures(batch)
+        layer.updateExtents()
+
+    elif layer_type == 'shapefile':
+
+        wkbTypes = {'Point': QgsWkbTypes.Point, 'Linestring': QgsWkbTypes.LineString, 'Polygon': QgsWkbTypes.Polygon}
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "ESRI Shapefile"
+        options.fileEncoding = encoding
+        file_writer = QgsVectorFileWriter.create(path, fields, wkbTypes[geom_type], crs,
+                                                 QgsCoordinateTransformContext(), options)
+        if file_writer.hasError() != QgsVectorFileWriter.NoError:
+            print("Error when creating shapefile: ", file_writer.errorMessage())
+        for batch in batches(features):
+            file_writer.addFeatures(batch)
+        # delete the writer to flush features to disk
+        del file_writer
+        layer = QgsVectorLayer(path, ntpath.basename(path)[:-4], "ogr")
+
+    elif layer_type == 'postgis':
+
+        connstring, schema_name, table_name = path
+        uri = connstring + """ type=""" + geom_type + """ table=\"""" + schema_name + """\".\"""" + table_name + """\" (geom) """
+        crs_id = crs.postgisSrid()
+        try:
+            con = psycopg2.connect(connstring)
+            cur = con.cursor()
+            create_query = cur.mogrify(
+                """DROP TABLE IF EXISTS "%s"."%s"; CREATE TABLE "%s"."%s"( geom geometry(%s, %s))""", (
+                    AsIs(schema_name), AsIs(table_name), AsIs(schema_name), AsIs(table_name), geom_type, AsIs(crs_id)))
+            cur.execute(create_query)
+            post_q_flds = {2: 'bigint', 6: 'numeric', 1: 'bool', 'else': 'text', 4: 'numeric'}
+            for f in fields:
+                f_type = f.type()
+                if f_type not in [2, 6, 1]:
+                    f_type = 'else'
+                attr_query = cur.mogrify("""ALTER TABLE "%s"."%s" ADD COLUMN "%s" %s""", (
+                    AsIs(schema_name), AsIs(table_name), AsIs(f.name()), AsIs(post_q_flds[f_type])))
+                cur.execute(attr_query)
+            field_names = ",".join(['"' + f.name() + '"' for f in fields] + ['geom'])
+            copy_query = """COPY "%s"."%s" (%s) FROM STDIN""" % (schema_name, table_name, field_names)
+            for batch in batches(features):
+                cur.copy_expert(copy_query, copy_rows(batch, crs_id))
+            if primary_key:
+                pkey_query = cur.mogrify(
+                    """ALTER TABLE "%s"."%s" DROP COLUMN IF EXISTS %s; ALTER TABLE "%s"."%s" ADD COLUMN %s serial PRIMARY KEY NOT NULL;""",
+                    (AsIs(schema_name), AsIs(table_name), AsIs(primary_key), AsIs(schema_name), AsIs(table_name),
+                     AsIs(primary_key)))
+                cur.execute(pkey_query)
+            con.commit()
+            con.close()
+            layer = QgsVectorLayer(uri, table_name, 'postgres')
+        except psycopg2.DatabaseError as e:
+            print(e)
+    return layer
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2014-04-01
+# copyright            : (C) 2015, UCL
+# author               : Jorge Gil, Petros Koutsolampros
+# email                : jorge.gil@ucl.ac.uk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Worker processes of the tools, started with spawn as fork is not safe with the Qt threads of QGIS
+"""
+
+from __future__ import absolute_import
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from qgis.core import QgsApplication
+
+qgs = None
+
+
+def process_count():
+    return max(multiprocessing.cpu_count() - 1, 1)
+
+
+def python_executable():
+    # inside QGIS sys.executable can be the QGIS binary instead of the python interpreter
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    for folder in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+        for name in ('pythonw.exe', 'python.exe', 'python3'):
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                return path
+    return sys.executable
+
+
+def spawn_context():
+    context = multiprocessing.get_context('spawn')
+    context.set_executable(python_executable())
+    return context
+
+
+def process_pool(processes):
+    # processes with QGIS started
+    return ProcessPoolExecutor(processes, mp_context=spawn_context(), initializer=init_process,
+                               initargs=(QgsApplication.prefixPath(),))
+
+
+def init_process(prefix_path):
+    global qgs
+    QgsApplication.setPrefixPath(prefix_path, True)
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2014-04-01
+# copyright            : (C) 2015, UCL
+# author               : Jorge Gil, Petros Koutsolampros
+# email                : jorge.gil@ucl.ac.uk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Estimates of the run time and peak memory of the road network cleaner and the network segmenter
+
+The layer is sampled (feature count, mean vertex count, endpoint density) and every stage is estimated with
+a linear model of the sample. No coefficients ship with the plugin: the calibration of a machine, in the QGIS
+settings directory, is fitted by scripts/estimator_benchmark.py or from the profiling reports of its cleaner runs:
+
+    python -m esstoolkit.utilities.run_estimator <qgis settings dir>/esstoolkit/rcl_cleaner/reports/*.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+from qgis.core import QgsApplication, QgsFeatureRequest
+
+# terms of the linear models
+seconds_terms = ('features', 'vertices', 'neighbours')
+memory_terms = ('base', 'features', 'vertices')
+
+# stages that run for the settings of a cleaning
+cleaner_stages = (('load', None), ('break', 'break'), ('clean', None), ('fix_unlinks', 'fix_unlinks'),
+                  ('snap', 'snap'), ('snap_clean', 'snap'), ('merge', 'merge'), ('final_clean', None),
+                  ('unlinks', 'unlinks'), ('write', None))
+
+
+def user_calibration_path():
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'esstoolkit', 'estimator_calibration.json')
+
+
+# the calibration of the machine, without coefficients if it has not been fitted
+def load_calibration(path=None):
+    path = path or user_calibration_path()
+    if not os.path.isfile(path):
+        return {'cleaner': {}, 'segmenter': {}, 'runs': 0}
+    with open(path) as calibration_file:
+        return json.load(calibration_file)
+
+
+def sample_layer(layer, snap_threshold=0, sample_size=1000):
+    request = QgsFeatureRequest().setLimit(sample_size).setNoAttributes()
+    vertex_counts = [f.geometry().constGet().nCoordinates() for f in layer.getFeatures(request) if
+                     f.hasGeometry()]
+    extent = layer.extent()
+    feature_count = max(layer.featureCount(), 0)
+    return {'features': feature_count,
+            'mean_vertices': float(np.mean(vertex_counts)) if len(vertex_counts) > 0 else 0.0,
+            # endpoints per square map unit
+            'density': 2.0 * feature_count / max(extent.width() * extent.height(), 1e-9),
+            'snap': snap_threshold}
+
+
+def model_terms(sample):
+    features = float(sample['features'])
+    return {'base': 1.0,
+            'features': features,
+            'vertices': features * sample['mean_vertices'],
+            # endpoints within the snap threshold of every endpoint, if they were spread evenly
+            'neighbours': features * min(sample['density'] * math.pi * sample['snap'] ** 2, features)}
+
+
+def stage_estimate(coefficients, terms):
+    seconds = sum(coefficients['seconds'].get(term, 0) * terms[term] for term in seconds_terms)
+    memory_mb = sum(coefficients['memory_mb'].get(term, 0) * terms[term] for term in memory_terms)
+    return seconds, memory_mb
+
+
+def cleaner_stage_names(settings):
+    names = []
+    for stage, setting in cleaner_stages:
+        if setting is None or settings.get(setting):
+            names.append(stage)
+    return names
+
+
+# returns [(stage, seconds, memory_mb)]
+def estimate(tool, sample, settings=None, calibration=None):
+    calibration = calibration or load_calibration()
+    terms = model_terms(sample)
+    coefficients = calibration.get(tool, {})
+    if tool == 'cleaner':
+        stages = cleaner_stage_names(settings or {})
+    else:
+        stages = list(coefficients.keys())
+    stages_estimate = []
+    for stage in [stage for stage in stages if stage in coefficients]:
+        seconds, memory_mb = stage_estimate(coefficients[stage], terms)
+        stages_estimate.append((stage, seconds, memory_mb))
+    return stages_estimate
+
+
+# CALIBRATION -----------------------------------------------------------------
+
+# least squares fit of the stage models to profiling reports (cleaning_report.CleaningReport, or reports of the same
+# form with a 'tool' for the other tools), stages with fewer runs than terms keep their previous coefficients,
+# negative coefficients are set to 0
+def fit_calibration(reports, calibration):
+    rows = {}
+    for report in reports:
+        if report.get('sample') is None:
+            continue
+        terms = model_terms(report['sample'])
+        for stage in report['stages']:
+            rows.setdefault((report.get('tool', 'cleaner'), stage['stage']), []).append(
+                (terms, stage['seconds'], stage['process_peak_memory_mb']))
+
+    for (tool, stage), stage_rows in list(rows.items()):
+        coefficients = calibration.setdefault(tool, {}).setdefault(stage, {'seconds': {}, 'memory_mb': {}})
+        for target, terms_names, column in (('seconds', seconds_terms, 1), ('memory_mb', memory_terms, 2)):
+            stage_rows_known = [row for row in stage_rows if row[column] is not None]
+            if len(stage_rows_known) < len(terms_names):
+                continue
+            a = np.array([[row[0][term] for term in terms_names] for row in stage_rows_known], dtype=np.float64)
+            b = np.array([row[column] for row in stage_rows_known], dtype=np.float64)
+            fitted = np.linalg.lstsq(a, b, rcond=None)[0]
+            coefficients[target] = dict(zip(terms_names, np.maximum(fitted, 0).tolist()))
+    return calibration
+
+
+def save_calibration(calibration, path):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as calibration_file:
+        json.dump(calibration, calibration_file, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Refit the run estimates from profiling reports')
+    parser.add_argument('reports', nargs='+', help='profiling reports (json)')
+    parser.add_argument('--output', help='calibration file, by default the user calibration of QGIS')
+    args = parser.parse_args(argv)
+    reports = []
+    for path in args.reports:
+        with open(path) as report_file:
+            reports.append(json.load(report_file))
+    # refitted from the current calibration of the machine
+    calibration = fit_calibration(reports, load_calibration())
+    calibration['runs'] = calibration.get('runs', 0) + len(reports)
+    path = args.output or user_calibration_path()
+    save_calibration(calibration, path)
+    print('calibrated from %s reports, saved to %s' % (len(reports), path))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
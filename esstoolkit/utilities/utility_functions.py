@@ -16,11 +16,17 @@
 from __future__ import print_function
 
 import math
+import sys
 from builtins import range
 from builtins import str
 
 import numpy as np
 
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
 
 # ------------------------------
 # General functions
@@ -197,3 +203,14 @@ def overrides(interface_class):
         return method
 
     return overrider
+
+
+# peak resident memory of the process in MB, None where it is not available (windows)
+def peakMemoryMB():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    if sys.platform == 'darwin':
+        return peak / (1024.0 * 1024.0)
+    return peak / 1024.0
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Space Syntax Toolkit
+# Set of tools for essential space syntax network analysis and results exploration
+# -------------------
+# begin                : 2016-11-10
+# copyright            : (C) 2016 by Space Syntax Ltd
+# author               : Ioanna Kolovou
+# email                : i.kolovou@spacesyntax.com
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+""" Benchmark of the road network cleaner and network segmenter, fitting the run estimates of a machine
+
+Generates grid networks of growing sizes, with jittered vertices, endpoints off the junctions, overlaps and
+dangles, runs the cleaner and the segmenter on each of them with batch_runner (every run in its own process) and
+fits the run_estimator calibration to the runs. The calibration is saved to the QGIS settings directory, or to
+--output, and the reports of the runs to --reports. Nothing is written to the plugin directory:
+
+    python scripts/estimator_benchmark.py --sizes 1000 4000 16000 64000 --repeats 2 --reports benchmark.json
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# the plugin package is next to the scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qgis.core import (Qgis, QgsCoordinateReferenceSystem, QgsFeature, QgsField, QgsFields, QgsGeometry,
+                       QgsPointXY, QgsProject)
+from qgis.PyQt.QtCore import QVariant
+
+from esstoolkit import batch_runner
+from esstoolkit.utilities import layer_writer
+from esstoolkit.utilities import run_estimator
+from esstoolkit.utilities.process_helpers import process_count
+
+block_size = 100.0
+snap = 10
+
+
+# polyline of a block side, broken in a few jittered vertices
+def side_polyline(start, end, rand):
+    vertices = rand.randint(2, 6)
+    points = []
+    for idx in range(vertices):
+        t = float(idx) / (vertices - 1)
+        x = start[0] + t * (end[0] - start[0])
+        y = start[1] + t * (end[1] - start[1])
+        if 0 < idx < vertices - 1:
+            x, y = x + rand.uniform(-5, 5), y + rand.uniform(-5, 5)
+        points.append(QgsPointXY(x, y))
+    return points
+
+
+# lines of a grid of about the given feature count, with endpoints off the junctions (snapping), duplicated sides
+# (overlaps) and sides missing (dangles), the errors of a drawn network
+def grid_features(features, seed=0):
+    rand = random.Random(seed)
+    fields = QgsFields()
+    fields.append(QgsField('id', QVariant.Int))
+    blocks = max(int((features / 2.0) ** 0.5), 1)
+    fid = 0
+    for i in range(blocks + 1):
+        for j in range(blocks + 1):
+            for end in ((i + 1, j), (i, j + 1)):
+                if end[0] > blocks or end[1] > blocks or rand.random() < 0.05:
+                    continue
+                start_point = (i * block_size, j * block_size)
+                end_point = (end[0] * block_size, end[1] * block_size)
+                if rand.random() < 0.1:
+                    end_point = (end_point[0] + rand.uniform(-snap, snap), end_point[1] + rand.uniform(-snap, snap))
+                copies = 2 if rand.random() < 0.02 else 1
+                for _ in range(copies):
+                    feature = QgsFeature(fields)
+                    feature.setId(fid)
+                    feature.setAttributes([fid])
+                    feature.setGeometry(QgsGeometry.fromPolylineXY(side_polyline(start_point, end_point, rand)))
+                    fid += 1
+                    yield feature
+
+
+def write_network(features, path, seed=0):
+    crs = QgsCoordinateReferenceSystem('EPSG:27700')
+    layer_writer.write_features(grid_features(features, seed), None, crs, 'UTF-8', 'Linestring', 'shapefile', path)
+    return path
+
+
+def sample(path, name, snap_threshold=0):
+    layer = batch_runner.load_layer(path, name)
+    layer_sample = run_estimator.sample_layer(layer, snap_threshold)
+    QgsProject.instance().removeMapLayer(layer.id())
+    return layer_sample
+
+
+# the cleaner and segmenter reports of a network, fitted by run_estimator.fit_calibration
+def benchmark_network(features, folder, seed=0):
+    name = 'network_%s_%s' % (features, seed)
+    network_path = write_network(features, os.path.join(folder, name + '.shp'), seed)
+    cleaned_path = os.path.join(folder, name + '_cl.shp')
+    report_path = os.path.join(folder, name + '_report.json')
+    cleaner_job = {'name': name, 'tool': 'cleaner', 'input': network_path, 'output_type': 'shapefile',
+                   'settings': {'snap': snap},
+                   'output': {'cleaned': cleaned_path, 'errors': os.path.join(folder, name + '_errors.shp'),
+                              'unlinks': os.path.join(folder, name + '_unlinks.shp'), 'report': report_path}}
+    segmenter_job = {'name': name + '_seg', 'tool': 'segmenter', 'input': cleaned_path, 'unlinks': None,
+                     'output_type': 'shapefile', 'output': {'segmented': os.path.join(folder, name + '_seg.shp')}}
+
+    reports = []
+    summary = batch_runner.run_isolated(cleaner_job)
+    if summary['status'] != 'done':
+        raise RuntimeError('%s failed: %s' % (name, summary['error']))
+    with open(report_path) as report_file:
+        reports.append(dict(json.load(report_file), tool='cleaner'))
+
+    summary = batch_runner.run_isolated(segmenter_job)
+    if summary['status'] != 'done':
+        raise RuntimeError('%s failed: %s' % (segmenter_job['name'], summary['error']))
+    # the segmenter has no stages of its own, its job is one
+    reports.append({'tool': 'segmenter', 'layer': segmenter_job['name'], 'sample': sample(cleaned_path, name),
+                    'seconds': summary['seconds'],
+                    'stages': [{'stage': 'segment', 'seconds': summary['seconds'],
+                                'process_peak_memory_mb': summary['peak_memory_mb']}]})
+    return reports
+
+
+def machine():
+    return {'date': time.strftime('%Y-%m-%d'), 'platform': platform.platform(), 'processor': platform.processor(),
+            'processes': process_count(), 'python': platform.python_version(), 'qgis': Qgis.QGIS_VERSION}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the cleaner and segmenter and fit the run estimates')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 4000, 16000, 64000],
+                        help='feature counts of the networks')
+    parser.add_argument('--repeats', type=int, default=2, help='networks of every size')
+    parser.add_argument('--prefix', help='QGIS prefix path (default: $QGIS_PREFIX_PATH or /usr)')
+    parser.add_argument('--output', help='calibration file (default: the user calibration of QGIS)')
+    parser.add_argument('--reports', default='estimator_benchmark.json',
+                        help='JSON file of the run reports (default: estimator_benchmark.json)')
+    args = parser.parse_args(argv)
+
+    batch_runner.start_qgis(args.prefix)
+    folder = tempfile.mkdtemp(prefix='esstoolkit_benchmark_')
+    reports = []
+    try:
+        for features in args.sizes:
+            for seed in range(args.repeats):
+                network_reports = benchmark_network(features, folder, seed)
+                reports.extend(network_reports)
+                print('%s features, seed %s: cleaner %ss, segmenter %ss' % (
+                    features, seed, network_reports[0]['seconds'], network_reports[1]['seconds']))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    benchmark = {'machine': machine(), 'sizes': args.sizes, 'repeats': args.repeats, 'reports': reports}
+    with open(args.reports, 'w') as benchmark_file:
+        json.dump(benchmark, benchmark_file, indent=2, default=str)
+    # fitted from nothing, the stages of the benchmark are all the stages of the calibration
+    calibration = run_estimator.fit_calibration(reports, {'cleaner': {}, 'segmenter': {}})
+    calibration['runs'] = len(reports)
+    calibration['benchmark'] = benchmark['machine']
+    path = args.output or run_estimator.user_calibration_path()
+    run_estimator.save_calibration(calibration, path)
+    print('calibrated from %s runs, saved to %s' % (len(reports), path))
+    if batch_runner.qgs is not None:
+        batch_runner.qgs.exitQgis()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
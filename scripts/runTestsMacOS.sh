@@ -5,6 +5,10 @@ cd ../
 
 echo "- Utility Function tests"
 ./esstoolkit/tests/runtest_macos.sh esstoolkit.tests.test_utility_functions
+echo "- Layer Writer tests"
+./esstoolkit/tests/runtest_macos.sh esstoolkit.tests.test_layer_writer
+echo "- Run Estimator tests"
+./esstoolkit/tests/runtest_macos.sh esstoolkit.tests.test_run_estimator
 echo "- Gate Transformer tests"
 ./esstoolkit/tests/runtest_macos.sh esstoolkit.tests.test_gate_transformer
 echo "- Network Segmenter tests"